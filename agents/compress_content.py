@@ -0,0 +1,175 @@
+import os
+import sys
+import time
+import argparse
+import statistics
+
+# Add the parent directory to the sys.path to ensure lib can be imported
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from lib import text_codec
+from lib.text_codec import compress_text, decompress_text
+from concurrent_hn_topnews_fetch import create_search_index, get_database_name
+
+# Rows compressed per UPDATE batch during a migration
+BATCH_SIZE = 500
+
+
+def connect(db_name):
+    """Connect to a stories database with the text_codec SQL functions registered."""
+    return text_codec.connect(db_name)
+
+
+def migrate(db_name, include_summary=False):
+    """
+    Compress the plain-text content (and optionally summaries) of an existing database.
+
+    The full-text index is switched to the decompressing view first, so
+    the update triggers keep it in sync while rows are rewritten. The
+    database is VACUUMed afterwards to give the space back.
+
+    Parameters:
+        db_name (str): Path of the database.
+        include_summary (bool): Compress summaries as well.
+    """
+    conn = connect(db_name)
+    cursor = conn.cursor()
+    create_search_index(cursor)
+    conn.commit()
+
+    columns = ["content", "summary"] if include_summary else ["content"]
+    before = os.path.getsize(db_name)
+    for column in columns:
+        cursor.execute(f"SELECT id, {column} FROM stories WHERE typeof({column}) = 'text'")
+        rows = cursor.fetchall()
+        for start in range(0, len(rows), BATCH_SIZE):
+            batch = rows[start:start + BATCH_SIZE]
+            cursor.executemany(
+                f"UPDATE stories SET {column} = ? WHERE id = ?",
+                [(compress_text(text), story_id) for story_id, text in batch],
+            )
+            conn.commit()
+        print(f"{column}: {len(rows)} rows compressed")
+
+    cursor.execute("VACUUM")
+    conn.close()
+    after = os.path.getsize(db_name)
+    print(f"Database size: {before / 1e6:.1f} MB -> {after / 1e6:.1f} MB")
+
+
+def train_dictionary(db_name, size=112640, samples=5000):
+    """
+    Train a zstd dictionary on the article text of a database and make it current.
+
+    New rows are compressed with it. It is also saved as <dict_id>.zdict so
+    rows compressed with it stay readable after a newer one is trained.
+
+    Parameters:
+        db_name (str): Path of the database to sample.
+        size (int): Dictionary size in bytes.
+        samples (int): Maximum number of articles to train on.
+    """
+    if text_codec.zstandard is None:
+        print("zstandard is not installed, dictionaries need zstd.")
+        return
+
+    conn = connect(db_name)
+    cursor = conn.cursor()
+    cursor.execute(
+        "SELECT decompress_text(content) FROM stories WHERE has_content ORDER BY random() LIMIT ?",
+        (samples,),
+    )
+    texts = [row[0].encode("utf-8") for row in cursor.fetchall()]
+    conn.close()
+    if len(texts) < 10:
+        print("Not enough articles to train a dictionary.")
+        return
+
+    dictionary = text_codec.zstandard.train_dictionary(size, texts)
+    os.makedirs(text_codec.DICTIONARY_DIR, exist_ok=True)
+    data = dictionary.as_bytes()
+    with open(os.path.join(text_codec.DICTIONARY_DIR, f"{dictionary.dict_id()}.zdict"), "wb") as f:
+        f.write(data)
+    tmp_file = text_codec.CURRENT_DICTIONARY + ".tmp"
+    with open(tmp_file, "wb") as f:
+        f.write(data)
+    os.replace(tmp_file, text_codec.CURRENT_DICTIONARY)
+    print(f"Trained dictionary {dictionary.dict_id()} on {len(texts)} articles.")
+
+
+def report(db_name, samples=500):
+    """
+    Print storage size and compression/decompression latency for each codec.
+
+    Parameters:
+        db_name (str): Path of the database to sample.
+        samples (int): Number of articles to measure.
+    """
+    conn = connect(db_name)
+    cursor = conn.cursor()
+    cursor.execute(
+        """
+        SELECT count(*), sum(length(CAST(content AS BLOB))),
+            sum(typeof(content) = 'blob')
+        FROM stories WHERE content IS NOT NULL
+    """
+    )
+    rows, stored_bytes, compressed_rows = cursor.fetchone()
+    print(f"Database: {db_name} ({os.path.getsize(db_name) / 1e6:.1f} MB on disk)")
+    print(f"Content: {rows} rows, {compressed_rows or 0} compressed, {(stored_bytes or 0) / 1e6:.2f} MB stored")
+
+    cursor.execute(
+        "SELECT decompress_text(content) FROM stories WHERE has_content ORDER BY random() LIMIT ?",
+        (samples,),
+    )
+    texts = [row[0] for row in cursor.fetchall()]
+    conn.close()
+    if not texts:
+        return
+
+    raw_size = sum(len(text.encode("utf-8")) for text in texts)
+    codecs = ["zlib"] + (["zstd"] if text_codec.zstandard else [])
+    print(f"\nSample of {len(texts)} articles, {raw_size / 1e6:.2f} MB uncompressed")
+    print(f"{'codec':<10} {'ratio':>7} {'compress us':>12} {'decompress p50 us':>18} {'p95 us':>8}")
+    for codec in codecs:
+        compressed, compress_times, decompress_times = [], [], []
+        for text in texts:
+            started = time.perf_counter()
+            value = compress_text(text, codec=codec)
+            compress_times.append(time.perf_counter() - started)
+            compressed.append(value)
+        for value in compressed:
+            started = time.perf_counter()
+            decompress_text(value)
+            decompress_times.append(time.perf_counter() - started)
+
+        stored = sum(len(value) if isinstance(value, bytes) else len(value.encode("utf-8")) for value in compressed)
+        decompress_us = sorted(t * 1e6 for t in decompress_times)
+        print(
+            f"{codec:<10} {raw_size / stored:>7.2f} {statistics.mean(compress_times) * 1e6:>12.0f} "
+            f"{decompress_us[len(decompress_us) // 2]:>18.0f} {decompress_us[int(len(decompress_us) * 0.95)]:>8.0f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compress stored article text and report on it.")
+    parser.add_argument("command", choices=["migrate", "train-dict", "report"])
+    parser.add_argument("--db", default=None, help="Database path, defaults to today's")
+    parser.add_argument("--summary", action="store_true", help="Also compress summaries (migrate)")
+    args = parser.parse_args()
+
+    db_name = args.db or get_database_name()
+    if not os.path.exists(db_name):
+        print(f"Database {db_name} does not exist.")
+        return
+
+    if args.command == "migrate":
+        migrate(db_name, include_summary=args.summary)
+    elif args.command == "train-dict":
+        train_dictionary(db_name)
+    else:
+        report(db_name)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,5 @@
-import sqlite3
 import os
+import time
 import logging
 from datetime import datetime
 from tqdm import tqdm
@@ -10,6 +10,23 @@ import sys
 # Add the parent directory to the sys.path to ensure lib can be imported
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
+from lib.near_duplicate import SignatureIndex, content_signature
+from lib.relevance import relevance_vector
+from lib.run_ledger import RunLedger
+from lib.snapshot import publish_snapshot
+from lib import text_codec
+from lib.text_codec import compress_text, decompress_text, COMPRESS_SUMMARY
+
+# Ollama server and model, point the URL at benchmarks/ollama_stub.py to run without a model
+OLLAMA_URL = os.environ.get("BN_OLLAMA_URL", "http://localhost:11434")
+OLLAMA_MODEL = os.environ.get("BN_OLLAMA_MODEL", "llama3.2")
+
+# Concurrent summary requests sent to Ollama
+SUMMARY_WORKERS = int(os.environ.get("BN_SUMMARY_WORKERS", 10))
+
+# Counts and stage timings of the current run, stored in the runs ledger
+run_ledger = RunLedger("summary")
+
 def get_database_name():
     """
     Generate the database name based on the current date.
@@ -31,8 +48,8 @@ def connect_to_database(db_name):
     Returns:
         sqlite3.Connection: The database connection object.
     """
-    conn = sqlite3.connect(db_name, check_same_thread=False)
-    return conn
+    # The full-text index triggers decompress text through SQL functions
+    return text_codec.connect(db_name, check_same_thread=False)
 
 
 def get_stories_without_summary(conn):
@@ -43,16 +60,133 @@ def get_stories_without_summary(conn):
         conn (sqlite3.Connection): The database connection.
 
     Returns:
-        list of tuples: Each tuple contains (story_id, content).
+        list of tuples: Each tuple contains (story_id, content), content possibly
+        still compressed (see lib.text_codec).
     """
-    cursor = conn.cursor()
-    cursor.execute(
-        "SELECT id, content FROM stories WHERE content IS NOT NULL AND length(trim(content)) > 0  AND summary IS NULL"
-    )
-    stories = cursor.fetchall()
+    with run_ledger.stage("db"):
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT id, content FROM stories WHERE has_content AND summary IS NULL"
+        )
+        stories = cursor.fetchall()
     return stories
 
 
+def add_missing_columns(conn):
+    """
+    Add the columns this agent reads or writes to a database the fetch agent has not migrated yet.
+
+    Parameters:
+        conn (sqlite3.Connection): The database connection.
+    """
+    columns = [column[1] for column in conn.execute("PRAGMA table_info(stories)")]
+    # Stories waiting for a summary are selected by 'has_content', filled in as the fetch agent does
+    if "has_content" not in columns:
+        conn.execute("ALTER TABLE stories ADD COLUMN has_content INTEGER DEFAULT 0")
+        conn.execute("UPDATE stories SET has_content = (content IS NOT NULL AND length(trim(content)) > 0)")
+    for column in ("content_signature", "relevance_vector"):
+        if column not in columns:
+            conn.execute(f"ALTER TABLE stories ADD COLUMN {column} BLOB")
+    conn.commit()
+
+
+def backfill_signatures(conn):
+    """
+    Compute the content signatures missing for stories stored before they existed.
+
+    Articles too short for a signature get an empty one, so they are not
+    decompressed again on every run.
+
+    Parameters:
+        conn (sqlite3.Connection): The database connection.
+    """
+    rows = conn.execute(
+        "SELECT id, content FROM stories WHERE has_content AND content_signature IS NULL"
+    ).fetchall()
+    if not rows:
+        return
+    with run_ledger.stage("dedup"):
+        signatures = [(content_signature(decompress_text(content)) or b"", story_id) for story_id, content in rows]
+        conn.executemany("UPDATE stories SET content_signature = ? WHERE id = ?", signatures)
+        conn.commit()
+
+
+def find_duplicate_sources(conn, stories):
+    """
+    Find the stories whose article is a near-duplicate of an earlier story's.
+
+    Syndicated articles and mirrors share their text across domains, they
+    get the summary of the earliest story with the same article instead of
+    one of their own.
+
+    Parameters:
+        conn (sqlite3.Connection): The database connection.
+        stories (list): (story_id, content) of the stories without a summary.
+
+    Returns:
+        dict: Maps story IDs to the IDs of their earlier near-duplicate stories, earliest first.
+    """
+    with run_ledger.stage("dedup"):
+        rows = conn.execute(
+            "SELECT id, content_signature FROM stories WHERE length(content_signature) > 0 ORDER BY id"
+        ).fetchall()
+        signatures = dict(rows)
+        index = SignatureIndex(list(signatures), list(signatures.values()))
+        sources = {}
+        for story_id, _ in stories:
+            if story_id not in signatures:
+                continue
+            duplicates = index.find(signatures[story_id], before_id=story_id)
+            if duplicates:
+                sources[story_id] = [duplicate_id for duplicate_id, _ in duplicates]
+    return sources
+
+
+def copy_duplicate_summaries(conn, sources):
+    """
+    Give near-duplicate stories the summary of their earliest duplicate that has one.
+
+    Stories are handled in ID order, so a chain of duplicates gets the
+    summary of its first story. Stories none of whose duplicates has a
+    summary, e.g. because generating it failed, are returned so they get
+    one of their own.
+
+    Parameters:
+        conn (sqlite3.Connection): The database connection.
+        sources (dict): From find_duplicate_sources.
+
+    Returns:
+        list: IDs of the stories left without a summary.
+    """
+    uncopied = []
+    for story_id in sorted(sources):
+        try:
+            started = time.perf_counter()
+            row = None
+            for source_id in sources[story_id]:
+                row = conn.execute(
+                    "SELECT summary FROM stories WHERE id = ? AND summary IS NOT NULL", (source_id,)
+                ).fetchone()
+                if row:
+                    break
+            if not row:
+                uncopied.append(story_id)
+                continue
+            (title,) = conn.execute("SELECT title FROM stories WHERE id = ?", (story_id,)).fetchone()
+            # Copied as stored, compressed or not
+            conn.execute(
+                "UPDATE stories SET summary = ?, relevance_vector = ?, last_updated = ? WHERE id = ?",
+                (row[0], relevance_vector(title, decompress_text(row[0])), datetime.now(), story_id),
+            )
+            conn.commit()
+            run_ledger.add_time("db", time.perf_counter() - started)
+            run_ledger.count("duplicates")
+        except Exception as e:
+            run_ledger.count("failed")
+            logging.error(f"Error copying summary to story ID {story_id}: {e}")
+    return uncopied
+
+
 def generate_summary(content):
     # set python environment variable to use ollama host
     os.environ["OLAMA_HOST"] = "0.0.0.0:11434"
@@ -71,23 +205,25 @@ def generate_summary(content):
 
     try:
         # Initialize the Ollama client
-        client = ollama.Client(host='http://localhost:11434')  # Adjust initialization if required by the client
+        client = ollama.Client(host=OLLAMA_URL)
 
         # Define the prompt for summarization
         prompt = f"Summarize the following news article in a clear and concise manner, highlighting the main points, key events, and important details. Ensure the summary is reader-friendly and captures the essence of the article:\n\n{content}\n\nSummary:"
 
-        response = client.chat(
-            model="llama3.2",
-            messages=[
-                {
-                    "role": "user",
-                    "content": prompt,
-                }
-            ],
-        )
+        with run_ledger.stage("ollama"):
+            response = client.chat(
+                model=OLLAMA_MODEL,
+                messages=[
+                    {
+                        "role": "user",
+                        "content": prompt,
+                    }
+                ],
+            )
         summary = response["message"]["content"].strip()
         return summary
     except Exception as e:
+        run_ledger.count("failed")
         logging.error(f"Error generating summary: {e}")
         return None
 
@@ -96,23 +232,36 @@ def update_story_summary(conn, story_id, summary):
     """
     Update the summary of a story in the database.
 
+    The story's relevance vector is recomputed to include the summary terms.
+
     Parameters:
         conn (sqlite3.Connection): The database connection.
         story_id (int): The ID of the story.
         summary (str): The generated summary.
     """
     try:
+        started = time.perf_counter()
         cursor = conn.cursor()
+        cursor.execute("SELECT title FROM stories WHERE id = ?", (story_id,))
+        (title,) = cursor.fetchone()
         cursor.execute(
             """
             UPDATE stories
-            SET summary = ?, last_updated = ?
+            SET summary = ?, relevance_vector = ?, last_updated = ?
             WHERE id = ?
         """,
-            (summary, datetime.now(), story_id),
+            (
+                compress_text(summary) if COMPRESS_SUMMARY else summary,
+                relevance_vector(title, summary),
+                datetime.now(),
+                story_id,
+            ),
         )
         conn.commit()
+        run_ledger.add_time("db", time.perf_counter() - started)
+        run_ledger.count("fetched")
     except Exception as e:
+        run_ledger.count("failed")
         logging.error(f"Error updating summary for story ID {story_id}: {e}")
 
 
@@ -127,15 +276,75 @@ def process_story(story):
         tuple: (story_id, summary) or (story_id, None) if failed.
     """
     story_id, content = story
+    # Decompress in the worker thread, only for the story being summarized
+    with run_ledger.stage("decompress"):
+        content = decompress_text(content)
     if not content:
+        run_ledger.count("skipped")
         return (story_id, None)
     summary = generate_summary(content)
     return (story_id, summary)
 
 
+def summarize_stories(conn, stories):
+    """
+    Generate and store the summaries of stories, SUMMARY_WORKERS at a time.
+
+    Parameters:
+        conn (sqlite3.Connection): The database connection.
+        stories (list): (story_id, content) of the stories to summarize.
+    """
+    # Initialize ThreadPoolExecutor
+    with ThreadPoolExecutor(max_workers=SUMMARY_WORKERS) as executor:
+        # Submit all tasks to the executor
+        future_to_story_id = {
+            executor.submit(process_story, story): story[0] for story in stories
+        }
+
+        # Initialize progress bar
+        with tqdm(total=len(stories), desc="Generating summaries") as pbar:
+            for future in as_completed(future_to_story_id):
+                story_id = future_to_story_id[future]
+                try:
+                    result = future.result()
+                    if result:
+                        _, summary = result
+                        if summary:
+                            update_story_summary(conn, story_id, summary)
+                        else:
+                            logging.error(
+                                f"Failed to generate summary for story ID {story_id}"
+                            )
+                except Exception as e:
+                    run_ledger.count("failed")
+                    logging.error(
+                        f"Exception occurred while processing story ID {story_id}: {e}"
+                    )
+                finally:
+                    pbar.update(1)
+
+
 def main():
+    """
+    Generate the missing summaries and record the run in the runs ledger.
+
+    'fetched' in the ledger counts the summaries generated, 'duplicates' the
+    ones copied from a near-duplicate story.
+    """
+    run_ledger.start()
+    status = "error"
+    try:
+        status = generate_summaries()
+    finally:
+        run_ledger.finish(status)
+
+
+def generate_summaries():
     """
     The main function to orchestrate summary generation.
+
+    Returns:
+        str: The run status for the ledger, 'ok' or why nothing was summarized.
     """
     # Configure logging
     current_date = datetime.now().strftime("%d_%m_%Y")
@@ -152,10 +361,12 @@ def main():
     # Check if the database exists
     if not os.path.exists(db_name):
         print(f"Database {db_name} does not exist. Please fetch new news first.")
-        return
+        return "no_database"
 
     print(f"Using database: {db_name}")
     conn = connect_to_database(db_name)
+    add_missing_columns(conn)
+    run_ledger.database = os.path.basename(db_name)
 
     # Retrieve stories without summaries
     stories = get_stories_without_summary(conn)
@@ -165,42 +376,36 @@ def main():
     if total_stories == 0:
         print("No stories to process. All stories have summaries.")
         conn.close()
-        return
+        return "ok"
 
-    # Define the number of worker threads
-    max_workers = 10  # Adjust based on your system's capabilities
+    # Near-duplicates of another story's article reuse its summary
+    backfill_signatures(conn)
+    sources = find_duplicate_sources(conn, stories)
+    all_stories = stories
+    stories = [story for story in stories if story[0] not in sources]
+    if sources:
+        print(f"Near-duplicate articles reusing a summary: {len(sources)}")
 
-    # Initialize ThreadPoolExecutor
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        # Submit all tasks to the executor
-        future_to_story_id = {
-            executor.submit(process_story, story): story[0] for story in stories
-        }
+    summarize_stories(conn, stories)
 
-        # Initialize progress bar
-        with tqdm(total=total_stories, desc="Generating summaries") as pbar:
-            for future in as_completed(future_to_story_id):
-                story_id = future_to_story_id[future]
-                try:
-                    result = future.result()
-                    if result:
-                        _, summary = result
-                        if summary:
-                            update_story_summary(conn, story_id, summary)
-                        else:
-                            logging.error(
-                                f"Failed to generate summary for story ID {story_id}"
-                            )
-                except Exception as e:
-                    logging.error(
-                        f"Exception occurred while processing story ID {story_id}: {e}"
-                    )
-                finally:
-                    pbar.update(1)
+    # Duplicates whose sources all lack a summary get their own
+    uncopied = set(copy_duplicate_summaries(conn, sources))
+    if uncopied:
+        print(f"Near-duplicate articles without a summary to reuse: {len(uncopied)}")
+        summarize_stories(conn, [story for story in all_stories if story[0] in uncopied])
 
     # Close the database connection
     conn.close()
+
+    # Publish the read snapshot served by the web app
+    try:
+        with run_ledger.stage("snapshot"):
+            publish_snapshot(db_name)
+    except Exception as e:
+        print(f"Error publishing read snapshot: {e}")
+        logging.error(f"Error publishing read snapshot: {e}")
     print("Summary generation completed.")
+    return "ok"
 
 
 if __name__ == "__main__":
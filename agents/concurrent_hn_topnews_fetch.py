@@ -1,21 +1,33 @@
 import requests
 import sqlite3
+import argparse
 from datetime import datetime
-import trafilatura
 from tqdm import tqdm
 import logging
 import os
 import urllib3
-import re
 import sys
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import time
+import threading
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
 
 # Add the parent directory to the sys.path to ensure lib can be imported
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 
-# Import the Blacklist class from the lib.blacklist module
-from lib.blacklist import Blacklist
+# Import the shared Blacklist from the lib.blacklist module
+from lib.blacklist import get_blacklist
+from lib.comments import COMMENT_STORIES, COMMENT_WORKERS, create_comment_tables, refresh_thread
+from lib.domain import extract_main_domain
+from lib.extraction import TieredExtractor
+from lib.near_duplicate import content_signature
+from lib.relevance import relevance_vector
+from lib.priority import DEFAULT_PRIORITY_FILE, PriorityRules, rescore_stories
+from lib.rank_history import SCORE_SAMPLE_RANKS, RankHistory, history_path
+from lib.run_ledger import RunLedger
+from lib.snapshot import publish_snapshot
+from lib import text_codec
+from lib.text_codec import compress_text, decompress_text, check_functions
 
 
 # Suppress InsecureRequestWarning due to verify=False in requests.get
@@ -30,70 +42,106 @@ HEADERS = {
     )
 }
 
-# Initialize the Blacklist
-blacklist = Blacklist(blacklist_files=["config/blacklist.txt", "config/blacklist_urls.txt"])
+# Use the shared Blacklist
+blacklist = get_blacklist()
 
+# Counts and stage timings of the current run, stored in the runs ledger
+run_ledger = RunLedger("fetch")
 
-def load_prioritise(prioritise_file="config/priority.txt"):
+# Picks the cheapest trafilatura settings that work for each site
+extractor = TieredExtractor()
+
+# Seconds a run may take, 0 for no limit. At the deadline no new stories are
+# started and the ones not done are carried over to the next run.
+FETCH_BUDGET = float(os.environ.get("BN_FETCH_BUDGET", 0))
+
+# Seconds past the deadline to wait for stories already being processed
+STRAGGLER_GRACE = 5
+
+# Returned by process_story for a story put off because the deadline passed
+DEFERRED = "deferred"
+
+# Hacker News API, point it at a local stand-in (benchmarks/hn_standin.py) to run offline
+HN_API_URL = os.environ.get("HN_API_URL", "https://hacker-news.firebaseio.com/v0")
+
+
+def load_prioritise(prioritise_file=DEFAULT_PRIORITY_FILE):
     """
-    Load prioritization patterns from a file.
+    Load and compile the weighted priority rules from a file.
 
-    The prioritise file should have entries in the following format:
-    - Lines starting with 'regex:' are treated as regular expressions.
-    - Lines starting with 'string:' are treated as plain string matches.
-    - Lines starting with '#' are comments and are ignored.
-    - Empty lines are ignored.
+    See lib.priority.PriorityRules for the file format: 'regex:' and
+    'string:' lines, optionally scoped to the title or url and weighted.
 
     Parameters:
         prioritise_file (str): Path to the prioritise file.
 
     Returns:
-        dict: A dictionary with two keys 'regex' and 'string', containing lists of patterns.
-    """
-    prioritise_data = {"regex": [], "string": []}
-
-    if os.path.exists(prioritise_file):
-        with open(prioritise_file, "r") as f:
-            for line in f:
-                line = line.strip()
-                if line and not line.startswith("#"):  # Ignore comments and empty lines
-                    if line.startswith("regex:"):
-                        pattern = line.split("regex:", 1)[1].strip()
-                        prioritise_data["regex"].append(pattern)
-                    elif line.startswith("string:"):
-                        string_match = line.split("string:", 1)[1].strip()
-                        prioritise_data["string"].append(string_match)
-    else:
-        print(f"Prioritise file '{prioritise_file}' not found.")
-    return prioritise_data
+        PriorityRules: The compiled rules.
+    """
+    return PriorityRules(prioritise_file)
 
 
 def is_prioritised(url, title, prioritise_patterns):
     """
-    Check if the URL or title matches any prioritization patterns and assign priority.
+    Return the priority of a story, the sum of the weights of the rules it matches.
 
     Parameters:
         url (str): The URL of the story.
         title (str): The title of the story.
-        prioritise_patterns (dict): The prioritization patterns loaded from 'load_prioritise'.
+        prioritise_patterns (PriorityRules): The rules loaded by 'load_prioritise'.
 
     Returns:
-        int: Priority level (2 for high, 1 for medium, 0 for default).
+        int: Priority level, 0 for default.
     """
-    url = str(url) if url else ""
-    title = str(title) if title else ""
+    return prioritise_patterns.score(url, title)
 
-    # High Priority: Matches any regex pattern
-    for pattern in prioritise_patterns.get("regex", []):
-        if re.search(pattern, url) or re.search(pattern, title):
-            return 2  # High priority
 
-    # Medium Priority: Matches any string pattern (case-insensitive)
-    for string in prioritise_patterns.get("string", []):
-        if string.lower() in url.lower() or string.lower() in title.lower():
-            return 1  # Medium priority
+def rescore_priorities(conn, prioritise_patterns):
+    """
+    Re-score the stored stories when the priority rules changed since the last run.
 
-    return 0  # Default priority
+    Parameters:
+        conn (sqlite3.Connection): The database connection.
+        prioritise_patterns (PriorityRules): The current rules.
+
+    Returns:
+        int: Number of stories whose priority changed.
+    """
+    try:
+        with run_ledger.stage("rescore"):
+            changed = rescore_stories(conn, prioritise_patterns)
+    except sqlite3.Error as e:
+        print(f"Error re-scoring stored stories: {e}")
+        logging.error(f"Error re-scoring stored stories: {e}")
+        return 0
+    if not changed:
+        return 0
+    print(f"Priority rules changed, re-scored stored stories: {changed} changed.")
+    run_ledger.count("rescored", changed)
+    return changed
+
+
+def publish_read_snapshot():
+    """Publish the read snapshot served by the web app, logging any error."""
+    try:
+        with run_ledger.stage("snapshot"):
+            publish_snapshot(get_database_name())
+    except Exception as e:
+        print(f"Error publishing read snapshot: {e}")
+        logging.error(f"Error publishing read snapshot: {e}")
+
+
+def get_database_name():
+    """
+    Generate the database name based on the current date.
+    """
+    db_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'db'))
+
+    # Get current date in dd_mm_yyyy format
+    current_date = datetime.now().strftime("%d_%m_%Y")
+
+    # Create the database name with the current date
+    return os.path.join(db_dir, f"hackernews_{current_date}.db")
 
 
 def create_database():
@@ -108,15 +156,11 @@ def create_database():
     if not os.path.exists(db_dir):
         os.makedirs(db_dir)
 
-
-    # Get current date in dd_mm_yyyy format
-    current_date = datetime.now().strftime("%d_%m_%Y")
-
-    # Create the database name with the current date
-    db_name = os.path.join(db_dir, f"hackernews_{current_date}.db")
+    db_name = get_database_name()
 
     print(f"Database: {db_name}")
-    conn = sqlite3.connect(db_name)
+    # The search index triggers decompress text in SQL, see create_search_index
+    conn = text_codec.connect(db_name)
     cursor = conn.cursor()
 
     # Modify the table creation to include the 'summary' and 'priority' fields
@@ -130,7 +174,11 @@ def create_database():
             content TEXT,
             summary TEXT,
             priority INTEGER DEFAULT 0,
-            last_updated TIMESTAMP
+            last_updated TIMESTAMP,
+            domain TEXT,
+            has_content INTEGER DEFAULT 0,
+            content_signature BLOB,
+            relevance_vector BLOB
         )
     """)
 
@@ -144,10 +192,137 @@ def create_database():
     if "priority" not in columns:
         cursor.execute("ALTER TABLE stories ADD COLUMN priority INTEGER DEFAULT 0")
 
+    # Add 'has_content' column if it doesn't exist, listings read it instead of the content
+    if "has_content" not in columns:
+        cursor.execute("ALTER TABLE stories ADD COLUMN has_content INTEGER DEFAULT 0")
+        cursor.execute(
+            "UPDATE stories SET has_content = (content IS NOT NULL AND length(trim(content)) > 0)"
+        )
+
+    # Add 'content_signature' column if it doesn't exist, the summary agent fills it in for older stories
+    if "content_signature" not in columns:
+        cursor.execute("ALTER TABLE stories ADD COLUMN content_signature BLOB")
+
+    # Add 'relevance_vector' column if it doesn't exist and fill it in for existing stories
+    if "relevance_vector" not in columns:
+        cursor.execute("ALTER TABLE stories ADD COLUMN relevance_vector BLOB")
+        cursor.execute("SELECT id, title, summary FROM stories")
+        cursor.executemany(
+            "UPDATE stories SET relevance_vector = ? WHERE id = ?",
+            [
+                (relevance_vector(title, decompress_text(summary)), story_id)
+                for story_id, title, summary in cursor.fetchall()
+            ],
+        )
+
+    # Add 'domain' column if it doesn't exist and fill it in for existing stories
+    if "domain" not in columns:
+        cursor.execute("ALTER TABLE stories ADD COLUMN domain TEXT")
+        cursor.execute("SELECT id, url FROM stories WHERE url IS NOT NULL")
+        cursor.executemany(
+            "UPDATE stories SET domain = ? WHERE id = ?",
+            [(extract_main_domain(url), story_id) for story_id, url in cursor.fetchall()],
+        )
+
+    # Rows with a NULL priority or score fall out of the keyset-paginated listing
+    cursor.execute("""
+        UPDATE stories SET priority = coalesce(priority, 0), score = coalesce(score, 0)
+        WHERE priority IS NULL OR score IS NULL
+    """)
+
+    # Composite index backing the keyset-paginated listing in the web app
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_stories_listing
+        ON stories (priority DESC, score DESC, id DESC)
+    """)
+
+    # Index for the latest listing and the web app's change feed
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_stories_last_updated
+        ON stories (last_updated, id)
+    """)
+
+    # Index for listing the stories of one site
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_stories_domain
+        ON stories (domain, priority DESC, score DESC)
+    """)
+
+    create_search_index(cursor)
+
     conn.commit()
+    # Comment threads of the top stories, see lib.comments
+    create_comment_tables(conn)
     return conn
 
 
+def create_search_index(cursor):
+    """
+    Create the FTS5 full-text index over stories and the triggers keeping it in sync.
+
+    The index is an external-content table, so it stores only the inverted
+    index and reads title, content and summary back through the stories_text
+    view, which decompresses them (see lib.text_codec). Rows are indexed on
+    insert and re-indexed when the summary agent updates them. Every
+    connection writing stories must have the text_codec SQL functions
+    registered, see lib.text_codec.connect.
+
+    Parameters:
+        cursor (sqlite3.Cursor): A cursor on the stories database.
+    """
+    check_functions(cursor.connection)
+    cursor.execute(
+        "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'stories_fts'"
+    )
+    row = cursor.fetchone()
+    exists = row is not None
+
+    # Indexes created before content compression read 'stories' directly
+    if exists and "stories_text" not in row[0]:
+        for trigger in ("stories_fts_insert", "stories_fts_delete", "stories_fts_update"):
+            cursor.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+        cursor.execute("DROP TABLE stories_fts")
+        exists = False
+
+    cursor.execute("""
+        CREATE VIEW IF NOT EXISTS stories_text AS
+        SELECT id, title, decompress_text(content) AS content, decompress_text(summary) AS summary
+        FROM stories
+    """)
+    cursor.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS stories_fts USING fts5(
+            title, content, summary,
+            content='stories_text', content_rowid='id',
+            prefix='2 3'
+        )
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS stories_fts_insert AFTER INSERT ON stories BEGIN
+            INSERT INTO stories_fts (rowid, title, content, summary)
+            VALUES (new.id, new.title, decompress_text(new.content), decompress_text(new.summary));
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS stories_fts_delete AFTER DELETE ON stories BEGIN
+            INSERT INTO stories_fts (stories_fts, rowid, title, content, summary)
+            VALUES ('delete', old.id, old.title, decompress_text(old.content), decompress_text(old.summary));
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS stories_fts_update
+        AFTER UPDATE OF title, content, summary ON stories BEGIN
+            INSERT INTO stories_fts (stories_fts, rowid, title, content, summary)
+            VALUES ('delete', old.id, old.title, decompress_text(old.content), decompress_text(old.summary));
+            INSERT INTO stories_fts (rowid, title, content, summary)
+            VALUES (new.id, new.title, decompress_text(new.content), decompress_text(new.summary));
+        END
+    """)
+
+    # Index the rows of a database created before the search index existed
+    if not exists:
+        cursor.execute("INSERT INTO stories_fts (stories_fts) VALUES ('rebuild')")
+
+
 def fetch_top_story_ids():
     """
     Fetch the top story IDs from Hacker News.
@@ -155,9 +330,10 @@ def fetch_top_story_ids():
     Returns:
         list: A list of top story IDs.
     """
-    top_stories_url = "https://hacker-news.firebaseio.com/v0/topstories.json"
+    top_stories_url = f"{HN_API_URL}/topstories.json"
     try:
-        response = requests.get(top_stories_url, timeout=10)
+        with run_ledger.stage("hn_api"):
+            response = requests.get(top_stories_url, timeout=10)
         if response.status_code == 200:
             story_ids = response.json()
             return story_ids
@@ -179,9 +355,10 @@ def fetch_story_details(story_id):
     Returns:
         dict or None: The story details if successful, None otherwise.
     """
-    story_url = f"https://hacker-news.firebaseio.com/v0/item/{story_id}.json"
+    story_url = f"{HN_API_URL}/item/{story_id}.json"
     try:
-        response = requests.get(story_url, timeout=10)
+        with run_ledger.stage("hn_api"):
+            response = requests.get(story_url, timeout=10)
         if response.status_code == 200:
             return response.json()
         else:
@@ -198,10 +375,102 @@ def fetch_story_details(story_id):
         return None
 
 
+
+def sample_top_stories(top_story_ids, max_workers=10):
+    """
+    Fetch the items of the first stories of the top stories list.
+
+    Their scores go into the rank history and their comment counts decide
+    which comment threads are refreshed.
+
+    Parameters:
+        top_story_ids (list): The top story IDs, in rank order.
+        max_workers (int): Concurrent requests.
+
+    Returns:
+        list: The story items fetched, in rank order.
+    """
+    sampled_ids = top_story_ids[:max(SCORE_SAMPLE_RANKS, COMMENT_STORIES)]
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return [story for story in executor.map(fetch_story_details, sampled_ids) if story]
+
+
+def record_rank_history(conn, top_story_ids, sampled_stories):
+    """
+    Append the ranks and scores of the current top stories list to today's rank history.
+
+    Scores of the first SCORE_SAMPLE_RANKS stories come from the sampled
+    items, the others keep their last sampled score, or the one stored at
+    ingest. Errors are logged, they never fail the run.
+
+    Parameters:
+        conn (sqlite3.Connection): The database connection, for the stored scores.
+        top_story_ids (list): The top story IDs, in rank order.
+        sampled_stories (list): Items returned by 'sample_top_stories'.
+    """
+    captured_at = time.time()
+    scored_ids = set(top_story_ids[:SCORE_SAMPLE_RANKS])
+    sampled = {
+        story["id"]: story["score"]
+        for story in sampled_stories
+        if story["id"] in scored_ids and story.get("score") is not None
+    }
+    try:
+        with run_ledger.stage("ranks"):
+            stored = dict(conn.execute("SELECT id, score FROM stories"))
+            RankHistory(history_path(get_database_name())).append(captured_at, top_story_ids, sampled, stored)
+        run_ledger.count("ranks_sampled", len(sampled))
+    except Exception as e:
+        print(f"Error recording rank history: {e}")
+        logging.error(f"Error recording rank history: {e}")
+
+
+def refresh_comments(conn, stories, deadline=None):
+    """
+    Refresh the comment threads of stories whose comment count changed.
+
+    Threads are walked one after the other, each level of a thread with up
+    to COMMENT_WORKERS concurrent requests. No new thread is started after
+    the deadline, the next run picks the rest up. Errors are logged, they
+    never fail the run.
+
+    Parameters:
+        conn (sqlite3.Connection): The database connection.
+        stories (list): Freshly fetched story items.
+        deadline (float): time.monotonic() value to stop at, or None.
+
+    Returns:
+        int: The number of threads refreshed.
+    """
+    refreshed = 0
+    with ThreadPoolExecutor(max_workers=COMMENT_WORKERS) as executor:
+        for story in stories:
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+            try:
+                with run_ledger.stage("comments"):
+                    counts = refresh_thread(conn, story, fetch_story_details, executor)
+            except Exception as e:
+                print(f"Error refreshing comments of story ID {story.get('id')}: {e}")
+                logging.error(f"Error refreshing comments of story ID {story.get('id')}: {e}")
+                continue
+            if counts is None:
+                run_ledger.count("threads_unchanged")
+                continue
+            run_ledger.count("threads_refreshed")
+            run_ledger.count("comments_fetched", counts["fetched"])
+            run_ledger.count("comments_cached", counts["cached"])
+            refreshed += 1
+    return refreshed
+
 def extract_content(url, timeout=10, blacklist=None):
     """
     Extract the main content from a URL using trafilatura.
 
+    The page is extracted with the tiered extractor, cheapest settings first
+    (see lib.extraction). The tier that produced the text is counted in the
+    runs ledger, e.g. 'extract_fast'.
+
     Parameters:
         url (str): The URL to extract content from.
         timeout (int): Timeout for the HTTP request.
@@ -212,10 +481,13 @@ def extract_content(url, timeout=10, blacklist=None):
     """
     if not blacklist.is_blacklisted(url, blacklist):
         try:
-            response = requests.get(url, headers=HEADERS, timeout=timeout, verify=False)
-            if response.status_code == 200:
+            with run_ledger.stage("download"):
+                response = requests.get(url, headers=HEADERS, timeout=timeout, verify=False)
                 downloaded = response.text
-                content = trafilatura.extract(downloaded, url=url)
+            if response.status_code == 200:
+                with run_ledger.stage("extract"):
+                    content, tier = extractor.extract(downloaded, url, extract_main_domain(url))
+                run_ledger.count(f"extract_{tier or 'none'}")
                 return content
             else:
                 print(
@@ -246,11 +518,13 @@ def save_story(conn, story):
         story (dict): The story data to save.
     """
     try:
+        started = time.perf_counter()
         cursor = conn.cursor()
         cursor.execute(
             """
-            INSERT INTO stories (id, title, by, score, url, content, summary, priority, last_updated)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            INSERT INTO stories (id, title, by, score, url, content, summary, priority, last_updated, domain, has_content,
+                content_signature, relevance_vector)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
         """,
             (
                 story["id"],
@@ -258,40 +532,56 @@ def save_story(conn, story):
                 story.get("by"),
                 story.get("score"),
                 story.get("url"),
-                story.get("content"),
+                compress_text(story.get("content")),
                 story.get("summary"),
                 story.get("priority"),
                 story.get("last_updated"),
+                story.get("domain"),
+                bool(story.get("content") and story["content"].strip()),
+                story.get("content_signature"),
+                relevance_vector(story.get("title"), story.get("summary")),
             ),
         )
         conn.commit()
+        run_ledger.add_time("db", time.perf_counter() - started)
+        run_ledger.count("fetched")
     except sqlite3.IntegrityError:
+        run_ledger.count("skipped")
         print(f"Story ID {story['id']} already exists in the database.")
         logging.warning(f"Story ID {story['id']} already exists in the database.")
     except Exception as e:
+        run_ledger.count("failed")
         print(f"Error saving story ID {story['id']}: {e}")
         logging.error(f"Error saving story ID {story['id']}: {e}")
 
 
-def process_story(story_id, blacklist, prioritise_patterns):
+def process_story(story_id, blacklist, prioritise_patterns, deadline=None):
     """
     Process a single story: fetch details, check blacklist, assign priority, and extract content.
 
     Parameters:
         story_id (int): The ID of the story to process.
         blacklist (dict): The blacklist data loaded from 'load_blacklist'.
-        prioritise_patterns (dict): The prioritization patterns loaded from 'load_prioritise'.
+        prioritise_patterns (PriorityRules): The rules loaded by 'load_prioritise'.
+        deadline (float): time.monotonic() after which the article is not downloaded.
 
     Returns:
-        dict or None: The processed story data, or None if failed or blacklisted.
+        dict or None: The processed story data, None if failed or blacklisted,
+        DEFERRED if the deadline passed before its article was downloaded.
     """
     try:
         story_details = fetch_story_details(story_id)
         if not story_details:
+            run_ledger.count("failed")
             return None
 
+        # The download is the slow part, leave it to the next run
+        if deadline is not None and time.monotonic() > deadline and story_details.get("url"):
+            return DEFERRED
+
         # Check if the story is blacklisted
         if blacklist.is_blacklisted(story_details.get("url"), blacklist):
+            run_ledger.count("blacklisted")
             return None
 
         # Assign priority
@@ -303,23 +593,151 @@ def process_story(story_id, blacklist, prioritise_patterns):
             "id": story_details.get("id"),
             "title": story_details.get("title"),
             "by": story_details.get("by"),
-            "score": story_details.get("score"),
+            # Listings page on (priority, score, id), which must not be NULL
+            "score": story_details.get("score") or 0,
             "url": story_details.get("url"),
             "content": None,
             "summary": None,
             "priority": priority,
             "last_updated": datetime.now(),
+            "domain": extract_main_domain(story_details.get("url")),
         }
 
         if story["url"]:
             content = extract_content(story["url"], timeout=10, blacklist=blacklist)
             story["content"] = content
+            if not content:
+                run_ledger.count("no_content")
+            else:
+                # MinHash of the article, the summary agent reuses the summary of near-duplicates
+                with run_ledger.stage("signature"):
+                    story["content_signature"] = content_signature(content)
 
         return story
     except Exception as e:
+        run_ledger.count("failed")
         logging.error(f"Error processing story ID {story_id}: {e}")
         return None
 
+def load_carry_over(conn):
+    """
+    Return the IDs left unprocessed by the previous run, in the order they were queued.
+
+    Parameters:
+        conn (sqlite3.Connection): The database connection.
+    """
+    conn.execute("CREATE TABLE IF NOT EXISTS carry_over (id INTEGER PRIMARY KEY, position INTEGER)")
+    return [row[0] for row in conn.execute("SELECT id FROM carry_over ORDER BY position")]
+
+
+def save_carry_over(conn, story_ids):
+    """
+    Replace the carry-over with the IDs this run did not get to.
+
+    Parameters:
+        conn (sqlite3.Connection): The database connection.
+        story_ids (list): The IDs in processing order.
+    """
+    with conn:
+        conn.execute("DELETE FROM carry_over")
+        conn.executemany(
+            "INSERT OR IGNORE INTO carry_over (id, position) VALUES (?, ?)",
+            [(story_id, position) for position, story_id in enumerate(story_ids)],
+        )
+
+
+def submit_daemon(function, *args):
+    """
+    Run function(*args) on a daemon thread.
+
+    ThreadPoolExecutor workers are joined when the interpreter exits, so a
+    story abandoned at the deadline would keep the process alive until its
+    requests end. A daemon thread dies with the process instead.
+
+    Returns:
+        concurrent.futures.Future: The result of the call.
+    """
+    future = Future()
+
+    def run():
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(function(*args))
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=run, daemon=True).start()
+    return future
+
+
+def process_stories(conn, stories_to_process, prioritise_patterns, deadline=None, max_workers=10):
+    """
+    Process and save stories in order, at most max_workers at a time.
+
+    Without a deadline every story is processed. With one, no story is
+    started after it, stories already running get STRAGGLER_GRACE more
+    seconds, and whatever is left is abandoned: the results of threads still
+    running are dropped, and as daemon threads they end with the process.
+
+    Parameters:
+        conn (sqlite3.Connection): The database connection.
+        stories_to_process (list): Story IDs, most important first.
+        prioritise_patterns (PriorityRules): The priority rules.
+        deadline (float): time.monotonic() at which to stop, None for no limit.
+        max_workers (int): Stories processed concurrently.
+
+    Returns:
+        list: The IDs not processed, in their original order.
+    """
+    queue = list(stories_to_process)
+    position = {story_id: n for n, story_id in enumerate(queue)}
+    left_over = []
+    in_flight = {}
+    with tqdm(total=len(queue), desc="Processing stories") as pbar:
+        while queue or in_flight:
+            past_deadline = deadline is not None and time.monotonic() >= deadline
+            while queue and len(in_flight) < max_workers and not past_deadline:
+                story_id = queue.pop(0)
+                future = submit_daemon(process_story, story_id, blacklist, prioritise_patterns, deadline)
+                in_flight[future] = story_id
+            if past_deadline:
+                left_over.extend(queue)
+                queue = []
+                if time.monotonic() >= deadline + STRAGGLER_GRACE:
+                    left_over.extend(in_flight.values())
+                    break
+            if not in_flight:
+                break
+
+            if deadline is None:
+                timeout = None
+            elif past_deadline:
+                timeout = deadline + STRAGGLER_GRACE - time.monotonic()
+            else:
+                timeout = deadline - time.monotonic()
+            done, _ = wait(in_flight, timeout=max(timeout, 0) if timeout is not None else None,
+                           return_when=FIRST_COMPLETED)
+            for future in done:
+                story_id = in_flight.pop(future)
+                try:
+                    story = future.result()
+                    if story == DEFERRED:
+                        left_over.append(story_id)
+                    elif story:
+                        save_story(conn, story)
+                except Exception as e:
+                    print(
+                        f"Exception occurred while processing story ID {story_id}: {e}"
+                    )
+                    logging.error(
+                        f"Exception occurred while processing story ID {story_id}: {e}"
+                    )
+                finally:
+                    pbar.update(1)
+    return sorted(left_over, key=position.get)
+
+
 # Debug function to print URL for a given ID
 def debug_url(story_id,id_to_url):
     if story_id in id_to_url:
@@ -327,16 +745,25 @@ def debug_url(story_id,id_to_url):
     else:
         print(f"ID {story_id} not found in database")
 
-def main():
+def main(ranks_only=False):
     """
-    The main function to orchestrate fetching and processing stories.
+    Fetch new stories and record the run in the runs ledger.
+
+    Parameters:
+        ranks_only (bool): Only record the front page ranks and refresh the
+            comment threads, see 'track_front_page'. Stored as a 'ranks' run.
     """
-    # Parse command-line arguments
-    # parser = argparse.ArgumentParser(description='Fetch Hacker News stories.')
-    # parser.add_argument('--summary', action='store_true', help='Generate summaries for the content')
-    # args = parser.parse_args()
+    run_ledger.agent = "ranks" if ranks_only else "fetch"
+    run_ledger.start()
+    status = "error"
+    try:
+        status = track_front_page() if ranks_only else fetch_stories()
+    finally:
+        run_ledger.finish(status)
 
-    # Configure logging
+
+def configure_logging():
+    """Log to today's log file next to the database."""
     current_date = datetime.now().strftime("%d_%m_%Y")
     log_filename = f"./db/hackernews_{current_date}.log"
     logging.basicConfig(
@@ -345,17 +772,83 @@ def main():
         format="%(asctime)s %(levelname)s:%(message)s",
     )
 
-    # Create database
+
+def track_front_page():
+    """
+    Record the front page ranks and refresh the comment threads, without fetching new stories.
+
+    The scheduler runs this on every poll that has no new stories to fetch,
+    so the rank history and the comment threads keep up while the front
+    page only reorders.
+
+    Returns:
+        str: The run status for the ledger, 'ok' or why nothing was recorded.
+    """
+    configure_logging()
+    conn = create_database()
+    run_ledger.database = os.path.basename(get_database_name())
+    try:
+        top_story_ids = fetch_top_story_ids()
+        if not top_story_ids:
+            print("No top stories fetched. Exiting.")
+            return "no_stories"
+        sampled_stories = sample_top_stories(top_story_ids)
+        record_rank_history(conn, top_story_ids, sampled_stories)
+        deadline = time.monotonic() + FETCH_BUDGET if FETCH_BUDGET > 0 else None
+        refreshed = refresh_comments(conn, sampled_stories[:COMMENT_STORIES], deadline)
+    finally:
+        conn.close()
+    # Story pages show the comments, the web app reads them from the snapshot
+    if refreshed:
+        publish_read_snapshot()
+    print(f"Front page recorded, {refreshed} comment threads refreshed.")
+    return "ok"
+
+
+def fetch_stories():
+    """
+    The main function to orchestrate fetching and processing stories.
+
+    Returns:
+        str: The run status for the ledger, 'ok' or why nothing was fetched.
+    """
+    # Configure logging
+    configure_logging()
+
+    # Create database, closed and the extraction stats saved however the run ends
     conn = create_database()
+    try:
+        return fetch_new_stories(conn)
+    finally:
+        conn.close()
+        extractor.save()
+
+
+def fetch_new_stories(conn):
+    """
+    Fetch and process the front page stories not stored yet, then refresh the comment threads.
+
+    Parameters:
+        conn (sqlite3.Connection): The database connection.
+
+    Returns:
+        str: The run status for the ledger, 'ok' or why nothing was fetched.
+    """
     cursor = conn.cursor()
+    run_ledger.database = os.path.basename(get_database_name())
+
+    # Stored priorities follow the rule file, not the rules at ingest time
+    prioritise_patterns = load_prioritise()
+    rescored = rescore_priorities(conn, prioritise_patterns)
 
     # Fetch existing story IDs to avoid reprocessing
     try:
         #cursor.execute("SELECT id FROM stories")
         #existing_ids = set(row[0] for row in cursor.fetchall())
         # Execute query and fetch all results
-        cursor.execute("SELECT * FROM stories")
-        rows = cursor.fetchall()
+        with run_ledger.stage("db"):
+            cursor.execute("SELECT * FROM stories")
+            rows = cursor.fetchall()
         columns = [description[0] for description in cursor.description]
 
         # Create index mappings
@@ -385,58 +878,69 @@ def main():
     top_story_ids = fetch_top_story_ids()
     if not top_story_ids:
         print("No top stories fetched. Exiting.")
-        return
+        if rescored:
+            publish_read_snapshot()
+        return "no_stories"
     total_stories = len(top_story_ids)
     print(f"Total stories fetched from Hacker News: {total_stories}")
+    sampled_stories = sample_top_stories(top_story_ids)
+    record_rank_history(conn, top_story_ids, sampled_stories)
 
     # Filter out already processed stories
     stories_to_process = [sid for sid in top_story_ids if sid not in existing_ids]
+
+    # Prioritised stories go first. Titles are only known for the sampled
+    # stories, the others keep their front page order.
+    sampled_priority = {
+        story["id"]: is_prioritised(story.get("url"), story.get("title"), prioritise_patterns)
+        for story in sampled_stories
+    }
+    stories_to_process.sort(key=lambda sid: -sampled_priority.get(sid, 0))
+    run_ledger.count("skipped", total_stories - len(stories_to_process))
+
+    # Stories the previous run did not get to, after the current front page
+    queued = set(stories_to_process)
+    carried = [sid for sid in load_carry_over(conn) if sid not in existing_ids and sid not in queued]
+    stories_to_process += carried
     total_to_process = len(stories_to_process)
     print(stories_to_process)
     for story_id in stories_to_process:
         print(f"ID: {story_id}")
         debug_url(story_id,id_to_url)
-    print(f"Total new stories to process: {total_to_process}")
+    print(f"Total new stories to process: {total_to_process} ({len(carried)} carried over)")
 
-    if total_to_process == 0:
-        print("No new stories to process. Exiting.")
-        return
-
-    prioritise_patterns = load_prioritise()
+    # Work stops at the deadline, the rest is carried over to the next run
+    deadline = time.monotonic() + FETCH_BUDGET if FETCH_BUDGET > 0 else None
 
+    if total_to_process == 0:
+        print("No new stories to process.")
+        save_carry_over(conn, [])
+        refreshed = refresh_comments(conn, sampled_stories[:COMMENT_STORIES], deadline)
+        if rescored or refreshed:
+            publish_read_snapshot()
+        return "ok"
     # Define the number of worker threads
     max_workers = 10  # Adjust based on your system's capabilities
+    left_over = process_stories(conn, stories_to_process, prioritise_patterns, deadline, max_workers)
+    save_carry_over(conn, left_over)
+    if left_over:
+        run_ledger.count("carried_over", len(left_over))
+        print(f"Deadline reached, {len(left_over)} stories carried over to the next run.")
 
-    # Initialize ThreadPoolExecutor
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        # Submit all tasks to the executor
-        future_to_story_id = {
-            executor.submit(process_story, sid, blacklist, prioritise_patterns): sid
-            for sid in stories_to_process
-        }
-
-        # Initialize progress bar
-        with tqdm(total=total_to_process, desc="Processing stories") as pbar:
-            for future in as_completed(future_to_story_id):
-                story_id = future_to_story_id[future]
-                try:
-                    story = future.result()
-                    if story:
-                        save_story(conn, story)
-                except Exception as e:
-                    print(
-                        f"Exception occurred while processing story ID {story_id}: {e}"
-                    )
-                    logging.error(
-                        f"Exception occurred while processing story ID {story_id}: {e}"
-                    )
-                finally:
-                    pbar.update(1)
+    # Comment threads come after the stories, they are refreshed again by every run
+    refresh_comments(conn, sampled_stories[:COMMENT_STORIES], deadline)
 
-    # Close the database connection
-    conn.close()
+    # Publish the read snapshot served by the web app
+    publish_read_snapshot()
     print("Processing completed.")
+    return "deadline" if left_over else "ok"
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Fetch Hacker News stories.")
+    parser.add_argument(
+        "--ranks-only", action="store_true",
+        help="Only record the front page ranks and refresh the comment threads",
+    )
+    args = parser.parse_args()
+    main(ranks_only=args.ranks_only)
@@ -0,0 +1,47 @@
+import os
+import sys
+import time
+import argparse
+
+# Add the parent directory to the sys.path to ensure lib can be imported
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from lib import text_codec
+from lib.priority import DEFAULT_PRIORITY_FILE, PriorityRules, rescore_stories
+from lib.snapshot import publish_snapshot
+from concurrent_hn_topnews_fetch import get_database_name
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Re-score the priority of stored stories after editing the priority rules."
+    )
+    parser.add_argument("--db", default=None, help="Database path, defaults to today's")
+    parser.add_argument("--rules", default=DEFAULT_PRIORITY_FILE, help="Priority rule file")
+    parser.add_argument("--force", action="store_true", help="Re-score even if the rules did not change")
+    args = parser.parse_args()
+
+    db_name = args.db or get_database_name()
+    if not os.path.exists(db_name):
+        print(f"Database {db_name} does not exist.")
+        return
+
+    rules = PriorityRules(args.rules)
+    conn = text_codec.connect(db_name)
+    started = time.perf_counter()
+    changed = rescore_stories(conn, rules, force=args.force)
+    elapsed = time.perf_counter() - started
+    stories = conn.execute("SELECT count(*) FROM stories").fetchone()[0]
+    conn.close()
+
+    if changed is None:
+        print(f"Priority rules unchanged since the last re-scoring of {db_name}, use --force to re-score anyway.")
+        return
+
+    print(f"Re-scored {stories} stories with {len(rules.rules)} rules in {elapsed * 1000:.1f} ms, {changed} changed.")
+    if changed:
+        publish_snapshot(db_name)
+
+
+if __name__ == "__main__":
+    main()
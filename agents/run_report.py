@@ -0,0 +1,130 @@
+import os
+import sys
+import json
+import argparse
+import statistics
+
+# Add the parent directory to the sys.path to ensure lib can be imported
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from lib.run_ledger import RUNS_DB, COUNT_COLUMNS, connect_runs_db
+
+
+def load_runs(db_path, agent=None, limit=30):
+    """
+    Load the latest runs from the ledger, oldest first.
+
+    Parameters:
+        db_path (str): The ledger database.
+        agent (str): Only runs of this agent, e.g. 'fetch'.
+        limit (int): Number of runs per agent.
+
+    Returns:
+        dict: Maps agent names to lists of run dicts.
+    """
+    conn = connect_runs_db(db_path)
+    agents = [agent] if agent else [row[0] for row in conn.execute("SELECT DISTINCT agent FROM runs ORDER BY agent")]
+    runs = {}
+    for name in agents:
+        rows = conn.execute(
+            f"""
+            SELECT started_at, duration, status, {", ".join(COUNT_COLUMNS)}, counts, stages
+            FROM runs WHERE agent = ? ORDER BY started_at DESC, id DESC LIMIT ?
+        """,
+            (name, limit),
+        ).fetchall()
+        runs[name] = [
+            {
+                "started_at": row[0],
+                "duration": row[1],
+                "status": row[2],
+                **dict(zip(COUNT_COLUMNS, row[3:3 + len(COUNT_COLUMNS)])),
+                "counts": json.loads(row[-2] or "{}"),
+                "stages": json.loads(row[-1] or "{}"),
+            }
+            for row in reversed(rows)
+        ]
+    conn.close()
+    return runs
+
+
+def stage_names(runs):
+    """Return the stages seen in any of the runs, in first-seen order."""
+    names = []
+    for run in runs:
+        for stage in run["stages"]:
+            if stage not in names:
+                names.append(stage)
+    return names
+
+
+def print_runs(agent, runs):
+    """Print one line per run with its counts and each stage's total and p95 seconds."""
+    stages = stage_names(runs)
+    print(f"\n{agent}: last {len(runs)} runs (stage columns: total s / p95 s)")
+    header = f"{'started':<19} {'dur s':>7} {'status':<10}" + "".join(f" {name:>11}" for name in COUNT_COLUMNS)
+    header += "".join(f" {stage:>15}" for stage in stages)
+    print(header)
+    for run in runs:
+        line = f"{run['started_at']:<19} {run['duration'] or 0:>7.1f} {run['status'] or '':<10}"
+        line += "".join(f" {run[name]:>11}" for name in COUNT_COLUMNS)
+        for stage in stages:
+            stats = run["stages"].get(stage)
+            cell = f"{stats['total']:.1f}/{stats['p95']:.2f}" if stats else "-"
+            line += f" {cell:>15}"
+        print(line)
+
+
+def print_trend(runs):
+    """
+    Compare the median of the older and the newer half of the runs.
+
+    Shows how run duration, stage totals and p95s moved, the first thing to
+    look at when the ticks get slower.
+    """
+    if len(runs) < 4:
+        print("Not enough runs for a trend.")
+        return
+    older, newer = runs[: len(runs) // 2], runs[len(runs) // 2:]
+
+    def change(metric):
+        before = [value for value in map(metric, older) if value is not None]
+        after = [value for value in map(metric, newer) if value is not None]
+        if not before or not after:
+            return None
+        before, after = statistics.median(before), statistics.median(after)
+        percent = (after - before) / before * 100 if before else 0.0
+        return f"{before:.2f} -> {after:.2f} ({percent:+.0f}%)"
+
+    print(f"Trend, median of the {len(older)} older vs the {len(newer)} newer runs:")
+    print(f"  {'duration s':<22} {change(lambda run: run['duration'])}")
+    print(f"  {'fetched':<22} {change(lambda run: run['fetched'])}")
+    for stage in stage_names(runs):
+        for key in ("total", "p95"):
+            result = change(lambda run: run["stages"].get(stage, {}).get(key))
+            if result:
+                print(f"  {stage + ' ' + key + ' s':<22} {result}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report the agent runs recorded in the runs ledger.")
+    parser.add_argument("--agent", default=None, help="Only this agent, e.g. fetch or summary")
+    parser.add_argument("--last", type=int, default=30, help="Runs per agent to show")
+    parser.add_argument("--db", default=RUNS_DB, help="Ledger database")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        print(f"No runs recorded yet in {args.db}.")
+        return
+
+    runs = load_runs(args.db, agent=args.agent, limit=args.last)
+    if not any(runs.values()):
+        print("No runs recorded yet.")
+    for agent, agent_runs in runs.items():
+        if agent_runs:
+            print_runs(agent, agent_runs)
+            print_trend(agent_runs)
+
+
+if __name__ == "__main__":
+    main()
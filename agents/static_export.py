@@ -0,0 +1,254 @@
+import os
+import re
+import sys
+import json
+import shutil
+import sqlite3
+import hashlib
+import logging
+import argparse
+from datetime import datetime
+
+# Add the parent directory to the sys.path to ensure lib can be imported
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from bn_app import app
+from apps.common import get_db_connection, get_live_db_name
+
+# Directory holding the exported builds and the 'current' symlink to serve
+DEFAULT_OUTPUT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'static_site'))
+
+# Builds kept besides the current one, so a server still reading the
+# previous build is not cut off mid-request
+KEEP_BUILDS = 1
+
+MANIFEST_FILE = "manifest.json"
+
+
+def load_manifest(build_dir):
+    """
+    Load the manifest of a previous build.
+
+    Parameters:
+        build_dir (str or None): The build directory.
+
+    Returns:
+        dict: Maps page paths to {'hash': ..., 'version': ...}.
+    """
+    if not build_dir:
+        return {}
+    try:
+        with open(os.path.join(build_dir, MANIFEST_FILE), "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def get_story_versions():
+    """
+    Return the version of every story page, keyed by story ID.
+
+    A story page changes when its row is written, which always sets
+    last_updated, or when its comment thread is refreshed, which sets
+    comment_threads.refreshed_at. Together they are the page version.
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            SELECT s.id, s.last_updated, t.refreshed_at
+            FROM stories s LEFT JOIN comment_threads t ON t.story_id = s.id
+        """)
+    except sqlite3.OperationalError:
+        # Databases made before comments were fetched
+        cursor.execute("SELECT id, last_updated, NULL AS refreshed_at FROM stories")
+    versions = {
+        row["id"]: f"{row['last_updated']}|{row['refreshed_at'] or ''}" for row in cursor.fetchall()
+    }
+    conn.close()
+    return versions
+
+
+def page_file(page_path):
+    """Map a URL path such as '/hackernews/show/1' to 'hackernews/show/1/index.html'."""
+    return os.path.join(page_path.strip("/"), "index.html")
+
+
+class Exporter:
+    def __init__(self, output_dir):
+        """
+        Render pages into a new build directory next to the previous one.
+
+        Pages whose content or underlying row did not change are hard-linked
+        from the previous build instead of being written again.
+
+        Parameters:
+            output_dir (str): The directory holding builds and the 'current' symlink.
+        """
+        self.output_dir = output_dir
+        self.current_link = os.path.join(output_dir, "current")
+        self.previous_dir = (
+            os.path.realpath(self.current_link) if os.path.islink(self.current_link) else None
+        )
+        self.previous_manifest = load_manifest(self.previous_dir)
+        self.build_dir = os.path.join(
+            output_dir, "build-" + datetime.now().strftime("%Y%m%d%H%M%S%f")
+        )
+        self.manifest = {}
+        self.client = app.test_client()
+        self.written = 0
+        self.linked = 0
+
+    def reuse(self, page_path, entry):
+        """Hard-link a page from the previous build. Returns False if it is not there."""
+        source = os.path.join(self.previous_dir, page_file(page_path)) if self.previous_dir else None
+        if not source or not os.path.exists(source):
+            return False
+        target = os.path.join(self.build_dir, page_file(page_path))
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.link(source, target)
+        self.manifest[page_path] = entry
+        self.linked += 1
+        return True
+
+    def render(self, url):
+        """Render a URL through the app and return the body, or None if not 200."""
+        response = self.client.get(url)
+        if response.status_code != 200:
+            return None
+        return response.get_data()
+
+    def export(self, page_path, url=None, version=None):
+        """
+        Export one page.
+
+        Parameters:
+            page_path (str): The path the page is served at.
+            url (str): The app URL rendering it, defaults to page_path.
+            version (str): Version of the underlying row. When it matches the
+                previous build the page is not rendered at all.
+
+        Returns:
+            bytes or None: The rendered body, None if it was reused or not found.
+        """
+        previous = self.previous_manifest.get(page_path)
+        if version is not None and previous and previous.get("version") == version:
+            if self.reuse(page_path, previous):
+                return None
+
+        body = self.render(url or page_path)
+        if body is None:
+            return None
+
+        entry = {"hash": hashlib.sha1(body).hexdigest(), "version": version}
+        if previous and previous.get("hash") == entry["hash"] and self.reuse(page_path, entry):
+            return body
+
+        target = os.path.join(self.build_dir, page_file(page_path))
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target, "wb") as f:
+            f.write(body)
+        self.manifest[page_path] = entry
+        self.written += 1
+        return body
+
+    def export_listing(self, base_path, url=None, version=None):
+        """
+        Export every page of a paginated listing or story comment thread.
+
+        Page n is served at <base_path>page/<n>/, the templates link to that
+        path instead of the cursor URL when STATIC_EXPORT is set.
+
+        Parameters:
+            base_path (str): The path the first page is served at.
+            url (str): The app URL rendering the first page, defaults to base_path.
+            version (str): Version of the underlying rows, see 'export'.
+        """
+        url = url or base_path
+        page = 1
+        while url:
+            page_path = base_path if page == 1 else f"{base_path}page/{page}/"
+            separator = "&" if "?" in url else "?"
+            body = self.export(page_path, url=f"{url}{separator}page={page}", version=version)
+            if body is None and page_path in self.manifest:
+                # Reused from the previous build, its next link is read from the file
+                with open(os.path.join(self.build_dir, page_file(page_path)), "rb") as f:
+                    body = f.read()
+            if body is None:
+                break
+            match = re.search(rb'data-next-url="([^"]+)"', body)
+            url = match.group(1).decode().replace("&amp;", "&") if match else None
+            page += 1
+
+    def copy_static(self):
+        """Copy the app's static files (icons, web manifest) into the build."""
+        shutil.copytree(app.static_folder, os.path.join(self.build_dir, "static"), dirs_exist_ok=True)
+
+    def publish(self):
+        """Write the manifest and atomically point 'current' at the new build."""
+        with open(os.path.join(self.build_dir, MANIFEST_FILE), "w") as f:
+            json.dump(self.manifest, f)
+
+        tmp_link = self.current_link + ".tmp"
+        if os.path.lexists(tmp_link):
+            os.remove(tmp_link)
+        os.symlink(os.path.basename(self.build_dir), tmp_link)
+        os.replace(tmp_link, self.current_link)
+
+    def remove_old_builds(self):
+        """Delete builds older than the current one and the KEEP_BUILDS before it."""
+        builds = sorted(
+            name for name in os.listdir(self.output_dir) if name.startswith("build-")
+        )
+        for name in builds[: -(KEEP_BUILDS + 1)]:
+            shutil.rmtree(os.path.join(self.output_dir, name), ignore_errors=True)
+
+
+def main():
+    """
+    Render the listings and every story page of today's database into a static site.
+
+    Pages that need the server, search, site listings and the reader's
+    picks, are left out and the templates do not link to them.
+    """
+    parser = argparse.ArgumentParser(description="Export BespokeNews pages as a static site.")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT_DIR, help="Output directory")
+    args = parser.parse_args()
+
+    current_date = datetime.now().strftime("%d_%m_%Y")
+    log_filename = f"./db/hackernews_export_{current_date}.log"
+    logging.basicConfig(
+        filename=log_filename,
+        level=logging.INFO,
+        format="%(asctime)s %(levelname)s:%(message)s",
+    )
+
+    # The database the web app serves, today's or BN_DB
+    db_name = get_live_db_name()
+    if not os.path.exists(db_name):
+        print(f"Database {db_name} does not exist. Please fetch new news first.")
+        return
+
+    app.config["STATIC_EXPORT"] = True
+    os.makedirs(args.output, exist_ok=True)
+    exporter = Exporter(args.output)
+
+    exporter.export_listing("/hackernews/")
+    exporter.export_listing("/hackernews/latest/", url="/hackernews/latest")
+    exporter.export_listing("/hackernews/trending/", url="/hackernews/trending")
+
+    for story_id, version in get_story_versions().items():
+        # Story pages are paginated by their comments
+        path = f"/hackernews/show/{story_id}/"
+        exporter.export_listing(path, url=f"/hackernews/show/{story_id}", version=version)
+
+    exporter.copy_static()
+    exporter.publish()
+    exporter.remove_old_builds()
+
+    print(f"Static export completed: {exporter.written} pages written, {exporter.linked} unchanged.")
+    logging.info(f"Static export: {exporter.written} written, {exporter.linked} unchanged")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,29 +1,296 @@
+import os
+import re
 import sqlite3
+import hashlib
+import logging
+import threading
+import time
 from datetime import datetime
-# Import the Blacklist class from the lib.blacklist module
-from lib.blacklist import Blacklist
+from functools import wraps
 
-# Initialize the Blacklist in the app's global context
-blacklist = Blacklist(blacklist_files=["config/blacklist.txt", "config/blacklist_urls.txt"])
+from flask import request, make_response
 
+from lib.comments import COMMENT_PAGE_SIZE, fetch_comment_page
+from lib.compression import available_encodings
+from lib.metrics import TimedConnection, add_time, timed
+from lib.rank_history import RankHistory, history_path
+from lib.relevance import RelevanceRanker, record_interaction
+from lib.snapshot import snapshot_path
+from lib.text_codec import decompress_text, register_functions
+# Import the shared Blacklist from the lib.blacklist module
+from lib.blacklist import get_blacklist
+from lib.prefix_index import PrefixIndex
 
+# Use the shared Blacklist in the app's global context
+blacklist = get_blacklist()
 
-def get_db_connection():
+
+
+# In-memory title index serving autocomplete without touching SQLite
+title_index = PrefixIndex()
+title_index_state = {"db_name": None, "last_updated": ""}
+title_index_refresh_lock = threading.Lock()
+title_index_refresher = None
+title_index_refresher_lock = threading.Lock()
+
+# Seconds between checks of the database for new stories to add to title_index,
+# done by a background thread in every worker
+TITLE_INDEX_REFRESH_INTERVAL = 5
+
+# Ranks stories against the reader's clicks and stars for order_by='relevance'
+relevance_ranker = RelevanceRanker()
+
+# Front page rank history of the day, reloaded incrementally as the agent appends to it
+rank_history = None
+
+# Database to serve instead of today's, e.g. one made by benchmarks/generate_dataset.py
+DB_OVERRIDE = os.environ.get("BN_DB")
+
+
+def get_live_db_name():
+    """Return the path of today's live database, the one the agents write to."""
     current_date = datetime.now().strftime("%d_%m_%Y")
-    db_name = f"./db/hackernews_{current_date}.db"
-    conn = sqlite3.connect(db_name)
+    return DB_OVERRIDE or f"./db/hackernews_{current_date}.db"
+
+
+def get_db_name():
+    """
+    Return the database the web app reads today.
+
+    That is the read snapshot published by the agents after each run, or the
+    live database until the first snapshot of the day exists.
+
+    Returns:
+        tuple: (path, is_snapshot), is_snapshot is True for a read snapshot.
+    """
+    db_name = get_live_db_name()
+    snapshot = snapshot_path(db_name)
+    if os.path.exists(snapshot):
+        return snapshot, True
+    return db_name, False
+
+
+def get_db_connection():
+    db_name, is_snapshot = get_db_name()
+    if is_snapshot:
+        # Snapshots never change once published, so they are read without any locking
+        conn = sqlite3.connect(f"file:{db_name}?immutable=1", uri=True, factory=TimedConnection)
+    else:
+        conn = sqlite3.connect(db_name, factory=TimedConnection)
     conn.row_factory = sqlite3.Row  # Enable column access by name
+    # Search snippets read article text through the decompressing stories_text view
+    register_functions(conn)
     return conn
 
 
-def fetch_news_items(query=None, order_by=None):
-    """Fetch news items from the database, optionally filtering by a search query."""
+def get_data_version():
+    """
+    Return a token that changes whenever today's database is written to.
+
+    It combines the database name, its inode and modification time (a newly
+    published snapshot is a new file), the file change counter from the
+    SQLite header (bumped on every commit in rollback-journal mode) and the
+    size and modification time of the WAL file (for WAL mode). No query is run.
+
+    Returns:
+        str: The data version token.
+    """
+    db_name, _ = get_db_name()
+    parts = [db_name]
+    try:
+        stat = os.stat(db_name)
+        parts.append(f"{stat.st_ino}:{stat.st_mtime_ns}")
+        with open(db_name, "rb") as f:
+            f.seek(24)
+            parts.append(f.read(4).hex())
+    except OSError:
+        parts.append("-")
+    try:
+        wal = os.stat(db_name + "-wal")
+        parts.append(f"{wal.st_size}:{wal.st_mtime_ns}")
+    except OSError:
+        parts.append("-")
+    return ":".join(parts)
+
+
+def conditional(view):
+    """
+    Decorator adding a strong ETag and If-None-Match handling to a view.
+
+    The ETag is derived from the database data version and the request path
+    and query string, so it is known before the view runs. A matching
+    If-None-Match is answered with 304 without querying the database. Tags
+    of compressed representations (see lib.compression) match as well.
+    """
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        key = f"{get_data_version()}|{request.full_path}"
+        etag = hashlib.sha1(key.encode()).hexdigest()[:24]
+
+        candidates = [etag] + [f"{etag}-{encoding}" for encoding in available_encodings()]
+        for candidate in candidates:
+            if request.if_none_match.contains(candidate):
+                response = make_response("", 304)
+                response.set_etag(candidate)
+                response.vary.add("Accept-Encoding")
+                return response
+
+        response = make_response(view(*args, **kwargs))
+        if response.status_code == 200:
+            response.set_etag(etag)
+        return response
+
+    return wrapper
+
+
+# Columns needed to render a listing row. Article text is never selected here,
+# the template only needs to know whether a story has content to show, which
+# the fetch agent stores in has_content.
+LISTING_COLUMNS = """
+    id, title, by, url, domain, score, priority, last_updated, has_content
+"""
+
+# Number of stories per listing page
+PAGE_SIZE = 100
+
+
+def iter_rows(conn, cursor):
+    """Yield the rows of an executed query one at a time, closing the connection once done."""
+    try:
+        for row in cursor:
+            yield row
+    finally:
+        conn.close()
+
+
+def fetch_relevant_items(limit=PAGE_SIZE):
+    """
+    Fetch the stories most relevant to the reader's profile, most relevant first.
+
+    Every story of the published relevance matrix is scored with one
+    matrix-vector product, only the top rows are then read from the database.
+
+    Parameters:
+        limit (int): Maximum number of rows to return.
+
+    Returns:
+        list of sqlite3.Row or None: The rows, None when there is no profile
+        or no relevance matrix yet.
+    """
+    with timed("relevance"):
+        ranked = relevance_ranker.rank(get_db_name()[0], limit)
+    if ranked is None:
+        return None
+    rank = {story_id: position for position, (story_id, _) in enumerate(ranked)}
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute(
+        f"""
+        SELECT {LISTING_COLUMNS}
+        FROM stories
+        WHERE id IN ({", ".join("?" * len(rank))})
+    """,
+        list(rank),
+    )
+    news_items = sorted(cursor.fetchall(), key=lambda row: rank[row["id"]])
+    conn.close()
+    return news_items
+
+
+def get_rank_history():
+    """Return the rank history of today's database, a new one once the day changes."""
+    global rank_history
+    path = history_path(get_live_db_name())
+    if rank_history is None or rank_history.path != path:
+        rank_history = RankHistory(path)
+    return rank_history
+
+
+def fetch_trending_items(limit=PAGE_SIZE):
+    """
+    Fetch the stories climbing the front page fastest, biggest climb first.
+
+    Parameters:
+        limit (int): Maximum number of rows to return.
+
+    Returns:
+        list of dicts: Listing rows with the story's 'rank', 'previous_rank'
+        and 'gain' added. Stories not in the database yet are left out.
+    """
+    with timed("trending"):
+        rising = get_rank_history().rising(limit=limit)
+    if not rising:
+        return []
     conn = get_db_connection()
     cursor = conn.cursor()
-    if query:
+    cursor.execute(
+        f"""
+        SELECT {LISTING_COLUMNS}
+        FROM stories
+        WHERE id IN ({", ".join("?" * len(rising))})
+    """,
+        [story["id"] for story in rising],
+    )
+    rows = {row["id"]: row for row in cursor.fetchall()}
+    conn.close()
+    return [dict(rows[story["id"]], **story) for story in rising if story["id"] in rows]
+
+
+def record_story_interaction(story_id, kind):
+    """
+    Record a click on or a star of a story in the reader's profile.
+
+    Errors are logged, they never fail the request.
+
+    Parameters:
+        story_id (int): The story.
+        kind (str): 'click' or 'star'.
+    """
+    try:
+        conn = get_db_connection()
+        row = conn.execute("SELECT relevance_vector FROM stories WHERE id = ?", (story_id,)).fetchone()
+        conn.close()
+        record_interaction(story_id, kind, row["relevance_vector"] if row else None)
+    except sqlite3.Error as e:
+        print(f"Error recording {kind} of story ID {story_id}: {e}")
+        logging.error(f"Error recording {kind} of story ID {story_id}: {e}")
+
+
+def fetch_news_items(query=None, order_by=None, domain=None, stream=False):
+    """
+    Fetch news items from the database, optionally filtering by a search query or site.
+
+    order_by='relevance' returns the PAGE_SIZE stories most relevant to the
+    reader's clicks and stars, or the first PAGE_SIZE top stories while
+    there are none.
+
+    With stream=True an iterator over the rows is returned instead of a list,
+    and rows are read from the database only as it is consumed.
+    """
+    if order_by == "relevance":
+        news_items = fetch_relevant_items()
+        if news_items is not None:
+            return iter(news_items) if stream else news_items
+        # The first page of the top stories, not the whole table
+        return fetch_news_page(limit=PAGE_SIZE, stream=stream)
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    if domain:
         cursor.execute(
-            """
-            SELECT id, title, by, url, score, content, summary, priority 
+            f"""
+            SELECT {LISTING_COLUMNS}
+            FROM stories
+            WHERE domain = ?
+            ORDER BY priority DESC, score DESC
+        """,
+            (domain,),
+        )
+    elif query:
+        cursor.execute(
+            f"""
+            SELECT {LISTING_COLUMNS}
             FROM stories
             WHERE title LIKE ?
             ORDER BY priority DESC, score DESC
@@ -33,21 +300,387 @@ def fetch_news_items(query=None, order_by=None):
     else:
         if order_by:
             cursor.execute(f"""
-                SELECT id, title, by, url, score, content, summary, priority
+                SELECT {LISTING_COLUMNS}
                 FROM stories
                 ORDER BY {order_by} DESC, priority DESC, score DESC
             """)
         else:
-            cursor.execute("""
-                SELECT id, title, by, url, score, content, summary, priority
+            cursor.execute(f"""
+                SELECT {LISTING_COLUMNS}
                 FROM stories
                  ORDER BY priority DESC, score DESC
             """)
+    if stream:
+        return iter_rows(conn, cursor)
+    news_items = cursor.fetchall()
+    conn.close()
+    return news_items
+
+
+# Markers wrapped around matched terms in search snippets. They are control
+# characters so they cannot collide with article text, and the 'highlight'
+# template filter turns them into <mark> tags after escaping the snippet.
+HIGHLIGHT_START = "\x02"
+HIGHLIGHT_END = "\x03"
+
+
+def build_match_query(query):
+    """
+    Turn a free-text search into an FTS5 MATCH expression.
+
+    Every word is quoted so FTS5 operators in user input are taken literally.
+    A word ending in '*' becomes a prefix query, e.g. 'llam*'.
+
+    Parameters:
+        query (str): The search text entered by the user.
+
+    Returns:
+        str or None: The MATCH expression, or None if the query has no words.
+    """
+    terms = [
+        f'"{word}"{star}' for word, star in re.findall(r"(\w+)(\*?)", query or "")
+    ]
+    return " ".join(terms) or None
+
+
+def search_news_items(query, limit=PAGE_SIZE):
+    """
+    Search stories through the FTS5 index, best matches first.
+
+    Matches in the title weigh more than matches in the summary, which weigh
+    more than matches in the article text. Each row carries a short snippet
+    with the matched terms wrapped in HIGHLIGHT_START/HIGHLIGHT_END.
+
+    Parameters:
+        query (str): The search text entered by the user.
+        limit (int): Maximum number of rows to return.
+
+    Returns:
+        list of sqlite3.Row: The matching rows ordered by BM25 rank.
+    """
+    match = build_match_query(query)
+    if not match:
+        return fetch_news_items()
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            f"""
+            SELECT {LISTING_COLUMNS}, matches.snippet
+            FROM (
+                SELECT rowid,
+                    snippet(stories_fts, -1, ?, ?, '…', 16) AS snippet,
+                    bm25(stories_fts, 10.0, 1.0, 3.0) AS rank
+                FROM stories_fts
+                WHERE stories_fts MATCH ?
+                ORDER BY rank
+                LIMIT ?
+            ) AS matches
+            JOIN stories ON stories.id = matches.rowid
+            ORDER BY matches.rank
+        """,
+            (HIGHLIGHT_START, HIGHLIGHT_END, match, limit),
+        )
+        news_items = cursor.fetchall()
+    except sqlite3.OperationalError:
+        # Database created before the search index, the fetch agent builds it
+        # on its next run. Until then fall back to a title scan.
+        news_items = fetch_news_items(query=query)
+    finally:
+        conn.close()
+    return news_items
+
+
+def parse_cursor(after):
+    """
+    Parse a keyset cursor of the form 'priority,score,id'.
+
+    Parameters:
+        after (str): The cursor string from the query string.
+
+    Returns:
+        tuple or None: (priority, score, id) as integers, or None if invalid.
+    """
+    try:
+        priority, score, story_id = (int(part) for part in after.split(","))
+    except (AttributeError, ValueError):
+        return None
+    return priority, score, story_id
+
+
+def make_cursor(item):
+    """Build the keyset cursor pointing just past the given row."""
+    return f"{item['priority'] or 0},{item['score'] or 0},{item['id']}"
+
+
+def fetch_news_page(after=None, limit=PAGE_SIZE, stream=False):
+    """
+    Fetch one page of the top stories listing using keyset pagination.
+
+    Rows are ordered by (priority, score, id) descending, which is served
+    directly by the idx_stories_listing index.
+
+    Parameters:
+        after (tuple): (priority, score, id) of the last row of the previous page.
+        limit (int): Maximum number of rows to return.
+        stream (bool): Return an iterator reading rows lazily instead of a list.
+
+    Returns:
+        list of sqlite3.Row: The rows of the requested page.
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    if after:
+        cursor.execute(
+            f"""
+            SELECT {LISTING_COLUMNS}
+            FROM stories
+            WHERE (priority, score, id) < (?, ?, ?)
+            ORDER BY priority DESC, score DESC, id DESC
+            LIMIT ?
+        """,
+            (*after, limit),
+        )
+    else:
+        cursor.execute(
+            f"""
+            SELECT {LISTING_COLUMNS}
+            FROM stories
+            ORDER BY priority DESC, score DESC, id DESC
+            LIMIT ?
+        """,
+            (limit,),
+        )
+    if stream:
+        return iter_rows(conn, cursor)
     news_items = cursor.fetchall()
     conn.close()
     return news_items
 
 
+def parse_latest_cursor(after):
+    """
+    Parse a keyset cursor of the latest listing, of the form 'last_updated|id'.
+
+    Returns:
+        tuple or None: (last_updated, id), or None if invalid.
+    """
+    try:
+        last_updated, story_id = after.rsplit("|", 1)
+        return last_updated, int(story_id)
+    except (AttributeError, ValueError):
+        return None
+
+
+def make_latest_cursor(item):
+    """Build the latest listing cursor pointing just past the given row."""
+    return f"{item['last_updated'] or ''}|{item['id']}"
+
+
+def fetch_latest_page(after=None, limit=PAGE_SIZE, stream=False):
+    """
+    Fetch one page of the most recently updated stories using keyset pagination.
+
+    Rows are ordered by (last_updated, id) descending, which snapshots serve
+    from the idx_snapshot_latest index.
+
+    Parameters:
+        after (tuple): (last_updated, id) of the last row of the previous page.
+        limit (int): Maximum number of rows to return.
+        stream (bool): Return an iterator reading rows lazily instead of a list.
+
+    Returns:
+        list of sqlite3.Row: The rows of the requested page.
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    if after:
+        cursor.execute(
+            f"""
+            SELECT {LISTING_COLUMNS}
+            FROM stories
+            WHERE (last_updated, id) < (?, ?)
+            ORDER BY last_updated DESC, id DESC
+            LIMIT ?
+        """,
+            (*after, limit),
+        )
+    else:
+        cursor.execute(
+            f"""
+            SELECT {LISTING_COLUMNS}
+            FROM stories
+            ORDER BY last_updated DESC, id DESC
+            LIMIT ?
+        """,
+            (limit,),
+        )
+    if stream:
+        return iter_rows(conn, cursor)
+    news_items = cursor.fetchall()
+    conn.close()
+    return news_items
+
+
+def fetch_changes(since, limit=PAGE_SIZE):
+    """
+    Fetch stories written after a change-feed cursor, oldest change first.
+
+    Every write by the agents sets last_updated, so (last_updated, id) is a
+    monotonically increasing cursor over inserts and summary updates.
+
+    Parameters:
+        since (tuple): (last_updated, id) of the last change already seen.
+        limit (int): Maximum number of rows to return.
+
+    Returns:
+        list of sqlite3.Row: Listing columns plus summary for each changed story.
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute(
+        f"""
+        SELECT {LISTING_COLUMNS}, summary
+        FROM stories
+        WHERE (last_updated, id) > (?, ?)
+        ORDER BY last_updated, id
+        LIMIT ?
+    """,
+        (*since, limit),
+    )
+    changes = cursor.fetchall()
+    conn.close()
+    return changes
+
+
+def fetch_latest_change():
+    """Return the (last_updated, id) cursor of the most recent change, or ('', 0)."""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            """
+            SELECT last_updated, id
+            FROM stories
+            ORDER BY last_updated DESC, id DESC
+            LIMIT 1
+        """
+        )
+        row = cursor.fetchone()
+    except sqlite3.OperationalError:
+        row = None
+    finally:
+        conn.close()
+    return (row["last_updated"], row["id"]) if row else ("", 0)
+
+
+def fetch_story(story_id):
+    """
+    Fetch a single story with its content and summary, or None if it does not exist.
+
+    This is the one place the web app reads article text, which is
+    decompressed here.
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute(
+        """
+        SELECT id, title, by, url, content, summary, score, last_updated, priority
+        FROM stories
+        WHERE id = ?
+    """,
+        (story_id,),
+    )
+    news_item = cursor.fetchone()
+    conn.close()
+    if news_item is None:
+        return None
+    news_item = dict(news_item)
+    news_item["content"] = decompress_text(news_item["content"])
+    news_item["summary"] = decompress_text(news_item["summary"])
+    return news_item
+
+
+def fetch_comments(story_id, after=None, limit=COMMENT_PAGE_SIZE):
+    """
+    Fetch a page of a story's comments in thread order, their text decompressed.
+
+    Parameters:
+        story_id (int): The story.
+        after (str): Cursor of the page, the path of the previous page's last comment.
+        limit (int): Comments per page.
+
+    Returns:
+        tuple: (list of comment dicts, cursor of the next page or None). Databases
+        made before comments were fetched have none.
+    """
+    conn = get_db_connection()
+    try:
+        rows = fetch_comment_page(conn, story_id, after, limit)
+    except sqlite3.OperationalError:
+        rows = []
+    finally:
+        conn.close()
+    comments = []
+    for row in rows:
+        comment = dict(row)
+        comment["text"] = decompress_text(comment["text"])
+        comments.append(comment)
+    next_cursor = comments[-1]["path"] if len(comments) == limit else None
+    return comments, next_cursor
+
+
+class ListingPage:
+    def __init__(self, rows, limit=None, cursor=make_cursor):
+        """
+        Blacklist-filtered listing rows, read lazily while a page is rendered.
+
+        Iterating yields the rows that are not blacklisted. Once iteration is
+        done, 'shown' and 'next_cursor' describe the page, so templates
+        streamed with stream_template() check them after the listing loop.
+
+        Parameters:
+            rows (iterable): Listing rows, usually a streamed query.
+            limit (int): The page size the rows were fetched with, if paginated.
+            cursor (callable): Builds the cursor of the next page from the last row.
+        """
+        self.rows = rows
+        self.limit = limit
+        self.cursor = cursor
+        self.fetched = 0
+        self.shown = 0
+        self.last_row = None
+
+    def __iter__(self):
+        filtering = 0.0
+        try:
+            for row in self.rows:
+                self.fetched += 1
+                self.last_row = row
+                started = time.perf_counter()
+                blacklisted = blacklist.is_blacklisted(row["url"], row["title"])
+                filtering += time.perf_counter() - started
+                if blacklisted:
+                    continue
+                self.shown += 1
+                yield row
+        finally:
+            add_time("blacklist", filtering)
+
+    @property
+    def next_cursor(self):
+        """
+        Cursor of the next page, or None on the last page.
+
+        It comes from the last fetched row, not the last shown one, so
+        blacklisted rows at the end of a page are not fetched again.
+        """
+        if self.limit and self.fetched == self.limit:
+            return self.cursor(self.last_row)
+        return None
+
+
 def filter_news_items(news_items):
     """Filter news items based on the blacklist."""
     filtered_news = [
@@ -57,3 +690,76 @@ def filter_news_items(news_items):
     ]
     return filtered_news
 
+
+
+def refresh_title_index():
+    """
+    Bring the autocomplete title index up to date with the database.
+
+    Rows updated since the last refresh are read and merged into the index.
+    The index is rebuilt from scratch when the daily database changes. Run
+    by warm_caches() and the refresher thread, never by a request.
+    """
+    state = title_index_state
+    with title_index_refresh_lock:
+        db_name, _ = get_db_name()
+        if db_name != state["db_name"]:
+            title_index.clear()
+            state["db_name"] = db_name
+            state["last_updated"] = ""
+
+        conn = get_db_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(
+                """
+                SELECT id, title, url, score, last_updated
+                FROM stories
+                WHERE last_updated >= ?
+                ORDER BY last_updated
+            """,
+                (state["last_updated"],),
+            )
+            rows = cursor.fetchall()
+        except sqlite3.OperationalError:
+            # No stories table yet for today
+            return
+        finally:
+            conn.close()
+
+        if rows:
+            title_index.add_stories(
+                (row["id"], row["title"], row["score"])
+                for row in rows
+                if not blacklist.is_blacklisted(row["url"], row["title"])
+            )
+            state["last_updated"] = rows[-1]["last_updated"]
+
+
+def title_index_refresher_loop():
+    """Refresh the title index every TITLE_INDEX_REFRESH_INTERVAL seconds, in the background."""
+    while True:
+        try:
+            refresh_title_index()
+        except Exception as e:
+            logging.error(f"Error refreshing the title index: {e}")
+        time.sleep(TITLE_INDEX_REFRESH_INTERVAL)
+
+
+def start_title_index_refresher():
+    """
+    Start the background title index refresher once per process.
+
+    Like the Hugging Face refresher it is started from a request, so each
+    worker forked by a preloading server gets its own thread.
+    """
+    global title_index_refresher
+    if title_index_refresher is not None and title_index_refresher.is_alive():
+        return
+    with title_index_refresher_lock:
+        if title_index_refresher is not None and title_index_refresher.is_alive():
+            return
+        title_index_refresher = threading.Thread(
+            target=title_index_refresher_loop, name="title-index-refresher", daemon=True
+        )
+        title_index_refresher.start()
@@ -1,29 +1,190 @@
 # hf.py
 import os
 import sys
+import json
+import time
+import logging
+import tempfile
+import threading
 import requests
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from flask import Blueprint, render_template
+from flask import Blueprint, render_template, jsonify
 
 hf = Blueprint('huggingface', __name__)
 
+# Trending API, point it at /huggingface/stub/trending to run without network
+HF_TRENDING_URL = os.environ.get("HF_TRENDING_URL", "https://huggingface.co/api/trending")
+
+# Seconds between background refreshes of the trending list
+HF_CACHE_TTL = int(os.environ.get("HF_CACHE_TTL", 600))
+
+# Timeout in seconds for a single call to the trending API
+HF_TIMEOUT = float(os.environ.get("HF_TIMEOUT", 10))
+
+# Seconds before retrying after consecutive failed refreshes, the last one repeats
+HF_RETRY_DELAYS = (5, 10, 30)
+
+# Last good payload, so a restart serves the previous list straight away
+HF_CACHE_FILE = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '..', 'db', 'huggingface_trending.json')
+)
+
+# Trending items served to requests, replaced as a whole by the refresher
+trending_cache = {"items": [], "fetched_at": 0.0}
+refresher_lock = threading.Lock()
+refresher_thread = None
+# Set once the cache holds a list or the first refresh attempt is over
+first_fill = threading.Event()
+
+
+def parse_trending(payload):
+    """
+    Convert the trending API payload into the items shown on the page.
+
+    Parameters:
+        payload (dict): The JSON returned by the trending API.
+
+    Returns:
+        list of dict: Items with title, url, author, downloads and likes.
+    """
+    return [
+        {
+            "title": item["repoData"].get("title", "No Title"),
+            "url": f"https://huggingface.co/{item['repoData']['id']}",
+            "author": item["repoData"].get("author", "Unknown Author"),
+            "downloads": item["repoData"].get("downloads", 0),
+            "likes": item["repoData"].get("likes", 0)
+        }
+        for item in payload.get("recentlyTrending", [])
+    ]
+
+
+def load_cache_file():
+    """Load the last good trending list saved to disk, if any."""
+    try:
+        with open(HF_CACHE_FILE, "r") as f:
+            cached = json.load(f)
+        trending_cache.update(items=cached["items"], fetched_at=cached["fetched_at"])
+    except (OSError, ValueError, KeyError) as e:
+        logging.info(f"No usable Hugging Face cache file: {e}")
+
+
+def save_cache_file(items, fetched_at):
+    """
+    Write the trending list to disk, replacing the old file atomically.
+
+    Every worker process refreshes on its own, so each one writes its own
+    temporary file before renaming it over the cache file.
+    """
+    cache_dir = os.path.dirname(HF_CACHE_FILE)
+    tmp_file = None
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        with tempfile.NamedTemporaryFile(
+            "w", dir=cache_dir, prefix=os.path.basename(HF_CACHE_FILE) + ".", suffix=".tmp", delete=False
+        ) as f:
+            tmp_file = f.name
+            json.dump({"items": items, "fetched_at": fetched_at}, f)
+        os.replace(tmp_file, HF_CACHE_FILE)
+    except OSError as e:
+        logging.error(f"Error saving Hugging Face cache file: {e}")
+        if tmp_file and os.path.exists(tmp_file):
+            os.remove(tmp_file)
+
+
+def refresh_trending():
+    """
+    Fetch the trending list and replace the cache if the call succeeds.
+
+    On any failure the previous list stays in place.
+
+    Returns:
+        bool: True if the cache was refreshed, False otherwise.
+    """
+    try:
+        response = requests.get(HF_TRENDING_URL, timeout=HF_TIMEOUT)
+        if response.status_code != 200:
+            logging.error(f"Error fetching Hugging Face trending. Status Code: {response.status_code}")
+            return False
+        items = parse_trending(response.json())
+    except Exception as e:
+        logging.error(f"Exception while fetching Hugging Face trending: {e}")
+        return False
+
+    fetched_at = time.time()
+    trending_cache.update(items=items, fetched_at=fetched_at)
+    save_cache_file(items, fetched_at)
+    return True
+
+
+def refresher_loop():
+    """
+    Refresh the trending list every HF_CACHE_TTL seconds, in the background.
+
+    A failed refresh is retried after HF_RETRY_DELAYS, the last delay
+    repeating, until one succeeds.
+    """
+    failures = 0
+    while True:
+        age = time.time() - trending_cache["fetched_at"]
+        delay = max(HF_CACHE_TTL - age, 1)
+        if age >= HF_CACHE_TTL:
+            if refresh_trending():
+                failures = 0
+                delay = HF_CACHE_TTL
+            else:
+                delay = HF_RETRY_DELAYS[min(failures, len(HF_RETRY_DELAYS) - 1)]
+                failures += 1
+        first_fill.set()
+        time.sleep(delay)
+
+
+def start_refresher():
+    """
+    Start the background refresher once per process.
+
+    It is started from the first request rather than at import, so each
+    worker process forked by a preloading server gets its own thread.
+    """
+    global refresher_thread
+    with refresher_lock:
+        if refresher_thread is not None and refresher_thread.is_alive():
+            return
+        load_cache_file()
+        refresher_thread = threading.Thread(
+            target=refresher_loop, name="hf-trending-refresher", daemon=True
+        )
+        refresher_thread.start()
+
+
 @hf.route("/")
 def index():
-    response = requests.get("https://huggingface.co/api/trending")
-    if response.status_code == 200:
-        trending_items = response.json().get("recentlyTrending", [])
-        news_items = [
-            {
-                "title": item["repoData"].get("title", "No Title"),
-                "url": f"https://huggingface.co/{item['repoData']['id']}",
-                "author": item["repoData"].get("author", "Unknown Author"),
-                "downloads": item["repoData"].get("downloads", 0),
-                "likes": item["repoData"].get("likes", 0)
-            }
-            for item in trending_items
-        ]
-    else:
-        news_items = []
-
-    return render_template("huggingface.html", news_items=news_items)
\ No newline at end of file
+    start_refresher()
+    # Without a cache file the first requests wait for the first fetch,
+    # then show a loading page that retries if it is still running
+    if not first_fill.is_set():
+        first_fill.wait(HF_TIMEOUT)
+    items = trending_cache["items"]
+    return render_template("huggingface.html", news_items=items, loading=not first_fill.is_set())
+
+
+@hf.route("/stub/trending")
+def stub_trending():
+    """Local stand-in for the trending API, for tests and offline runs."""
+    return jsonify(
+        {
+            "recentlyTrending": [
+                {
+                    "repoData": {
+                        "id": f"example/model-{n}",
+                        "title": f"Example Model {n}",
+                        "author": "example",
+                        "downloads": 1000 * n,
+                        "likes": 10 * n,
+                    }
+                }
+                for n in range(1, 11)
+            ]
+        }
+    )
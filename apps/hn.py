@@ -1,56 +1,328 @@
 import os
 import sys
-from .common import get_db_connection, fetch_news_items, filter_news_items, blacklist
+import json
+import time
+import threading
+from .common import (
+    conditional,
+    fetch_news_items,
+    fetch_news_page,
+    fetch_latest_page,
+    fetch_story,
+    fetch_trending_items,
+    get_rank_history,
+    fetch_changes,
+    fetch_comments,
+    fetch_latest_change,
+    get_data_version,
+    search_news_items,
+    parse_cursor,
+    parse_latest_cursor,
+    make_latest_cursor,
+    record_story_interaction,
+    ListingPage,
+    start_title_index_refresher,
+    title_index,
+    blacklist,
+    PAGE_SIZE,
+)
+from lib.metrics import timed
+from lib.relevance import remove_interaction, starred_story_ids
+from lib.text_codec import decompress_text
 #sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from flask import Blueprint, render_template, request, abort
+from flask import (
+    Blueprint,
+    Response,
+    render_template,
+    stream_template,
+    request,
+    abort,
+    jsonify,
+    stream_with_context,
+)
 
 hn = Blueprint('rss', __name__)
 
+# Seconds between checks for new changes in an event stream
+EVENTS_POLL_INTERVAL = 2
+
+# Seconds of silence before a keep-alive comment is sent
+EVENTS_HEARTBEAT_INTERVAL = 15
+
+# Seconds before an event stream is closed, the browser then reconnects
+# with Last-Event-ID and carries on from where it left off
+EVENTS_MAX_DURATION = 600
+
+# Event streams one worker process serves at once. Each holds a worker
+# thread for up to EVENTS_MAX_DURATION, so this is half of gunicorn's
+# threads per worker (BN_THREADS) by default and the other half is left for
+# page requests; streams past it are answered with 503 and those readers fall
+# back to reloading the page. Live readers are capped at BN_WORKERS times
+# this, raise BN_THREADS (an idle stream costs a thread, not CPU) to serve more.
+MAX_EVENT_STREAMS = int(os.environ.get(
+    "BN_MAX_EVENT_STREAMS", max(1, int(os.environ.get("BN_THREADS", 8)) // 2)
+))
+
+# Milliseconds a client turned away is told to wait before reconnecting
+EVENTS_BUSY_RETRY = 30000
+
+event_stream_slots = threading.BoundedSemaphore(MAX_EVENT_STREAMS)
+
+def fetch_listing_page():
+    """
+    Fetch the page of top stories selected by the 'after' and 'start' query arguments.
+
+    Returns:
+        tuple: (ListingPage streaming the stories, rank of the first story).
+    """
+    after = request.args.get("after")
+    cursor = None
+    if after:
+        cursor = parse_cursor(after)
+        if cursor is None:
+            abort(400)
+    start = request.args.get("start", 1, type=int)
+
+    news_items = fetch_news_page(after=cursor, stream=True)
+    return ListingPage(news_items, limit=PAGE_SIZE), start
+
+
+# Listings are streamed: the page head and the first stories are sent while
+# later rows are still being read from the database.
+
 @hn.route("/")
+@conditional
 def index():
-    news_items = fetch_news_items()
-    filtered_news = filter_news_items(news_items)
-    return render_template("index.html", news_items=filtered_news)
+    news_items, start = fetch_listing_page()
+    return stream_template(
+        "index.html",
+        news_items=news_items,
+        start=start,
+        live="after" not in request.args,
+    )
 
 
 @hn.route("/latest")
+@conditional
 def latest():
-    news_items = fetch_news_items(order_by="last_updated")
-    filtered_news = filter_news_items(news_items)
-    return render_template("index.html", news_items=filtered_news)
+    after = request.args.get("after")
+    cursor = None
+    if after:
+        cursor = parse_latest_cursor(after)
+        if cursor is None:
+            abort(400)
+    news_items = fetch_latest_page(after=cursor, stream=True)
+    return stream_template(
+        "index.html",
+        news_items=ListingPage(news_items, limit=PAGE_SIZE, cursor=make_latest_cursor),
+        start=request.args.get("start", 1, type=int),
+        live="after" not in request.args,
+    )
+
+
+# Not conditional: the order follows the reader's clicks and stars, which
+# do not change the database's data version
+@hn.route("/relevant")
+def relevant():
+    news_items = fetch_news_items(order_by="relevance", stream=True)
+    return stream_template("index.html", news_items=ListingPage(news_items))
+
+
+# Not conditional either: the rank history is appended to without writing the database
+@hn.route("/trending")
+def trending():
+    news_items = fetch_trending_items()
+    return stream_template("index.html", news_items=ListingPage(news_items))
 
 
 @hn.route("/search")
+@conditional
 def search():
     query = request.args.get("q", "")
-    news_items = fetch_news_items(query=query)
-    filtered_news = filter_news_items(news_items)
-    return render_template("index.html", news_items=filtered_news, query=query)
+    news_items = search_news_items(query)
+    return stream_template("index.html", news_items=ListingPage(news_items), query=query)
+
+
+@hn.route("/from")
+@conditional
+def site():
+    domain = request.args.get("site", "")
+    news_items = fetch_news_items(domain=domain, stream=True)
+    return stream_template("index.html", news_items=ListingPage(news_items), site=domain)
+
+
+@hn.route("/autocomplete")
+def autocomplete():
+    query = request.args.get("q", "")
+    limit = max(1, min(request.args.get("limit", 10, type=int), 50))
+    # Only reads memory, the index is kept up to date by a background thread
+    start_title_index_refresher()
+    return jsonify(title_index.search(query, limit=limit))
 
 
 @hn.route("/show/<int:id>")
+@conditional
 def show(id):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        """
-        SELECT id, title, by, url, content, summary, score, last_updated, priority
-        FROM stories
-        WHERE id = ?
-    """,
-        (id,),
-    )
-    news_item = cursor.fetchone()
-    conn.close()
+    news_item = fetch_story(id)
 
     if news_item is None:
         # Story with the given ID does not exist
         abort(404)
 
     # Check if the story is blacklisted
-    if blacklist.is_blacklisted(news_item["url"], news_item["title"]):
+    with timed("blacklist"):
+        blacklisted = blacklist.is_blacklisted(news_item["url"], news_item["title"])
+    if blacklisted:
         abort(404)
 
-    return render_template("show.html", news_item=news_item)
+    comments, next_comments = fetch_comments(id, after=request.args.get("comments_after"))
+    return render_template(
+        "show.html",
+        news_item=news_item,
+        comments=comments,
+        next_comments=next_comments,
+        comments_paged="comments_after" in request.args,
+    )
+
 
+@hn.route("/api/stories")
+@conditional
+def api_stories():
+    news_items, _ = fetch_listing_page()
+    stories = [dict(item) for item in news_items]
+    return jsonify(
+        {
+            "stories": stories,
+            "next": news_items.next_cursor,
+        }
+    )
+
+
+@hn.route("/api/stories/<int:id>")
+@conditional
+def api_story(id):
+    news_item = fetch_story(id)
+    if news_item is None or blacklist.is_blacklisted(news_item["url"], news_item["title"]):
+        abort(404)
+    return jsonify(dict(news_item))
+
+
+# Clicks are posted by the story page once it is shown in a browser, so
+# cached revisits count and static exports, crawlers and prefetches do not
+@hn.route("/api/stories/<int:id>/click", methods=["POST"])
+def api_click(id):
+    """Record that a story was opened, it weighs in the relevance profile."""
+    record_story_interaction(id, "click")
+    return "", 204
+
+
+@hn.route("/api/stories/<int:id>/star", methods=["GET", "POST", "DELETE"])
+def api_star(id):
+    """Report, set or clear the star of a story, starred stories weigh most in the relevance profile."""
+    if request.method == "POST":
+        if id not in starred_story_ids():
+            record_story_interaction(id, "star")
+    elif request.method == "DELETE":
+        remove_interaction(id, "star")
+    return jsonify({"id": id, "starred": id in starred_story_ids()})
+
+
+@hn.route("/api/stories/<int:id>/ranks")
+def api_story_ranks(id):
+    """Report a story's front page rank and score over the day."""
+    points = get_rank_history().trajectory(id)
+    return jsonify(
+        {
+            "id": id,
+            "ranks": [{"time": timestamp, "rank": rank, "score": score} for timestamp, rank, score in points],
+        }
+    )
+
+
+def parse_event_id(event_id):
+    """
+    Parse a change-feed cursor sent back as Last-Event-ID, in the form 'last_updated|id'.
+
+    Returns:
+        tuple or None: (last_updated, id), or None if missing or invalid.
+    """
+    try:
+        last_updated, story_id = event_id.rsplit("|", 1)
+        return last_updated, int(story_id)
+    except (AttributeError, ValueError):
+        return None
+
+
+def format_event(row):
+    """Format a changed story as a server-sent event, 'summary' once it has one, else 'story'."""
+    data = dict(row)
+    data["summary"] = decompress_text(data["summary"])
+    event = "summary" if data["summary"] else "story"
+    if event == "story":
+        del data["summary"]
+    return (
+        f"id: {data['last_updated']}|{data['id']}\n"
+        f"event: {event}\n"
+        f"data: {json.dumps(data)}\n\n"
+    )
+
+
+@hn.route("/events")
+def events():
+    if not event_stream_slots.acquire(blocking=False):
+        return Response(
+            f"retry: {EVENTS_BUSY_RETRY}\n\n",
+            status=503,
+            mimetype="text/event-stream",
+            headers={"Retry-After": str(EVENTS_BUSY_RETRY // 1000), "Cache-Control": "no-cache"},
+        )
+    try:
+        response = event_stream_response()
+    except Exception:
+        event_stream_slots.release()
+        raise
+    # Released once the stream is closed, also when the client went away before it started
+    response.call_on_close(event_stream_slots.release)
+    return response
+
+
+def event_stream_response():
+    """Return the event stream of changes since the client's Last-Event-ID or 'since' cursor."""
+    since = parse_event_id(request.headers.get("Last-Event-ID") or request.args.get("since"))
+    if since is None:
+        since = fetch_latest_change()
+
+    def stream():
+        cursor = since
+        version = None
+        started = last_sent = time.monotonic()
+        yield "retry: 5000\n\n"
+
+        while time.monotonic() - started < EVENTS_MAX_DURATION:
+            # Only query the database when it has been written to
+            current_version = get_data_version()
+            if current_version != version:
+                version = current_version
+                changes = fetch_changes(cursor)
+                while changes:
+                    for row in changes:
+                        cursor = (row["last_updated"], row["id"])
+                        if blacklist.is_blacklisted(row["url"], row["title"]):
+                            continue
+                        yield format_event(row)
+                        last_sent = time.monotonic()
+                    if len(changes) < PAGE_SIZE:
+                        break
+                    changes = fetch_changes(cursor)
+
+            if time.monotonic() - last_sent >= EVENTS_HEARTBEAT_INTERVAL:
+                yield ": keep-alive\n\n"
+                last_sent = time.monotonic()
+            time.sleep(EVENTS_POLL_INTERVAL)
+
+    return Response(
+        stream_with_context(stream()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,247 @@
+"""
+Extraction benchmark of the tiered extractor against trafilatura's defaults.
+
+Runs every page of a saved HTML corpus through trafilatura.extract with its
+default settings (what the fetch agent used to do) and through
+lib.extraction.TieredExtractor, in corpus order so the per domain tier
+choice learns as it goes. Prints the extraction time per page, the tiers
+used and how closely the tiered text matches the default text.
+
+A corpus is a directory of .html files with an index.json mapping file
+names to their URLs. Build one from the stories of a database (downloads
+the pages) or generate an offline one:
+
+    python benchmarks/extract_bench.py --save-from-db db/hackernews_01_01_2025.db --limit 200
+    python benchmarks/extract_bench.py --generate 300
+    python benchmarks/extract_bench.py --json benchmarks/results/extract.jsonl
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import statistics
+from collections import Counter
+from urllib.parse import urlparse
+
+import requests
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(ROOT)
+
+from lib.domain import extract_main_domain  # noqa: E402
+from lib.extraction import TIERS, TieredExtractor, extract_tier  # noqa: E402
+from hn_standin import WORDS, sentence  # noqa: E402
+from fetch_bench import percentile, git_revision  # noqa: E402
+
+DEFAULT_CORPUS = os.path.join(ROOT, "benchmarks", "data", "html")
+
+# Tiered text whose word overlap F1 with the default text is below this counts as a mismatch
+PARITY_F1 = 0.9
+
+
+def load_corpus(corpus_dir):
+    """Return [(path, url)] of the pages of a corpus, in index order."""
+    index_file = os.path.join(corpus_dir, "index.json")
+    if os.path.exists(index_file):
+        with open(index_file) as f:
+            index = json.load(f)
+    else:
+        index = {name: f"https://{os.path.splitext(name)[0]}/" for name in sorted(os.listdir(corpus_dir))}
+    return [(os.path.join(corpus_dir, name), url) for name, url in index.items() if name.endswith(".html")]
+
+
+def write_corpus(corpus_dir, pages):
+    """Write [(name, url, html)] as a corpus."""
+    os.makedirs(corpus_dir, exist_ok=True)
+    index = {}
+    for name, url, html in pages:
+        with open(os.path.join(corpus_dir, name), "w", encoding="utf-8") as f:
+            f.write(html)
+        index[name] = url
+    with open(os.path.join(corpus_dir, "index.json"), "w") as f:
+        json.dump(index, f, indent=1)
+
+
+def save_from_db(corpus_dir, db_name, limit):
+    """Download the pages of the stories in a database into a corpus."""
+    import sqlite3
+
+    conn = sqlite3.connect(db_name)
+    urls = [row[0] for row in conn.execute(
+        "SELECT url FROM stories WHERE url IS NOT NULL ORDER BY id DESC LIMIT ?", (limit,)
+    )]
+    conn.close()
+    headers = {"User-Agent": "Mozilla/5.0 (compatible; BespokeNews extraction benchmark)"}
+    pages = []
+    for n, url in enumerate(urls):
+        try:
+            response = requests.get(url, headers=headers, timeout=10)
+        except requests.RequestException as e:
+            print(f"Skipping {url}: {e}")
+            continue
+        if response.status_code == 200 and "html" in response.headers.get("Content-Type", ""):
+            pages.append((f"{n:05d}.html", url, response.text))
+        print(f"\r{n + 1}/{len(urls)} downloaded", end="", flush=True)
+    print()
+    write_corpus(corpus_dir, pages)
+    return len(pages)
+
+
+def generate_page(rng, title):
+    """
+    Return a synthetic page in one of the layouts seen on linked sites.
+
+    Clean article markup, div soup without semantic tags, a short article
+    under a long comment thread and a teaser page with almost no text.
+    """
+    layout = rng.choices(["article", "divs", "comments", "teaser"], weights=[6, 2, 1, 1])[0]
+    paragraphs = [" ".join(sentence(rng) for _ in range(rng.randint(3, 8))) for _ in range(rng.randint(4, 20))]
+    nav = "".join(f'<li><a href="/section/{n}">{rng.choice(WORDS)}</a></li>' for n in range(12))
+    if layout == "article":
+        body = f"<main><article><h1>{title}</h1>{''.join(f'<p>{p}</p>' for p in paragraphs)}</article></main>"
+    elif layout == "divs":
+        body = (
+            f'<div class="wrap"><div class="hd">{title}</div><div class="c">'
+            + "".join(f'<div class="t">{p}<br><br></div>' for p in paragraphs)
+            + "</div></div>"
+        )
+    elif layout == "comments":
+        comments = "".join(
+            f'<div class="comment"><span>user{n}</span><p>{sentence(rng, 20)}</p></div>' for n in range(40)
+        )
+        body = (
+            f"<article><h1>{title}</h1><p>{paragraphs[0]}</p></article>"
+            f'<section id="comments">{comments}</section>'
+        )
+    else:
+        body = f"<article><h1>{title}</h1><p>{sentence(rng)}</p><a href='/subscribe'>Subscribe to read</a></article>"
+    return (
+        f"<!DOCTYPE html><html><head><meta charset=\"utf-8\"><title>{title}</title></head>"
+        f"<body><header><nav><ul>{nav}</ul></nav></header>{body}"
+        f"<footer><p>Copyright {rng.choice(WORDS)} inc.</p></footer></body></html>"
+    )
+
+
+def generate_corpus(corpus_dir, count, seed):
+    """Write a synthetic corpus of count pages spread over a few dozen sites."""
+    rng = random.Random(seed)
+    domains = [f"{rng.choice(WORDS)}{n}.example.com" for n in range(40)]
+    pages = []
+    for n in range(count):
+        # Each site sticks to one layout most of the time, like real sites
+        site_rng = random.Random(f"{seed}-{n % len(domains)}-{n // 50}")
+        title = sentence(rng, 6).rstrip(".")
+        pages.append((f"{n:05d}.html", f"https://{domains[n % len(domains)]}/{n}", generate_page(site_rng, title)))
+    write_corpus(corpus_dir, pages)
+    return count
+
+
+def word_f1(text, reference):
+    """Return the F1 of the word multisets of text against reference, 1.0 if both are empty."""
+    words, reference_words = Counter((text or "").split()), Counter((reference or "").split())
+    if not words and not reference_words:
+        return 1.0
+    overlap = sum((words & reference_words).values())
+    if not overlap:
+        return 0.0
+    precision = overlap / sum(words.values())
+    recall = overlap / sum(reference_words.values())
+    return 2 * precision * recall / (precision + recall)
+
+
+def run(pages, repeat=1):
+    """
+    Extract every page with trafilatura's defaults and with the tiered extractor.
+
+    Returns:
+        dict: Per page times in seconds, tiers used and word F1 against the default text.
+    """
+    stats_file = os.path.join(tempfile.mkdtemp(), "extraction_stats.json")
+    extractor = TieredExtractor(stats_file)
+    default_times, tiered_times, tiers, f1s, lost = [], [], Counter(), [], 0
+    for _ in range(repeat):
+        for path, url in pages:
+            with open(path, encoding="utf-8", errors="replace") as f:
+                html = f.read()
+            domain = extract_main_domain(url) or urlparse(url).netloc
+
+            started = time.perf_counter()
+            reference = extract_tier(html, url, "default")
+            default_times.append(time.perf_counter() - started)
+
+            started = time.perf_counter()
+            text, tier = extractor.extract(html, url, domain)
+            tiered_times.append(time.perf_counter() - started)
+
+            tiers[tier or "none"] += 1
+            f1s.append(word_f1(text, reference))
+            if reference and not text:
+                lost += 1
+    return {
+        "default_times": default_times, "tiered_times": tiered_times,
+        "tiers": tiers, "f1s": f1s, "lost": lost,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark tiered extraction against trafilatura's defaults.")
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS, help="Directory of saved HTML pages")
+    parser.add_argument("--save-from-db", default=None, help="Download the pages of this database's stories first")
+    parser.add_argument("--limit", type=int, default=200, help="Pages to download with --save-from-db")
+    parser.add_argument("--generate", type=int, default=0, help="Generate a synthetic corpus of this many pages first")
+    parser.add_argument("--seed", type=int, default=1, help="Seed for --generate")
+    parser.add_argument("--repeat", type=int, default=1, help="Passes over the corpus")
+    parser.add_argument("--json", default=None, help="Append the result as a JSON line to this file")
+    args = parser.parse_args()
+
+    if args.save_from_db:
+        print(f"Saved {save_from_db(args.corpus, args.save_from_db, args.limit)} pages to {args.corpus}")
+    elif args.generate:
+        print(f"Generated {generate_corpus(args.corpus, args.generate, args.seed)} pages in {args.corpus}")
+    if not os.path.isdir(args.corpus):
+        print(f"No corpus in {args.corpus}, build one with --save-from-db or --generate.")
+        return 1
+
+    pages = load_corpus(args.corpus)
+    result = run(pages, repeat=args.repeat)
+
+    def summary(times):
+        return {
+            "mean_ms": statistics.mean(times) * 1000,
+            "p50_ms": statistics.median(times) * 1000,
+            "p95_ms": percentile(times, 0.95) * 1000,
+        }
+
+    f1s = result["f1s"]
+    record = {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "revision": git_revision(),
+        "pages": len(f1s),
+        "default": summary(result["default_times"]),
+        "tiered": summary(result["tiered_times"]),
+        "tiers": {tier: result["tiers"][tier] for tier in (*TIERS, "none") if result["tiers"][tier]},
+        "mean_f1": statistics.mean(f1s),
+        "below_parity": sum(f1 < PARITY_F1 for f1 in f1s),
+        "lost": result["lost"],
+    }
+
+    print(f"{record['pages']} pages from {args.corpus}")
+    print(f"{'extractor':<10} {'mean ms':>8} {'p50 ms':>8} {'p95 ms':>8}")
+    for name in ("default", "tiered"):
+        stats = record[name]
+        print(f"{name:<10} {stats['mean_ms']:>8.2f} {stats['p50_ms']:>8.2f} {stats['p95_ms']:>8.2f}")
+    print("tiers used: " + ", ".join(f"{tier} {count}" for tier, count in record["tiers"].items()))
+    print(f"text parity with the default: mean word F1 {record['mean_f1']:.3f}, "
+          f"{record['below_parity']} pages below {PARITY_F1}, {record['lost']} pages lost")
+
+    if args.json:
+        os.makedirs(os.path.dirname(os.path.abspath(args.json)), exist_ok=True)
+        with open(args.json, "a") as f:
+            f.write(json.dumps(record) + "\n")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
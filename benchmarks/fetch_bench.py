@@ -0,0 +1,192 @@
+"""
+End-to-end benchmark of the fetch agent against the local HN stand-in.
+
+Starts benchmarks/hn_standin.py in a subprocess and runs the fetch agent's
+main() in this process against it, with a fresh database in a temporary
+directory. Nothing goes to the network. Prints stories/sec, p50/p95 per
+stage and peak RSS, and with --json appends the result as one JSON line so
+runs can be compared over time.
+
+    python benchmarks/fetch_bench.py --stories 300 --latency-ms 80 --json benchmarks/results/fetch.jsonl
+"""
+import io
+import os
+import sys
+import json
+import time
+import socket
+import sqlite3
+import argparse
+import resource
+import tempfile
+import subprocess
+import contextlib
+import statistics
+import urllib.request
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(ROOT)
+sys.path.append(os.path.join(ROOT, 'agents'))
+
+# Benchmark runs stay out of the real runs ledger
+os.environ.setdefault("BN_RUNS_DB", os.path.join(tempfile.gettempdir(), "bn_benchmark_runs.db"))
+os.environ.setdefault("BN_EXTRACTION_STATS", os.path.join(tempfile.gettempdir(), "bn_benchmark_extraction.json"))
+
+import concurrent_hn_topnews_fetch as agent  # noqa: E402
+from hn_standin import add_corpus_arguments  # noqa: E402
+
+# Stage name -> (agent attribute, what it covers)
+STAGES = {
+    "item": ("fetch_story_details", "HN item API call"),
+    "article": ("extract_content", "article download and extraction"),
+    "save": ("save_story", "database insert"),
+    "snapshot": ("publish_snapshot", "read snapshot publish"),
+}
+
+
+def free_port():
+    """Return a TCP port that is free right now."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_until_ready(api_url, timeout=30):
+    """Poll topstories.json until the stand-in answers, or raise after timeout seconds."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(api_url + "/topstories.json", timeout=1):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"Stand-in at {api_url} did not start")
+
+
+def timed(function, samples):
+    """Wrap function so the duration of every call is appended to samples."""
+
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            samples.append(time.perf_counter() - started)
+
+    return wrapper
+
+
+def percentile(values, fraction):
+    """Return the value at the given fraction of the sorted values."""
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def git_revision():
+    """Return the short commit hash of the tree being measured, or None."""
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_agent(api_url, work_dir):
+    """
+    Run the fetch agent once against api_url with its database in work_dir.
+
+    Returns:
+        dict: Wall time, stage samples and the number of stories and articles stored.
+    """
+    db_name = os.path.join(work_dir, "db", "hackernews_bench.db")
+    os.makedirs(os.path.dirname(db_name), exist_ok=True)
+
+    samples = {stage: [] for stage in STAGES}
+    originals = {name: getattr(agent, name) for name, _ in STAGES.values()}
+    for stage, (name, _) in STAGES.items():
+        setattr(agent, name, timed(originals[name], samples[stage]))
+    agent.HN_API_URL = api_url
+    agent.get_database_name = lambda: db_name
+
+    cwd = os.getcwd()
+    os.chdir(work_dir)
+    started = time.perf_counter()
+    try:
+        # The agent prints every ID and a progress bar
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+            agent.main()
+    finally:
+        elapsed = time.perf_counter() - started
+        os.chdir(cwd)
+        for name, function in originals.items():
+            setattr(agent, name, function)
+
+    conn = sqlite3.connect(db_name)
+    stored, with_content = conn.execute("SELECT count(*), sum(has_content) FROM stories").fetchone()
+    conn.close()
+    return {"elapsed": elapsed, "samples": samples, "stored": stored, "with_content": with_content or 0}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the fetch agent against a local HN stand-in.")
+    add_corpus_arguments(parser)
+    parser.add_argument("--json", default=None, help="Append the result as a JSON line to this file")
+    args = parser.parse_args()
+
+    port = free_port()
+    api_url = f"http://127.0.0.1:{port}/v0"
+    command = [sys.executable, os.path.join(ROOT, "benchmarks", "hn_standin.py"), "--port", str(port)]
+    for option in ("stories", "seed", "article_kb", "error_rate", "latency_ms", "jitter_ms", "api_latency_ms",
+                   "max_comments"):
+        command += ["--" + option.replace("_", "-"), str(getattr(args, option))]
+    server = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    try:
+        wait_until_ready(api_url)
+        with tempfile.TemporaryDirectory() as work_dir:
+            result = run_agent(api_url, work_dir)
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+    rss_peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    stages = {}
+    for stage, values in result["samples"].items():
+        if values:
+            stages[stage] = {
+                "calls": len(values),
+                "p50_ms": statistics.median(values) * 1000,
+                "p95_ms": percentile(values, 0.95) * 1000,
+            }
+
+    record = {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "revision": git_revision(),
+        "params": {key: value for key, value in vars(args).items() if key != "json"},
+        "elapsed_s": result["elapsed"],
+        "stories_per_s": result["stored"] / result["elapsed"],
+        "stored": result["stored"],
+        "with_content": result["with_content"],
+        "stages": stages,
+        # ru_maxrss is in KiB on Linux
+        "rss_before_mb": rss_before / 1024,
+        "rss_peak_mb": rss_peak / 1024,
+    }
+
+    print(f"{record['stored']} stories stored ({record['with_content']} with content) "
+          f"in {record['elapsed_s']:.1f}s, {record['stories_per_s']:.1f} stories/s")
+    print(f"{'stage':<10} {'calls':>6} {'p50 ms':>8} {'p95 ms':>8}  covers")
+    for stage, stats in stages.items():
+        print(f"{stage:<10} {stats['calls']:>6} {stats['p50_ms']:>8.1f} {stats['p95_ms']:>8.1f}  {STAGES[stage][1]}")
+    print(f"peak RSS {record['rss_peak_mb']:.0f} MB (before run {record['rss_before_mb']:.0f} MB)")
+
+    if args.json:
+        os.makedirs(os.path.dirname(os.path.abspath(args.json)), exist_ok=True)
+        with open(args.json, "a") as f:
+            f.write(json.dumps(record) + "\n")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
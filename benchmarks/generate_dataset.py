@@ -0,0 +1,179 @@
+"""
+Fill a stories database with generated stories for load testing the web app.
+
+Titles, URLs, authors, scores, articles and summaries are generated from a
+seed with realistic shapes: HN style titles, a long tail of domains,
+Pareto scores and log-normal article lengths. The database gets the fetch
+agent's schema, search index and compressed content, and its read snapshot
+is published like after a fetch run. Serve it with BN_DB=<path>.
+
+    python benchmarks/generate_dataset.py --stories 50000 --db benchmarks/data/stories.db
+"""
+import io
+import os
+import sys
+import random
+import argparse
+import contextlib
+from datetime import datetime, timedelta
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(ROOT)
+sys.path.append(os.path.join(ROOT, 'agents'))
+
+import concurrent_hn_topnews_fetch as fetch_agent  # noqa: E402
+from lib.relevance import relevance_vector  # noqa: E402
+from lib.snapshot import publish_snapshot  # noqa: E402
+from lib.text_codec import compress_text  # noqa: E402
+from hn_standin import sentence  # noqa: E402
+
+DEFAULT_DB = os.path.join(ROOT, "benchmarks", "data", "stories.db")
+
+# Rows inserted per transaction
+BATCH_SIZE = 1000
+
+INSERT = """
+    INSERT INTO stories (id, title, by, score, url, content, summary, priority, last_updated, domain,
+        has_content, relevance_vector)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+SUBJECTS = [
+    "Rust", "Python", "SQLite", "Postgres", "Linux", "WebAssembly", "LLM", "GPU", "Kubernetes",
+    "Zig", "Go", "TypeScript", "React", "Emacs", "Vim", "FreeBSD", "RISC-V", "Raspberry Pi",
+    "OpenAI", "Llama", "Apple", "Google", "Mozilla", "Firefox", "Chrome", "Docker", "Nix",
+]
+THINGS = [
+    "compiler", "database", "garbage collector", "scheduler", "text editor", "file system",
+    "browser engine", "allocator", "search engine", "protocol", "terminal", "game engine",
+    "inference server", "tokenizer", "static site generator", "query planner",
+]
+TEMPLATES = [
+    "Show HN: {a} {thing} written in {b}",
+    "Ask HN: How do you use {a} for your {thing}?",
+    "{a} {version} released",
+    "Why {a} is faster than {b} for {thing} workloads",
+    "Building a {thing} in {a}",
+    "The hidden cost of {a} {thing}s",
+    "{a} now supports {b}",
+    "Lessons from running {a} in production",
+    "A deep dive into the {a} {thing}",
+    "{a} vs. {b}: a {thing} benchmark",
+]
+TLDS = ["com", "org", "io", "dev", "net", "co.uk", "github.io", "substack.com"]
+
+# Article and summary text, subjects and things are mentioned separately so
+# a search term matches a realistic share of the stories, not all of them
+BODY_WORDS = (
+    "the a of and to in for with on is that by from this we our how why what it was are be "
+    "has have had not but or as at an which their they you can will more one all about would "
+    "there been when who were after also new other than time first into people them some could "
+    "year only over its most work years use used using way make made many then these like just "
+    "data code team users results problem approach change version support build performance "
+    "memory network storage design release project feature issue cost faster slower bug fix "
+    "test tests server client request latency throughput library framework language hardware "
+    "research paper model system process service tool tools update updates security company"
+).split()
+
+
+def make_domains(rng, count=2000):
+    """Return site domains, the first ones get the most stories."""
+    return [
+        f"{rng.choice(SUBJECTS).lower().replace(' ', '')}{rng.choice(['', 'blog', 'news', 'labs'])}{n}.{rng.choice(TLDS)}"
+        for n in range(count)
+    ]
+
+
+def make_title(rng):
+    """Return an HN style title."""
+    return rng.choice(TEMPLATES).format(
+        a=rng.choice(SUBJECTS), b=rng.choice(SUBJECTS), thing=rng.choice(THINGS),
+        version=f"{rng.randint(0, 9)}.{rng.randint(0, 30)}",
+    )
+
+
+def make_article(rng, title, words):
+    """Return article text of about the given number of words mentioning the title."""
+    paragraphs = [title + ". " + sentence(rng, 20, BODY_WORDS)]
+    count = len(paragraphs[0].split())
+    while count < words:
+        paragraph = " ".join(sentence(rng, vocabulary=BODY_WORDS) for _ in range(rng.randint(3, 8)))
+        if rng.random() < 0.1:
+            paragraph += f" {rng.choice(SUBJECTS)} {rng.choice(THINGS)}."
+        paragraphs.append(paragraph)
+        count += len(paragraph.split())
+    return "\n\n".join(paragraphs)
+
+
+def generate_stories(count, seed=1, article_words=600, content_rate=0.85, summary_rate=0.7):
+    """
+    Yield story rows in the column order of INSERT.
+
+    Parameters:
+        count (int): Number of stories.
+        seed (int): Seed for everything generated.
+        article_words (int): Median article length in words.
+        content_rate (float): Fraction of stories with an extracted article.
+        summary_rate (float): Fraction of articles with a summary.
+    """
+    rng = random.Random(seed)
+    domains = make_domains(rng)
+    start = datetime(2025, 1, 1, 6, 0, 0)
+    for n in range(count):
+        story_id = 40000000 + n
+        title = make_title(rng)
+        domain = domains[min(int(rng.expovariate(1 / 200)), len(domains) - 1)]
+        url = f"https://{domain}/{title.lower().replace(' ', '-')[:60]}" if rng.random() > 0.05 else None
+        content = summary = None
+        if url and rng.random() < content_rate:
+            content = make_article(rng, title, int(rng.lognormvariate(0, 0.7) * article_words))
+            if rng.random() < summary_rate:
+                summary = title + ". " + " ".join(sentence(rng, 15, BODY_WORDS) for _ in range(3))
+        last_updated = start + timedelta(seconds=n * 86400 / count)
+        yield (
+            story_id, title, f"user{int(rng.paretovariate(1.1)) % 20000}",
+            min(int(rng.paretovariate(1.3) * 5), 5000), url,
+            compress_text(content), summary, 1 if rng.random() < 0.05 else 0,
+            last_updated.strftime("%Y-%m-%d %H:%M:%S"),
+            fetch_agent.extract_main_domain(url) if url else None, bool(content),
+            relevance_vector(title, summary),
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a stories database for load testing.")
+    parser.add_argument("--stories", type=int, default=50000, help="Number of stories")
+    parser.add_argument("--db", default=DEFAULT_DB, help="Database to create, replaced if it exists")
+    parser.add_argument("--article-words", type=int, default=600, help="Median article length in words")
+    parser.add_argument("--seed", type=int, default=1, help="Seed for the generated stories")
+    args = parser.parse_args()
+
+    db_name = os.path.abspath(args.db)
+    os.makedirs(os.path.dirname(db_name), exist_ok=True)
+    if os.path.exists(db_name):
+        os.remove(db_name)
+
+    fetch_agent.get_database_name = lambda: db_name
+    with contextlib.redirect_stdout(io.StringIO()):
+        conn = fetch_agent.create_database()
+
+    rows = []
+    for row in generate_stories(args.stories, seed=args.seed, article_words=args.article_words):
+        rows.append(row)
+        if len(rows) == BATCH_SIZE:
+            conn.executemany(INSERT, rows)
+            conn.commit()
+            rows = []
+            print(f"\r{row[0] - 40000000 + 1} stories", end="", flush=True)
+    if rows:
+        conn.executemany(INSERT, rows)
+        conn.commit()
+    conn.close()
+
+    snapshot = publish_snapshot(db_name)
+    print(f"\rGenerated {args.stories} stories in {db_name} ({os.path.getsize(db_name) / 1e6:.0f} MB)")
+    print(f"Serve it with BN_DB={db_name}, the web app reads the snapshot {snapshot}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,262 @@
+"""
+Local stand-in for the Hacker News API and the sites its stories link to.
+
+Serves /v0/topstories.json and /v0/item/<id>.json like the Firebase API, and
+a synthetic article for every story at /article/<id>. Articles and comment
+threads are generated from the story ID and the seed, so a run is
+reproducible without storing a corpus, and latency, errors, article sizes
+and thread sizes are configurable.
+
+    python benchmarks/hn_standin.py --port 8085 --stories 500 --latency-ms 50
+    HN_API_URL=http://127.0.0.1:8085/v0 python agents/concurrent_hn_topnews_fetch.py
+"""
+import json
+import time
+import random
+import argparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# First story ID handed out, close to the real HN IDs
+FIRST_ID = 41000000
+
+# First comment ID, comments of a story get a block of max_comments IDs
+FIRST_COMMENT_ID = 42000000
+
+WORDS = (
+    "rust python sqlite postgres kernel linux compiler database startup model "
+    "inference gpu cache latency browser protocol open source release security "
+    "memory allocator network storage cluster scheduler benchmark language "
+    "design system hardware chip energy research paper team product launch "
+    "the a of and to in for with on is that by from this we our how why what"
+).split()
+
+
+def sentence(rng, words=12, vocabulary=WORDS):
+    """Return a pseudo-English sentence of about the given number of words."""
+    text = " ".join(rng.choice(vocabulary) for _ in range(rng.randint(words // 2, words * 2)))
+    return text.capitalize() + "."
+
+
+class Corpus:
+    def __init__(self, stories=500, seed=1, article_kb=12, error_rate=0.02,
+                 no_url_rate=0.05, latency_ms=0, jitter_ms=0, api_latency_ms=0, max_comments=0):
+        """
+        A deterministic set of stories and the articles they link to.
+
+        Parameters:
+            stories (int): Number of IDs in topstories.json.
+            seed (int): Seed for everything generated.
+            article_kb (float): Median article size in KiB, sizes are log-normal around it.
+            error_rate (float): Fraction of articles answering 500.
+            no_url_rate (float): Fraction of stories without a URL (Ask HN).
+            latency_ms (float): Base response time of article requests.
+            jitter_ms (float): Extra random article latency, exponentially distributed.
+            api_latency_ms (float): Response time of the API endpoints.
+            max_comments (int): Most comments in a story's thread, sizes are Pareto distributed.
+        """
+        self.stories = stories
+        self.seed = seed
+        self.article_kb = article_kb
+        self.error_rate = error_rate
+        self.no_url_rate = no_url_rate
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.api_latency_ms = api_latency_ms
+        self.max_comments = max_comments
+        self.base_url = ""
+        self.threads = {}
+
+    def rng(self, story_id, salt=0):
+        """Return the random generator for one story."""
+        return random.Random(self.seed * 1000003 + story_id * 7 + salt)
+
+    def top_stories(self):
+        """Return the story IDs in rank order."""
+        return list(range(FIRST_ID, FIRST_ID + self.stories))
+
+    def thread(self, story_id):
+        """
+        Return the comments of a story as {id: item}, the story's replies under the story ID.
+
+        Each comment replies to the story or to a random earlier comment,
+        recent ones more likely, which gives threads a few levels deep.
+        """
+        if story_id not in self.threads:
+            rng = self.rng(story_id, salt=3)
+            count = min(self.max_comments, int(rng.paretovariate(1.0) * 5) - 5) if self.max_comments else 0
+            first_id = FIRST_COMMENT_ID + (story_id - FIRST_ID) * self.max_comments
+            now = int(time.time())
+            comments, kids = {}, {story_id: []}
+            for n in range(count):
+                comment_id = first_id + n
+                parent = story_id if n == 0 or rng.random() < 0.3 else first_id + rng.randint(max(0, n - 20), n - 1)
+                kids[parent].append(comment_id)
+                kids[comment_id] = []
+                comments[comment_id] = {
+                    "id": comment_id,
+                    "type": "comment",
+                    "by": f"user{rng.randint(1, 5000)}",
+                    "parent": parent,
+                    "time": now - rng.randint(0, 86400),
+                    "text": f"<p>{sentence(rng, 20)}<p>{sentence(rng, 10)} &amp; more",
+                }
+            for comment_id, comment in comments.items():
+                if kids[comment_id]:
+                    comment["kids"] = kids[comment_id]
+            self.threads[story_id] = (comments, kids[story_id])
+        return self.threads[story_id]
+
+    def item(self, story_id):
+        """Return the API item for a story or comment ID, or None if it is not in the corpus."""
+        if self.max_comments and FIRST_COMMENT_ID <= story_id < FIRST_COMMENT_ID + self.stories * self.max_comments:
+            parent_story = FIRST_ID + (story_id - FIRST_COMMENT_ID) // self.max_comments
+            return self.thread(parent_story)[0].get(story_id)
+        if not FIRST_ID <= story_id < FIRST_ID + self.stories:
+            return None
+        rng = self.rng(story_id)
+        item = {
+            "id": story_id,
+            "type": "story",
+            "by": f"user{rng.randint(1, 5000)}",
+            "score": int(rng.paretovariate(1.2) * 10),
+            "time": int(time.time()) - rng.randint(0, 86400),
+            "title": sentence(rng, 6).rstrip("."),
+        }
+        comments, kids = self.thread(story_id)
+        item["descendants"] = len(comments)
+        if kids:
+            item["kids"] = kids
+        if rng.random() >= self.no_url_rate:
+            item["url"] = f"{self.base_url}/article/{story_id}"
+        else:
+            item["text"] = sentence(rng, 30)
+        return item
+
+    def article(self, story_id):
+        """
+        Return (status, html) for the article of a story.
+        """
+        rng = self.rng(story_id, salt=1)
+        if rng.random() < self.error_rate:
+            return 500, "<html><body>Internal Server Error</body></html>"
+
+        target = int(rng.lognormvariate(0, 0.6) * self.article_kb * 1024)
+        title = self.item(story_id)["title"]
+        paragraphs = []
+        size = 0
+        while size < target:
+            paragraph = " ".join(sentence(rng) for _ in range(rng.randint(3, 8)))
+            paragraphs.append(f"<p>{paragraph}</p>")
+            size += len(paragraph) + 7
+        nav = "".join(f'<li><a href="/section/{n}">{rng.choice(WORDS)}</a></li>' for n in range(12))
+        html = (
+            f"<!DOCTYPE html><html><head><meta charset=\"utf-8\"><title>{title}</title></head>"
+            f"<body><header><nav><ul>{nav}</ul></nav></header>"
+            f"<main><article><h1>{title}</h1>{''.join(paragraphs)}</article></main>"
+            f"<footer><p>Copyright {rng.choice(WORDS)} inc.</p></footer></body></html>"
+        )
+        return 200, html
+
+    def article_delay(self, story_id):
+        """Seconds to wait before answering an article request."""
+        rng = self.rng(story_id, salt=2)
+        jitter = rng.expovariate(1 / self.jitter_ms) if self.jitter_ms else 0
+        return (self.latency_ms + jitter) / 1000
+
+
+def make_handler(corpus):
+    """Return a request handler class serving the corpus."""
+
+    class StandinHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def send(self, status, body, content_type):
+            data = body.encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            path = self.path.split("?", 1)[0]
+            if path.startswith("/v0/"):
+                time.sleep(corpus.api_latency_ms / 1000)
+            if path == "/v0/topstories.json":
+                self.send(200, json.dumps(corpus.top_stories()), "application/json")
+            elif path.startswith("/v0/item/") and path.endswith(".json"):
+                try:
+                    item = corpus.item(int(path[len("/v0/item/"):-len(".json")]))
+                except ValueError:
+                    item = None
+                self.send(200, json.dumps(item), "application/json")
+            elif path.startswith("/article/"):
+                try:
+                    story_id = int(path[len("/article/"):])
+                except ValueError:
+                    self.send(404, "Not Found", "text/plain")
+                    return
+                time.sleep(corpus.article_delay(story_id))
+                status, html = corpus.article(story_id)
+                self.send(status, html, "text/html; charset=utf-8")
+            else:
+                self.send(404, "Not Found", "text/plain")
+
+        def log_message(self, format, *args):
+            pass
+
+    return StandinHandler
+
+
+def serve(corpus, host="127.0.0.1", port=8085):
+    """
+    Create the stand-in server. Call serve_forever() on it to run it.
+
+    Returns:
+        ThreadingHTTPServer: The server, bound to host and port.
+    """
+    server = ThreadingHTTPServer((host, port), make_handler(corpus))
+    server.daemon_threads = True
+    corpus.base_url = f"http://{host}:{server.server_address[1]}"
+    return server
+
+
+def add_corpus_arguments(parser):
+    """Add the Corpus options to an argparse parser."""
+    parser.add_argument("--stories", type=int, default=500, help="Stories in topstories.json")
+    parser.add_argument("--seed", type=int, default=1, help="Seed for the generated corpus")
+    parser.add_argument("--article-kb", type=float, default=12, help="Median article size in KiB")
+    parser.add_argument("--error-rate", type=float, default=0.02, help="Fraction of articles answering 500")
+    parser.add_argument("--latency-ms", type=float, default=50, help="Base article latency")
+    parser.add_argument("--jitter-ms", type=float, default=50, help="Mean extra article latency")
+    parser.add_argument("--api-latency-ms", type=float, default=10, help="Latency of the API endpoints")
+    parser.add_argument("--max-comments", type=int, default=0, help="Most comments in a story's thread")
+
+
+def corpus_from_args(args):
+    """Build a Corpus from parsed add_corpus_arguments options."""
+    return Corpus(
+        stories=args.stories, seed=args.seed, article_kb=args.article_kb,
+        error_rate=args.error_rate, latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms, api_latency_ms=args.api_latency_ms,
+        max_comments=args.max_comments,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a local stand-in for the HN API and article sites.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8085)
+    add_corpus_arguments(parser)
+    args = parser.parse_args()
+
+    server = serve(corpus_from_args(args), args.host, args.port)
+    print(f"Serving {args.stories} stories, HN_API_URL=http://{args.host}:{server.server_address[1]}/v0")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
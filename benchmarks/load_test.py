@@ -0,0 +1,268 @@
+"""
+Load test the web app with a realistic mix of readers.
+
+Every simulated reader loops over requests picked from MIX (front page,
+latest, search and story pages) for --duration seconds. Throughput, latency
+percentiles and error rates are printed per endpoint and overall. Story IDs
+and search terms come from the database being served, see
+benchmarks/generate_dataset.py to make a large one.
+
+With --start the app is started under gunicorn on the given database. With
+--baseline the result is compared with the checked-in numbers and the exit
+status is 1 on a regression, --save-baseline records new numbers. The
+baseline file holds one result per --scenario: 'daily' is a day's worth of
+stories under 50 readers, 'large' the generated 50000 stories under 200.
+
+    python benchmarks/generate_dataset.py --stories 50000
+    python benchmarks/load_test.py --start --db benchmarks/data/stories.db --clients 200 \\
+        --workers 2 --scenario large --baseline benchmarks/baselines/load_test.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import signal
+import sqlite3
+import argparse
+import platform
+import threading
+import tempfile
+import subprocess
+import statistics
+import urllib.error
+import urllib.request
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(ROOT)
+
+from lib.blacklist import get_blacklist  # noqa: E402
+from lib.snapshot import snapshot_path  # noqa: E402
+from serve_compare import wait_until_healthy  # noqa: E402
+from generate_dataset import DEFAULT_DB, SUBJECTS, THINGS  # noqa: E402
+
+DEFAULT_BASELINE = os.path.join(ROOT, "benchmarks", "baselines", "load_test.json")
+
+# (endpoint, path template, share of requests)
+MIX = [
+    ("top", "/hackernews/", 0.40),
+    ("latest", "/hackernews/latest", 0.20),
+    ("search", "/hackernews/search?q={query}", 0.15),
+    ("show", "/hackernews/show/{id}", 0.25),
+]
+
+# Relative slowdown of p95 or throughput, and absolute rise in error rate,
+# tolerated before a result counts as a regression
+TOLERANCE = 0.25
+ERROR_TOLERANCE = 0.01
+
+
+def load_targets(db_name, limit=5000):
+    """
+    Return story IDs to request and search queries, read from the database served.
+
+    Blacklisted stories are left out, readers only reach the ones the listings show.
+    """
+    blacklist = get_blacklist()
+    snapshot = snapshot_path(db_name)
+    conn = sqlite3.connect(snapshot if os.path.exists(snapshot) else db_name)
+    rows = conn.execute("SELECT id, url, title FROM stories ORDER BY random() LIMIT ?", (limit,))
+    ids = [story_id for story_id, url, title in rows if not blacklist.is_blacklisted(url, title)]
+    conn.close()
+    queries = [subject.lower().replace(" ", "+") for subject in SUBJECTS]
+    queries += [f"{subject.lower()}+{thing.split()[0]}" for subject in SUBJECTS[:8] for thing in THINGS[:4]]
+    return ids, queries
+
+
+def pick_path(rng, ids, queries):
+    """Return (endpoint, path) of the next request of a reader."""
+    endpoint, template, _ = rng.choices(MIX, weights=[share for _, _, share in MIX])[0]
+    return endpoint, template.format(id=rng.choice(ids), query=rng.choice(queries))
+
+
+def reader(base_url, ids, queries, seed, deadline, results):
+    """Send requests until the deadline, appending (endpoint, seconds, ok) to results."""
+    rng = random.Random(seed)
+    while time.monotonic() < deadline:
+        endpoint, path = pick_path(rng, ids, queries)
+        request = urllib.request.Request(base_url + path, headers={"Accept-Encoding": "gzip"})
+        started = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request, timeout=60) as response:
+                response.read()
+                ok = response.status == 200
+        except (OSError, urllib.error.HTTPError):
+            ok = False
+        results.append((endpoint, time.perf_counter() - started, ok))
+
+
+def run_load(base_url, ids, queries, clients, duration, seed=1):
+    """
+    Run clients readers for duration seconds.
+
+    Returns:
+        list: (endpoint, seconds, ok) for every request.
+    """
+    results = []
+    deadline = time.monotonic() + duration
+    threads = [
+        threading.Thread(target=reader, args=(base_url, ids, queries, seed + n, deadline, results))
+        for n in range(clients)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def summarize(results, duration):
+    """Return throughput, latency percentiles in ms and error rate, per endpoint and overall."""
+    summary = {}
+    groups = {endpoint: [] for endpoint, _, _ in MIX}
+    for result in results:
+        groups[result[0]].append(result)
+    groups["all"] = results
+    for endpoint, group in groups.items():
+        if len(group) < 2:
+            continue
+        latencies = sorted(seconds * 1000 for _, seconds, _ in group)
+        quantiles = statistics.quantiles(latencies, n=100)
+        summary[endpoint] = {
+            "requests": len(group),
+            "rps": round(len(group) / duration, 2),
+            "p50": round(quantiles[49], 1),
+            "p95": round(quantiles[94], 1),
+            "p99": round(quantiles[98], 1),
+            "error_rate": round(sum(1 for _, _, ok in group if not ok) / len(group), 4),
+        }
+    return summary
+
+
+def compare(summary, baseline):
+    """Return a list of regressions of summary against a baseline summary."""
+    regressions = []
+    for endpoint, base in baseline.items():
+        current = summary.get(endpoint)
+        if current is None:
+            regressions.append(f"{endpoint}: no requests")
+            continue
+        if current["p95"] > base["p95"] * (1 + TOLERANCE):
+            regressions.append(f"{endpoint}: p95 {current['p95']:.0f} ms, baseline {base['p95']:.0f} ms")
+        if current["rps"] < base["rps"] * (1 - TOLERANCE):
+            regressions.append(f"{endpoint}: {current['rps']:.1f} req/s, baseline {base['rps']:.1f} req/s")
+        if current["error_rate"] > base["error_rate"] + ERROR_TOLERANCE:
+            regressions.append(
+                f"{endpoint}: error rate {current['error_rate']:.1%}, baseline {base['error_rate']:.1%}"
+            )
+    return regressions
+
+
+def start_server(db_name, port, workers, threads):
+    """Start gunicorn serving db_name and wait until it is healthy."""
+    env = dict(
+        os.environ, BN_DB=db_name, BN_BIND=f"127.0.0.1:{port}",
+        BN_WORKERS=str(workers), BN_THREADS=str(threads),
+        # Story views are recorded as clicks, keep them out of the reader's profile
+        BN_PROFILE_DB=os.path.join(tempfile.gettempdir(), "bn_load_test_profile.db"),
+    )
+    server = subprocess.Popen(
+        ["gunicorn", "-c", "gunicorn.conf.py", "bn_app:app"], cwd=ROOT, env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        wait_until_healthy(f"http://127.0.0.1:{port}", timeout=60)
+    except RuntimeError:
+        server.kill()
+        raise
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the web app with a realistic request mix.")
+    parser.add_argument("--db", default=DEFAULT_DB, help="Database served, read for story IDs")
+    parser.add_argument("--base-url", default="http://127.0.0.1:5000", help="App to test unless --start")
+    parser.add_argument("--start", action="store_true", help="Start gunicorn on --db and test it")
+    parser.add_argument("--port", type=int, default=5056, help="Port for --start")
+    parser.add_argument("--workers", type=int, default=4, help="gunicorn workers for --start")
+    parser.add_argument("--threads", type=int, default=8, help="gunicorn threads per worker for --start")
+    parser.add_argument("--clients", type=int, default=200, help="Concurrent readers")
+    parser.add_argument("--duration", type=float, default=60, help="Seconds to measure")
+    parser.add_argument("--warmup", type=float, default=5, help="Seconds of load before measuring")
+    parser.add_argument("--scenario", default="large", help="Name of the result in the baseline file")
+    parser.add_argument("--baseline", default=None, help="Compare with this baseline file")
+    parser.add_argument("--save-baseline", action="store_true", help="Store the result in the baseline file")
+    args = parser.parse_args()
+
+    db_name = os.path.abspath(args.db)
+    if not os.path.exists(db_name):
+        print(f"Database {db_name} does not exist, generate it with benchmarks/generate_dataset.py")
+        return 1
+    ids, queries = load_targets(db_name)
+
+    server = None
+    base_url = args.base_url
+    if args.start:
+        server = start_server(db_name, args.port, args.workers, args.threads)
+        base_url = f"http://127.0.0.1:{args.port}"
+    try:
+        if args.warmup:
+            run_load(base_url, ids, queries, min(args.clients, 16), args.warmup, seed=10**6)
+        results = run_load(base_url, ids, queries, args.clients, args.duration)
+    finally:
+        if server:
+            server.send_signal(signal.SIGTERM)
+            server.wait(timeout=60)
+
+    summary = summarize(results, args.duration)
+    print(f"{len(ids)} story IDs, {args.clients} clients for {args.duration:g}s against {base_url}")
+    print(f"{'endpoint':<8} {'requests':>9} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    for endpoint, stats in summary.items():
+        print(
+            f"{endpoint:<8} {stats['requests']:>9} {stats['rps']:>8.1f} {stats['p50']:>8.1f} "
+            f"{stats['p95']:>8.1f} {stats['p99']:>8.1f} {stats['error_rate']:>7.1%}"
+        )
+
+    baseline_file = args.baseline or DEFAULT_BASELINE
+    status = 0
+    if args.baseline:
+        with open(baseline_file, "r") as f:
+            baseline = json.load(f).get(args.scenario)
+        if baseline is None:
+            print(f"No '{args.scenario}' scenario in {baseline_file}")
+            status = 1
+        else:
+            regressions = compare(summary, baseline["results"])
+            for regression in regressions:
+                print(f"REGRESSION {regression}")
+            if regressions:
+                status = 1
+            else:
+                print(f"Within {TOLERANCE:.0%} of the '{args.scenario}' baseline")
+
+    if args.save_baseline:
+        baselines = {}
+        if os.path.exists(baseline_file):
+            with open(baseline_file, "r") as f:
+                baselines = json.load(f)
+        with sqlite3.connect(db_name) as conn:
+            stories = conn.execute("SELECT count(*) FROM stories").fetchone()[0]
+        baselines[args.scenario] = {
+            "recorded": time.strftime("%Y-%m-%d"),
+            "machine": f"{platform.machine()}, {os.cpu_count()} CPU, Python {platform.python_version()}",
+            "stories": stories,
+            "clients": args.clients,
+            "duration": args.duration,
+            "server": f"gunicorn {args.workers} workers x {args.threads} threads" if args.start else base_url,
+            "results": summary,
+        }
+        os.makedirs(os.path.dirname(baseline_file), exist_ok=True)
+        with open(baseline_file, "w") as f:
+            json.dump(baselines, f, indent=2)
+            f.write("\n")
+        print(f"Saved the '{args.scenario}' baseline to {baseline_file}")
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,228 @@
+"""
+Ollama-compatible stub that simulates the cost of a model instead of running one.
+
+Answers POST /api/chat (and /api/generate) with a canned summary after the time
+a real model would take: the prompt is evaluated at --prefill-tps tokens/s
+plus a quadratic attention term, and the summary is generated at --gen-tps
+tokens/s. Only --parallel requests run at once, like OLLAMA_NUM_PARALLEL, and
+running requests share the generation speed. Prompts longer than --num-ctx
+tokens are truncated as Ollama does. --time-scale shrinks every delay, so a
+benchmark can simulate hours of model time in minutes. GET /stub/queue returns
+how long each request waited for a slot since the last call.
+
+    python benchmarks/ollama_stub.py --port 11435 --gen-tps 40 --parallel 4
+    BN_OLLAMA_URL=http://127.0.0.1:11435 python agents/concurrent_generate_ai_summary.py
+"""
+import json
+import time
+import argparse
+import threading
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Rough characters per token for English text
+CHARS_PER_TOKEN = 4
+
+
+class CostModel:
+    def __init__(self, prefill_tps=600, gen_tps=40, num_ctx=2048, summary_tokens=180,
+                 quadratic_ms=0.0005, load_ms=50, parallel=1, batch_efficiency=0.7,
+                 time_scale=1.0):
+        """
+        Simulated model timings.
+
+        Parameters:
+            prefill_tps (float): Prompt evaluation speed in tokens/s.
+            gen_tps (float): Generation speed of a single request in tokens/s.
+            num_ctx (int): Context length, longer prompts are truncated.
+            summary_tokens (int): Tokens generated per summary.
+            quadratic_ms (float): Extra prompt cost in ms per token squared (attention).
+            load_ms (float): Fixed overhead per request.
+            parallel (int): Requests processed at once, the rest wait in a queue.
+            batch_efficiency (float): Aggregate generation speed grows as
+                active ** batch_efficiency, so 1.0 is perfect batching.
+            time_scale (float): Multiplier applied to every simulated delay.
+        """
+        self.prefill_tps = prefill_tps
+        self.gen_tps = gen_tps
+        self.num_ctx = num_ctx
+        self.summary_tokens = summary_tokens
+        self.quadratic_ms = quadratic_ms
+        self.load_ms = load_ms
+        self.parallel = parallel
+        self.batch_efficiency = batch_efficiency
+        self.time_scale = time_scale
+        self.slots = threading.Semaphore(parallel)
+        self.active = 0
+        self.active_lock = threading.Lock()
+        # Simulated seconds every request waited for a slot, see take_queue_waits
+        self.queue_waits = []
+
+    def prompt_tokens(self, text):
+        """Return the prompt tokens evaluated for a text, after truncation to num_ctx."""
+        return min(len(text) // CHARS_PER_TOKEN + 1, self.num_ctx - self.summary_tokens)
+
+    def duration(self, prompt_tokens, active):
+        """
+        Return (prompt seconds, generation seconds) of a request with active
+        requests running at the same time, in simulated (unscaled) time.
+        """
+        prompt = prompt_tokens / self.prefill_tps + (prompt_tokens ** 2) * self.quadratic_ms / 1000
+        speed = self.gen_tps * active ** self.batch_efficiency / active
+        return self.load_ms / 1000 + prompt, self.summary_tokens / speed
+
+    def run(self, text):
+        """
+        Wait as long as the model would take for a prompt, queueing for a slot.
+
+        Returns:
+            dict: prompt_eval_count, eval_count and the durations in ns, like Ollama reports them.
+        """
+        queued = time.perf_counter()
+        with self.slots:
+            started = time.perf_counter()
+            with self.active_lock:
+                self.active += 1
+                active = self.active
+                self.queue_waits.append((started - queued) / self.time_scale)
+            try:
+                tokens = self.prompt_tokens(text)
+                prompt_s, gen_s = self.duration(tokens, active)
+                time.sleep((prompt_s + gen_s) * self.time_scale)
+            finally:
+                with self.active_lock:
+                    self.active -= 1
+        finished = time.perf_counter()
+        return {
+            "prompt_eval_count": tokens,
+            "eval_count": self.summary_tokens,
+            "prompt_eval_duration": int(prompt_s * 1e9),
+            "eval_duration": int(gen_s * 1e9),
+            "load_duration": int(self.load_ms * 1e6),
+            # Not an Ollama field, the time spent waiting for a slot
+            "queue_duration": int((started - queued) / self.time_scale * 1e9),
+            "total_duration": int((finished - queued) / self.time_scale * 1e9),
+        }
+
+    def take_queue_waits(self):
+        """Return the queue waits recorded so far, in simulated seconds, and clear them."""
+        with self.active_lock:
+            waits, self.queue_waits = self.queue_waits, []
+        return waits
+
+
+def make_summary(text, tokens):
+    """Build a summary of about the given number of tokens out of the prompt's own words."""
+    words = text.split()
+    return " ".join(words[-tokens * CHARS_PER_TOKEN // 6:]) or "Summary."
+
+
+def make_handler(model):
+    """Return a request handler class answering Ollama API calls with the cost model."""
+
+    class OllamaStubHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def send_json(self, status, payload):
+            data = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path in ("/", "/api/version"):
+                self.send_json(200, {"version": "stub"})
+            elif self.path == "/stub/queue":
+                self.send_json(200, {"queue_waits": model.take_queue_waits()})
+            else:
+                self.send_json(404, {"error": "not found"})
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            try:
+                request = json.loads(self.rfile.read(length) or b"{}")
+            except ValueError:
+                self.send_json(400, {"error": "invalid JSON"})
+                return
+
+            if self.path == "/api/chat":
+                text = "\n".join(message.get("content", "") for message in request.get("messages", []))
+            elif self.path == "/api/generate":
+                text = request.get("prompt", "")
+            else:
+                self.send_json(404, {"error": "not found"})
+                return
+
+            stats = model.run(text)
+            summary = make_summary(text, model.summary_tokens)
+            payload = {
+                "model": request.get("model", "stub"),
+                "created_at": datetime.now(timezone.utc).isoformat(),
+                "done": True,
+                "done_reason": "stop",
+                **stats,
+            }
+            if self.path == "/api/chat":
+                payload["message"] = {"role": "assistant", "content": summary}
+            else:
+                payload["response"] = summary
+            self.send_json(200, payload)
+
+        def log_message(self, format, *args):
+            pass
+
+    return OllamaStubHandler
+
+
+def serve(model, host="127.0.0.1", port=11435):
+    """
+    Create the stub server. Call serve_forever() on it to run it.
+
+    Returns:
+        ThreadingHTTPServer: The server, bound to host and port.
+    """
+    server = ThreadingHTTPServer((host, port), make_handler(model))
+    server.daemon_threads = True
+    return server
+
+
+def add_model_arguments(parser):
+    """Add the CostModel options to an argparse parser."""
+    parser.add_argument("--prefill-tps", type=float, default=600, help="Prompt tokens evaluated per second")
+    parser.add_argument("--gen-tps", type=float, default=40, help="Tokens generated per second per request")
+    parser.add_argument("--num-ctx", type=int, default=2048, help="Context length in tokens")
+    parser.add_argument("--summary-tokens", type=int, default=180, help="Tokens per summary")
+    parser.add_argument("--parallel", type=int, default=4, help="Requests the model serves at once")
+    parser.add_argument("--batch-efficiency", type=float, default=0.7,
+                        help="Aggregate speed grows as active**this, 1.0 is perfect batching")
+    parser.add_argument("--time-scale", type=float, default=1.0, help="Multiplier for every simulated delay")
+
+
+def model_from_args(args):
+    """Build a CostModel from parsed add_model_arguments options."""
+    return CostModel(
+        prefill_tps=args.prefill_tps, gen_tps=args.gen_tps, num_ctx=args.num_ctx,
+        summary_tokens=args.summary_tokens, parallel=args.parallel,
+        batch_efficiency=args.batch_efficiency, time_scale=args.time_scale,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve an Ollama-compatible stub with a simulated cost model.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    add_model_arguments(parser)
+    args = parser.parse_args()
+
+    server = serve(model_from_args(args), args.host, args.port)
+    print(f"Serving the Ollama stub, BN_OLLAMA_URL=http://{args.host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Compare the Flask development server with the production gunicorn setup.
+
+Both servers are started on the same stories database, each is driven with
+the same request mix and concurrency, and throughput and latency are printed
+side by side. Seed a database first (the fetch agent, or a generated one).
+
+    python benchmarks/serve_compare.py --requests 2000 --concurrency 32
+"""
+import os
+import sys
+import time
+import signal
+import argparse
+import subprocess
+import statistics
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# URL paths requested in turn by the load generator
+DEFAULT_PATHS = ["/hackernews/", "/hackernews/latest", "/hackernews/search?q=ai"]
+
+SERVERS = {
+    "flask dev": ["flask", "--app", "bn_app", "run", "--port", "{port}", "--with-threads"],
+    "gunicorn": ["gunicorn", "-c", "gunicorn.conf.py", "--bind", "127.0.0.1:{port}", "bn_app:app"],
+}
+
+
+def wait_until_healthy(base_url, timeout=30):
+    """Poll /healthz until the server answers, or raise after timeout seconds."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(base_url + "/healthz", timeout=1) as response:
+                if response.status == 200:
+                    return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"Server at {base_url} did not become healthy")
+
+
+def timed_get(url):
+    """GET a URL and return (seconds, ok)."""
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(url, timeout=30) as response:
+            response.read()
+            ok = response.status == 200
+    except OSError:
+        ok = False
+    return time.perf_counter() - started, ok
+
+
+def run_load(base_url, paths, total_requests, concurrency):
+    """
+    Send total_requests GETs cycling through paths with the given concurrency.
+
+    Returns:
+        dict: Requests per second, latency percentiles in ms and error count.
+    """
+    urls = [base_url + paths[n % len(paths)] for n in range(total_requests)]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(timed_get, urls))
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(seconds * 1000 for seconds, _ in results)
+    quantiles = statistics.quantiles(latencies, n=100)
+    return {
+        "rps": total_requests / elapsed,
+        "p50": quantiles[49],
+        "p95": quantiles[94],
+        "p99": quantiles[98],
+        "errors": sum(1 for _, ok in results if not ok),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the dev server against gunicorn.")
+    parser.add_argument("--requests", type=int, default=1000, help="Requests per server")
+    parser.add_argument("--concurrency", type=int, default=16, help="Concurrent clients")
+    parser.add_argument("--port", type=int, default=5055, help="Port to start the servers on")
+    args = parser.parse_args()
+
+    base_url = f"http://127.0.0.1:{args.port}"
+    results = {}
+
+    for name, command in SERVERS.items():
+        command = [part.format(port=args.port) for part in command]
+        server = subprocess.Popen(
+            command, cwd=ROOT,
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        try:
+            wait_until_healthy(base_url)
+            # Warm up caches and connections before measuring
+            run_load(base_url, DEFAULT_PATHS, args.concurrency * 2, args.concurrency)
+            results[name] = run_load(base_url, DEFAULT_PATHS, args.requests, args.concurrency)
+        finally:
+            server.send_signal(signal.SIGTERM)
+            server.wait(timeout=30)
+
+    print(f"{'server':<12} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    for name, result in results.items():
+        print(
+            f"{name:<12} {result['rps']:>8.1f} {result['p50']:>8.1f} "
+            f"{result['p95']:>8.1f} {result['p99']:>8.1f} {result['errors']:>7}"
+        )
+
+
+if __name__ == "__main__":
+    sys.exit(main())
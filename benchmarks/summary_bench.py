@@ -0,0 +1,217 @@
+"""
+Summarization throughput benchmark against the simulated Ollama server.
+
+Seeds a database with stories of realistic length, starts
+benchmarks/ollama_stub.py in a subprocess and runs the summary agent's main()
+on a fresh copy of the database for every worker count in --workers. Prints
+summaries/min, how long stories wait for their summary, how long requests
+queue inside the model server and the worker count where throughput stops
+growing. Times are reported in simulated model time, i.e. divided by
+--time-scale.
+
+    python benchmarks/summary_bench.py --stories 200 --workers 1,2,4,8,16 --parallel 4
+"""
+import io
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import sqlite3
+import argparse
+import tempfile
+import subprocess
+import urllib.request
+import contextlib
+import statistics
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(ROOT)
+sys.path.append(os.path.join(ROOT, 'agents'))
+
+# Benchmark runs stay out of the real runs ledger
+os.environ.setdefault("BN_RUNS_DB", os.path.join(tempfile.gettempdir(), "bn_benchmark_runs.db"))
+
+import concurrent_generate_ai_summary as agent  # noqa: E402
+import concurrent_hn_topnews_fetch as fetch_agent  # noqa: E402
+from hn_standin import sentence  # noqa: E402
+from ollama_stub import add_model_arguments  # noqa: E402
+from fetch_bench import free_port, percentile, git_revision  # noqa: E402
+
+# A worker count is past saturation when the next one adds less than this
+SATURATION_GAIN = 1.05
+
+
+def seed_database(db_name, stories, article_words, seed):
+    """
+    Create a stories database with content but no summaries.
+
+    Article lengths are log-normal around article_words, like real articles.
+    """
+    fetch_agent.get_database_name = lambda: db_name
+    with contextlib.redirect_stdout(io.StringIO()):
+        conn = fetch_agent.create_database()
+    rng = random.Random(seed)
+    for n in range(stories):
+        words = int(rng.lognormvariate(0, 0.7) * article_words)
+        paragraphs = []
+        while sum(len(p.split()) for p in paragraphs) < words:
+            paragraphs.append(" ".join(sentence(rng) for _ in range(rng.randint(3, 8))))
+        fetch_agent.save_story(conn, {
+            "id": n + 1,
+            "title": sentence(rng, 6).rstrip("."),
+            "by": f"user{n % 50}",
+            "score": rng.randint(1, 500),
+            "url": f"https://example.com/{n + 1}",
+            "content": "\n\n".join(paragraphs),
+            "priority": 0,
+            "last_updated": "2025-01-01 00:00:00",
+            "domain": "example.com",
+        })
+    conn.close()
+
+
+def run_agent(db_name, workers):
+    """
+    Run the summary agent once on db_name with the given worker count.
+
+    Returns:
+        dict: Wall time, per story wait/request times and the number of summaries stored.
+    """
+    waits, requests = [], []
+    process_story = agent.process_story
+    generate_summary = agent.generate_summary
+
+    def timed_process_story(story):
+        waits.append(time.perf_counter() - started)
+        return process_story(story)
+
+    def timed_generate_summary(content):
+        request_started = time.perf_counter()
+        try:
+            return generate_summary(content)
+        finally:
+            requests.append(time.perf_counter() - request_started)
+
+    agent.process_story = timed_process_story
+    agent.generate_summary = timed_generate_summary
+    agent.get_database_name = lambda: db_name
+    agent.SUMMARY_WORKERS = workers
+
+    cwd = os.getcwd()
+    os.chdir(os.path.dirname(os.path.dirname(db_name)))
+    started = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+            agent.main()
+    finally:
+        elapsed = time.perf_counter() - started
+        os.chdir(cwd)
+        agent.process_story = process_story
+        agent.generate_summary = generate_summary
+
+    conn = sqlite3.connect(db_name)
+    summaries = conn.execute("SELECT count(*) FROM stories WHERE summary IS NOT NULL").fetchone()[0]
+    conn.close()
+    # Story n waits waits[n] for a worker, then requests[n] for Ollama
+    latencies = [wait + request for wait, request in zip(sorted(waits), sorted(requests))]
+    return {"elapsed": elapsed, "requests": requests, "latencies": latencies, "summaries": summaries}
+
+
+def take_queue_waits(base_url):
+    """Return the seconds requests queued for a model slot since the last call, from the stub."""
+    with urllib.request.urlopen(f"{base_url}/stub/queue", timeout=10) as response:
+        return json.load(response)["queue_waits"] or [0.0]
+
+
+def saturation_point(results):
+    """Return the first worker count after which throughput grows by less than SATURATION_GAIN."""
+    for current, following in zip(results, results[1:]):
+        if following["summaries_per_min"] < current["summaries_per_min"] * SATURATION_GAIN:
+            return current["workers"]
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the summary agent against a simulated Ollama.")
+    parser.add_argument("--stories", type=int, default=200, help="Stories waiting for a summary")
+    parser.add_argument("--article-words", type=int, default=900, help="Median article length in words")
+    parser.add_argument("--workers", default="1,2,4,8,16", help="Comma separated worker counts to sweep")
+    parser.add_argument("--seed", type=int, default=1, help="Seed for the generated articles")
+    parser.add_argument("--json", default=None, help="Append the result as a JSON line to this file")
+    add_model_arguments(parser)
+    parser.set_defaults(time_scale=0.02)
+    args = parser.parse_args()
+
+    port = free_port()
+    command = [sys.executable, os.path.join(ROOT, "benchmarks", "ollama_stub.py"), "--port", str(port)]
+    for option in ("prefill_tps", "gen_tps", "num_ctx", "summary_tokens", "parallel", "batch_efficiency", "time_scale"):
+        command += ["--" + option.replace("_", "-"), str(getattr(args, option))]
+    server = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    agent.OLLAMA_URL = f"http://127.0.0.1:{port}"
+    scale = args.time_scale
+
+    results = []
+    try:
+        with tempfile.TemporaryDirectory() as work_dir:
+            os.makedirs(os.path.join(work_dir, "db"))
+            seeded = os.path.join(work_dir, "db", "seeded.db")
+            seed_database(seeded, args.stories, args.article_words, args.seed)
+            # The stub takes a moment to bind, seeding usually covers it
+            time.sleep(0.5)
+
+            for workers in [int(value) for value in args.workers.split(",")]:
+                db_name = os.path.join(work_dir, "db", f"workers_{workers}.db")
+                shutil.copy(seeded, db_name)
+                take_queue_waits(agent.OLLAMA_URL)
+                run = run_agent(db_name, workers)
+                # The stub reports simulated time already
+                queue_waits = take_queue_waits(agent.OLLAMA_URL)
+                elapsed = run["elapsed"] / scale
+                results.append({
+                    "workers": workers,
+                    "summaries": run["summaries"],
+                    "summaries_per_min": run["summaries"] / elapsed * 60,
+                    "request_p50_s": statistics.median(run["requests"]) / scale,
+                    "request_p95_s": percentile(run["requests"], 0.95) / scale,
+                    "latency_p50_s": statistics.median(run["latencies"]) / scale,
+                    "latency_p95_s": percentile(run["latencies"], 0.95) / scale,
+                    "queue_p50_s": statistics.median(queue_waits),
+                    "queue_p95_s": percentile(queue_waits, 0.95),
+                    "elapsed_s": elapsed,
+                })
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+
+    print(f"{args.stories} stories, median {args.article_words} words, model: {args.gen_tps:g} tok/s, "
+          f"{args.parallel} parallel, num_ctx {args.num_ctx} (simulated time)")
+    print(f"{'workers':>7} {'done':>5} {'sum/min':>8} {'req p50 s':>10} {'req p95 s':>10} "
+          f"{'queue p95 s':>12} {'wait p50 s':>11} {'wait p95 s':>11}")
+    for result in results:
+        print(
+            f"{result['workers']:>7} {result['summaries']:>5} {result['summaries_per_min']:>8.1f} "
+            f"{result['request_p50_s']:>10.1f} {result['request_p95_s']:>10.1f} {result['queue_p95_s']:>12.1f} "
+            f"{result['latency_p50_s']:>11.0f} {result['latency_p95_s']:>11.0f}"
+        )
+    saturation = saturation_point(results)
+    if saturation:
+        print(f"Throughput saturates at {saturation} workers")
+    else:
+        print("Throughput did not saturate, try more workers")
+
+    if args.json:
+        os.makedirs(os.path.dirname(os.path.abspath(args.json)), exist_ok=True)
+        with open(args.json, "a") as f:
+            f.write(json.dumps({
+                "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "revision": git_revision(),
+                "params": {key: value for key, value in vars(args).items() if key != "json"},
+                "results": results,
+                "saturation_workers": saturation,
+            }) + "\n")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,11 +1,13 @@
-from flask import Flask, render_template, request, abort, redirect, url_for
+from flask import Flask, Response, render_template, request, abort, redirect, url_for, jsonify, g
+from flask import before_render_template, template_rendered
 from markdown import markdown
-from markupsafe import Markup  # Updated import
+from markupsafe import Markup, escape  # Updated import
 import bleach
 import sqlite3
+import time
 from datetime import datetime
-import tldextract
 import logging
+import gc
 import sys
 import signal
 import atexit
@@ -16,12 +18,16 @@ from apps.hn import hn
 from apps.hf import hf
 
 
-# Import the Blacklist class from the lib.blacklist module
-from lib.blacklist import Blacklist
+# Import the shared Blacklist from the lib.blacklist module
+from lib.blacklist import get_blacklist
 from lib.html_cleaner import html_cleaner
+from lib.domain import extract_main_domain
+from lib.compression import compress_response
+from lib.metrics import timed, add_time, start_request, finish_request, end_request, render_metrics
+from apps.common import HIGHLIGHT_START, HIGHLIGHT_END, get_db_connection, refresh_title_index
 
-# Initialize the Blacklist in the app's global context
-blacklist = Blacklist(blacklist_files=["config/blacklist.txt", "config/blacklist_urls.txt"])
+# Use the shared Blacklist in the app's global context
+blacklist = get_blacklist()
 
 # Create a filter class to exclude static file requests
 class NoStaticFilter(logging.Filter):
@@ -70,30 +76,10 @@ def signal_handler(sig, frame):
 signal.signal(signal.SIGINT, signal_handler)
 
 
-def extract_main_domain(url):
-    """
-    Extracts the main domain from a given URL, handling complex TLDs.
-
-    Parameters:
-        url (str): The URL string.
-
-    Returns:
-        str: The main domain (e.g., example.co.uk) or None if the URL is invalid.
-    """
-    try:
-        ext = tldextract.extract(url)
-        if ext.domain and ext.suffix:
-            return f"{ext.domain}.{ext.suffix}"
-        else:
-            return None
-    except Exception:
-        # Log the error if necessary
-        return None
-
-
 @app.template_filter("extract_main_domain")
 def extract_main_domain_filter(url):
-    return extract_main_domain(url)
+    with timed("domain"):
+        return extract_main_domain(url)
 
 
 @app.template_filter("markdown")
@@ -113,11 +99,55 @@ def markdown_filter(text):
     return Markup(clean_html)
 
 
+@app.template_filter("highlight")
+def highlight_filter(text):
+    """
+    Escape a search snippet and mark up the matched terms.
+    """
+    if not text:
+        return ""
+    html = str(escape(text))
+    html = html.replace(HIGHLIGHT_START, "<mark>").replace(HIGHLIGHT_END, "</mark>")
+    return Markup(html)
+
+
+
+
+# Endpoints left out of the request metrics, event streams stay open for minutes
+UNTIMED_ENDPOINTS = {"rss.events", "metrics", "static"}
 
 
 @app.before_request
 def init():
-    """initialize"""
+    """start timing the request, profile it when asked with ?profile=1 or X-Profile: 1"""
+    if request.endpoint in UNTIMED_ENDPOINTS:
+        return
+    start_request(profile=request.args.get("profile") == "1" or request.headers.get("X-Profile") == "1")
+
+@app.after_request
+def compress(response):
+    """compress responses the client accepts compressed"""
+    return compress_response(response, request.accept_encodings)
+
+@app.after_request
+def server_timing(response):
+    """add the Server-Timing header and record the request metrics"""
+    return finish_request(response, request.endpoint or "unknown")
+
+@app.teardown_request
+def stop_profiler(exc):
+    """stop the profiler of a request that failed before its metrics were recorded"""
+    end_request(exc)
+
+@before_render_template.connect_via(app)
+def render_started(sender, template, context, **extra):
+    g.render_started = time.perf_counter()
+
+@template_rendered.connect_via(app)
+def render_finished(sender, template, context, **extra):
+    started = g.pop("render_started", None)
+    if started is not None:
+        add_time("render", time.perf_counter() - started)
 
 @app.route("/")
 def index():
@@ -128,6 +158,49 @@ def favicon():
     # send static/favicon.ico file
     return app.send_static_file("favicon.ico")
 
+@app.route("/healthz")
+def healthz():
+    """health check for load balancers and graceful reloads"""
+    database = True
+    try:
+        conn = get_db_connection()
+        conn.execute("SELECT 1 FROM stories LIMIT 1")
+        conn.close()
+    except sqlite3.Error:
+        database = False
+    return jsonify(
+        {
+            "status": "ok",
+            "database": database,
+            "uptime": str(datetime.now() - start_time),
+        }
+    )
+
+
+@app.route("/metrics")
+def metrics():
+    """request and stage latency histograms in the Prometheus text format"""
+    return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
+
+
+def warm_caches():
+    """
+    Build the lazily created shared state before worker processes are forked.
+
+    Called by the production server once the app is preloaded, so the
+    compiled blacklist, the public suffix list and the templates are loaded
+    once and shared copy-on-write by every worker. The autocomplete title
+    index is built here too, the workers' refresher threads only add to it.
+    """
+    extract_main_domain("https://example.com/")
+    refresh_title_index()
+    blacklist.is_blacklisted("https://example.com/", "warm up")
+    for template in ("index.html", "show.html", "huggingface.html", "404.html"):
+        app.jinja_env.get_template(template)
+    # Keep the garbage collector from touching, and so copying, these objects in the workers
+    gc.freeze()
+
+
 app.register_blueprint(rss_bp,name="rss2",url_prefix='/rss')
 app.register_blueprint(hn,url_prefix='/hackernews')
 app.register_blueprint(hf,url_prefix='/huggingface')
@@ -1,9 +1,121 @@
+import os
 import schedule
 import time
+import sqlite3
+import requests
 import subprocess
 import logging
 from datetime import datetime
 
+# Seconds a fetch run may take before the rest is carried over to the next
+# one, keeps a busy front page from stalling the schedule
+FETCH_BUDGET = os.environ.get("BN_FETCH_BUDGET", "45")
+
+# Hacker News API, the same one the fetch agent reads
+HN_API_URL = os.environ.get("HN_API_URL", "https://hacker-news.firebaseio.com/v0")
+
+# Bounds of the seconds between polls of the front page
+MIN_POLL_INTERVAL = int(os.environ.get("BN_MIN_POLL_INTERVAL", 30))
+MAX_POLL_INTERVAL = int(os.environ.get("BN_MAX_POLL_INTERVAL", 600))
+
+# The interval grows by this factor after every poll without new stories
+BACKOFF_FACTOR = 2
+
+# New stories on the front page in one poll from which it counts as churning
+# and the interval drops straight to MIN_POLL_INTERVAL
+BUSY_NEW_STORIES = 3
+
+# Front page positions watched for reordering, stories climbing them keep
+# the interval short even when no new story arrives
+FRONT_PAGE_RANKS = 30
+
+
+class AdaptivePoller:
+    def __init__(self, min_interval=MIN_POLL_INTERVAL, max_interval=MAX_POLL_INTERVAL):
+        """
+        Decides on every poll whether a fetch is worth running and when to poll next.
+
+        The signal is the top-stories list, one small API call: the fetch
+        agent only processes stories it has not stored yet, so a poll that
+        finds no new IDs on the front page has nothing to fetch. Stories
+        moving on the front page still keep the interval short, their ranks
+        and comments are recorded on every poll.
+
+        Parameters:
+            min_interval (int): Fewest seconds between polls.
+            max_interval (int): Most seconds between polls.
+        """
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.interval = min_interval
+        self.previous_ids = None
+
+    def poll(self):
+        """
+        Check the front page for new and moved stories and adjust the interval.
+
+        Returns:
+            int or None: The number of new story IDs, None if the signal could not be read.
+        """
+        try:
+            response = requests.get(f"{HN_API_URL}/topstories.json", timeout=10)
+            response.raise_for_status()
+            top_ids = response.json() or []
+        except (requests.RequestException, ValueError) as e:
+            logging.error(f"{datetime.now()}: Error polling top stories - {e}")
+            return None
+
+        if self.previous_ids is not None:
+            new_stories = len(set(top_ids) - set(self.previous_ids))
+            moved = top_ids[:FRONT_PAGE_RANKS] != self.previous_ids[:FRONT_PAGE_RANKS]
+        else:
+            new_stories, moved = len(top_ids), True
+        self.previous_ids = top_ids
+        if new_stories >= BUSY_NEW_STORIES:
+            self.interval = self.min_interval
+        elif new_stories or moved:
+            self.interval = max(self.min_interval, self.interval // BACKOFF_FACTOR)
+        else:
+            self.interval = min(self.max_interval, self.interval * BACKOFF_FACTOR)
+        return new_stories
+
+
+def get_database_name():
+    """Return today's stories database, as named by the agents."""
+    current_date = datetime.now().strftime("%d_%m_%Y")
+    return os.path.join("db", f"hackernews_{current_date}.db")
+
+
+def query_database(sql):
+    """
+    Run a one-value query on today's database.
+
+    Returns:
+        The value, or None if the database or its tables do not exist yet.
+    """
+    db_name = get_database_name()
+    if not os.path.exists(db_name):
+        return None
+    try:
+        conn = sqlite3.connect(f"file:{db_name}?mode=ro", uri=True, timeout=10)
+        try:
+            return conn.execute(sql).fetchone()[0]
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        logging.error(f"{datetime.now()}: Error querying {db_name} - {e}")
+        return None
+
+
+def has_carry_over():
+    """Return True if the last fetch run left stories for the next one."""
+    return bool(query_database("SELECT EXISTS (SELECT 1 FROM carry_over)"))
+
+
+def has_unsummarized_stories():
+    """Return True if today's database has stories with content but no summary."""
+    return bool(query_database("SELECT EXISTS (SELECT 1 FROM stories WHERE has_content AND summary IS NULL)"))
+
 
 def fetch_news():
     """
@@ -12,12 +124,37 @@ def fetch_news():
     print(f"{datetime.now()}: Fetching news...")
     try:
         # Run the news fetching script
-        subprocess.run(["python", "./agents/concurrent_hn_topnews_fetch.py"], check=True)
+        subprocess.run(
+            ["python", "./agents/concurrent_hn_topnews_fetch.py"],
+            check=True,
+            env=dict(os.environ, BN_FETCH_BUDGET=FETCH_BUDGET),
+        )
         logging.info(f"{datetime.now()}: Successfully fetched news.")
     except subprocess.CalledProcessError as e:
         logging.error(f"{datetime.now()}: Error fetching news - {e}")
 
 
+def track_front_page():
+    """
+    Function to record the front page ranks and refresh comment threads without fetching stories.
+    """
+    print(f"{datetime.now()}: Recording front page...")
+    try:
+        subprocess.run(
+            ["python", "./agents/concurrent_hn_topnews_fetch.py", "--ranks-only"],
+            check=True,
+            env=dict(os.environ, BN_FETCH_BUDGET=FETCH_BUDGET),
+        )
+        logging.info(f"{datetime.now()}: Successfully recorded front page.")
+    except subprocess.CalledProcessError as e:
+        logging.error(f"{datetime.now()}: Error recording front page - {e}")
+
+
+def last_comment_refresh():
+    """Return when a comment thread of today's database was last refreshed, or None."""
+    return query_database("SELECT max(refreshed_at) FROM comment_threads")
+
+
 def generate_summaries():
     """
     Function to run the summary generation script.
@@ -31,21 +168,74 @@ def generate_summaries():
         logging.error(f"{datetime.now()}: Error generating summaries - {e}")
 
 
+def export_static_site():
+    """
+    Function to run the static site export script.
+    """
+    print(f"{datetime.now()}: Exporting static site...")
+    try:
+        # Run the static export script
+        subprocess.run(["python", "./agents/static_export.py"], check=True)
+        logging.info(f"{datetime.now()}: Successfully exported static site.")
+    except subprocess.CalledProcessError as e:
+        logging.error(f"{datetime.now()}: Error exporting static site - {e}")
+
+
+def run_tick(poller):
+    """
+    Poll the front page and run only the jobs that have work.
+
+    The fetch runs when the front page has new stories, the last run carried
+    stories over, today's database does not exist yet or the signal could
+    not be read. Every other poll runs the lightweight front page tracker,
+    so the rank history and comment threads stay current. The summarizer
+    runs when stories are waiting for a summary and the static site is
+    exported after a fetch, a summary run or a comment refresh. The tick
+    then schedules the next one after the poller's interval.
+    """
+    new_stories = poller.poll()
+    comments_before = last_comment_refresh()
+    fetch_needed = (
+        new_stories is None
+        or new_stories > 0
+        or not os.path.exists(get_database_name())
+        or has_carry_over()
+    )
+    if fetch_needed:
+        fetch_news()
+    else:
+        track_front_page()
+    comments_refreshed = last_comment_refresh() != comments_before
+    summaries_needed = has_unsummarized_stories()
+    if summaries_needed:
+        generate_summaries()
+    if fetch_needed or summaries_needed or comments_refreshed:
+        export_static_site()
+    else:
+        print(f"{datetime.now()}: Nothing new, next poll in {poller.interval}s")
+
+    logging.info(
+        f"{datetime.now()}: Poll found {new_stories} new stories, fetch {fetch_needed}, "
+        f"comments refreshed {comments_refreshed}, summaries {summaries_needed}, "
+        f"next poll in {poller.interval}s"
+    )
+    # Every tick replaces itself, so the interval can change from one to the next
+    schedule.clear("poll")
+    schedule.every(poller.interval).seconds.do(run_tick, poller).tag("poll")
+
+
 def main():
     # Configure logging
     logging.basicConfig(filename="./db/scheduler.log", level=logging.INFO)
 
-    # Schedule the tasks every 5 minutes
-    duration = 1
-    schedule.every(duration).minutes.do(fetch_news)
-    schedule.every(duration).minutes.do(generate_summaries)
+    # Poll more often while the front page churns and back off while it is quiet
+    poller = AdaptivePoller()
     # Schedule the job to run at 11:59 PM
     #schedule.every().day.at("23:59").do(job)
 
-    print("Scheduler started. Press Ctrl+C to exit.")
-    # Run the tasks immediately before starting the schedule loop
-    fetch_news()
-    generate_summaries()
+    print(f"Scheduler started, polling every {MIN_POLL_INTERVAL}-{MAX_POLL_INTERVAL}s. Press Ctrl+C to exit.")
+    # Run the first tick immediately, it schedules the next one
+    run_tick(poller)
 
     try:
         while True:
@@ -2,5 +2,9 @@
 # Start the background worker
 python concurrent_cron.py &
 
-# Start the Flask application
-flask run --host=0.0.0.0
\ No newline at end of file
+# Start the web application, BN_SERVER=dev runs the Flask development server
+if [ "$BN_SERVER" = "dev" ]; then
+    flask run --host=0.0.0.0
+else
+    exec gunicorn -c gunicorn.conf.py bn_app:app
+fi
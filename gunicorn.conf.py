@@ -0,0 +1,59 @@
+# gunicorn.conf.py
+# Production server settings, run with: gunicorn -c gunicorn.conf.py bn_app:app
+#
+# The app is preloaded in the master, so kill -HUP only re-forks workers from
+# the code already loaded there. To deploy new code without dropping
+# requests, start a new master next to the old one and retire the old one:
+#   kill -USR2 $(cat db/gunicorn.pid)   # new master and workers load the new code, PID in db/gunicorn.pid.2
+#   kill -WINCH $(cat db/gunicorn.pid)  # old workers finish in-flight requests and exit
+#   kill -QUIT $(cat db/gunicorn.pid)   # old master exits, the new one takes over db/gunicorn.pid
+import os
+import shutil
+import tempfile
+
+bind = os.environ.get("BN_BIND", "0.0.0.0:5000")
+
+# The master's PID, the new master of a USR2 upgrade writes <pidfile>.2 until the old one exits
+pidfile = os.environ.get("BN_PIDFILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "db", "gunicorn.pid"))
+
+# Worker processes, and threads per worker so slow clients do not hold a
+# whole process each. Every open /events stream holds a thread for up to ten
+# minutes, apps/hn.py caps them at BN_MAX_EVENT_STREAMS per worker (half
+# the threads by default) and turns the rest away with 503. To keep more
+# readers live, raise BN_THREADS: an idle stream holds a thread but no CPU.
+workers = int(os.environ.get("BN_WORKERS", 4))
+threads = int(os.environ.get("BN_THREADS", 8))
+worker_class = "gthread"
+
+# Load the app once in the master, the blacklist, suffix list and templates
+# are then shared copy-on-write by all workers
+preload_app = True
+
+# Workers that do not check in with the master for this long are restarted
+timeout = int(os.environ.get("BN_TIMEOUT", 120))
+
+# Seconds workers get to finish in-flight requests on reload or shutdown
+graceful_timeout = int(os.environ.get("BN_GRACEFUL_TIMEOUT", 30))
+keepalive = 5
+
+# Recycle workers now and then to bound memory growth
+max_requests = int(os.environ.get("BN_MAX_REQUESTS", 10000))
+max_requests_jitter = max_requests // 10
+
+# Workers write their request metrics here so /metrics reports all of them
+os.environ.setdefault("BN_METRICS_DIR", os.path.join(tempfile.gettempdir(), "bn_metrics"))
+
+accesslog = "-"
+errorlog = "-"
+
+
+def on_starting(server):
+    """Drop the request metrics of a previous run."""
+    shutil.rmtree(os.environ["BN_METRICS_DIR"], ignore_errors=True)
+
+
+def when_ready(server):
+    """Warm the shared caches in the master before the workers are forked."""
+    from bn_app import warm_caches
+
+    warm_caches()
@@ -3,6 +3,9 @@
 import os
 import re
 
+# Blacklist files used by the web app and the agents
+DEFAULT_BLACKLIST_FILES = ["config/blacklist.txt", "config/blacklist_urls.txt"]
+
 
 class Blacklist:
     def __init__(self, blacklist_files=["config/blacklist.txt"]):
@@ -44,7 +47,7 @@ class Blacklist:
                     if line.startswith("regex:"):
                         pattern = line.split("regex:", 1)[1].strip()
                         if self.validate_regex(pattern, file, line_number):
-                            self.regex_patterns.append(pattern)
+                            self.regex_patterns.append(re.compile(pattern))
                     elif line.startswith("string:"):
                         string_match = line.split("string:", 1)[1].strip().lower()
                         self.string_patterns.append(string_match)
@@ -86,7 +89,7 @@ class Blacklist:
 
         # Check regex patterns
         for pattern in self.regex_patterns:
-            if re.search(pattern, url) or re.search(pattern, title):
+            if pattern.search(url) or pattern.search(title):
                 return True
 
         # Check string patterns
@@ -95,3 +98,22 @@ class Blacklist:
                 return True
 
         return False
+
+
+_default_blacklist = None
+
+
+def get_blacklist():
+    """
+    Return the Blacklist loaded from DEFAULT_BLACKLIST_FILES, shared by every module of the process.
+
+    It is loaded on first use, so under a preloading server it is built once
+    in the master and shared copy-on-write by the workers.
+
+    Returns:
+        Blacklist: The shared Blacklist instance.
+    """
+    global _default_blacklist
+    if _default_blacklist is None:
+        _default_blacklist = Blacklist(blacklist_files=DEFAULT_BLACKLIST_FILES)
+    return _default_blacklist
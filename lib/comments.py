@@ -0,0 +1,299 @@
+# lib/comments.py
+
+import os
+import re
+import html
+import json
+import time
+import logging
+
+from lib.text_codec import compress_text
+
+# Top stories whose comment threads are kept up to date by every fetch run
+COMMENT_STORIES = int(os.environ.get("BN_COMMENT_STORIES", 30))
+
+# Concurrent item requests while walking a thread
+COMMENT_WORKERS = int(os.environ.get("BN_COMMENT_WORKERS", 16))
+
+# HN comments can be edited for two hours. A cached comment fetched later
+# than that has its final text and is not fetched again unless the thread's
+# comment count shows replies are missing.
+SETTLED_AGE = 2 * 60 * 60
+
+# Settled comments fetched again per thread refresh to find missing replies,
+# newest first. Replies the budget does not reach stay missing until the
+# story's comment count changes again.
+COMMENT_REPAIR_FETCHES = int(os.environ.get("BN_COMMENT_REPAIR_FETCHES", 100))
+
+# Comments per page on a story page
+COMMENT_PAGE_SIZE = 100
+
+# Digits per level of a comment's path, the position among its siblings
+PATH_DIGITS = 4
+
+TAG = re.compile(r"<[^>]+>")
+PARAGRAPH = re.compile(r"<p>", re.IGNORECASE)
+
+
+def create_comment_tables(conn):
+    """
+    Create the 'comments' and 'comment_threads' tables if they don't exist.
+
+    Comments are stored with their path, the zero-padded positions of the
+    comment and its ancestors among their siblings, so ordering a story's
+    comments by path gives the thread in display order and a page is one
+    range scan of idx_comments_thread. 'comment_threads' keeps the story's
+    comment count as of the last refresh.
+
+    Parameters:
+        conn (sqlite3.Connection): The database connection.
+    """
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS comments (
+            id INTEGER PRIMARY KEY,
+            story_id INTEGER NOT NULL,
+            parent INTEGER,
+            depth INTEGER,
+            path TEXT,
+            by TEXT,
+            time INTEGER,
+            text TEXT,
+            kids TEXT,
+            deleted INTEGER DEFAULT 0,
+            fetched_at INTEGER
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_comments_thread ON comments (story_id, path)")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS comment_threads (
+            story_id INTEGER PRIMARY KEY,
+            descendants INTEGER,
+            refreshed_at INTEGER
+        )
+    """)
+    conn.commit()
+
+
+def comment_text(markup):
+    """
+    Turn the HTML of a comment into plain text, paragraphs separated by blank lines.
+
+    Parameters:
+        markup (str): The 'text' of a comment item.
+
+    Returns:
+        str or None: The text.
+    """
+    if not markup:
+        return None
+    return html.unescape(TAG.sub("", PARAGRAPH.sub("\n\n", markup))).strip()
+
+
+def comment_path(parent_path, position):
+    """Return the path of the comment at position among the replies to the comment at parent_path."""
+    return f"{parent_path}{position:0{PATH_DIGITS}d}."
+
+
+def is_settled(cached):
+    """Return whether a cached comment was fetched after its edit window closed."""
+    return (cached["fetched_at"] or 0) - (cached["time"] or 0) >= SETTLED_AGE
+
+
+def walk_thread(story, cached, fetch_item, executor, fresh):
+    """
+    Walk a story's comment tree level by level.
+
+    The comments of a level are fetched concurrently, then their replies
+    make up the next level. Settled cached comments and comments already
+    in 'fresh' are not fetched again, their known replies are walked instead.
+
+    Parameters:
+        story (dict): The story item.
+        cached (dict): Stored comments of the story by ID.
+        fetch_item (callable): Fetches an item by ID, returns a dict or None.
+        executor (concurrent.futures.Executor): Bounds the concurrent requests.
+        fresh (dict): Items fetched so far in this refresh by ID, filled in.
+
+    Returns:
+        tuple: ({id: (parent, depth, path, item or None)} of the comments walked,
+        live comments, failed requests).
+    """
+    walked, live, failed = {}, 0, 0
+    level = [(kid, story["id"], 0, comment_path("", n)) for n, kid in enumerate(story.get("kids") or [])]
+    while level:
+        stale = [
+            comment_id for comment_id, *_ in level
+            if comment_id not in fresh and (comment_id not in cached or not is_settled(cached[comment_id]))
+        ]
+        for comment_id, item in zip(stale, executor.map(fetch_item, stale)):
+            if item:
+                fresh[comment_id] = item
+            else:
+                failed += 1
+
+        next_level = []
+        for comment_id, parent, depth, path in level:
+            item = fresh.get(comment_id)
+            if item:
+                kids = item.get("kids") or []
+                deleted = bool(item.get("deleted") or item.get("dead"))
+            elif comment_id in cached:
+                kids = json.loads(cached[comment_id]["kids"] or "[]")
+                deleted = bool(cached[comment_id]["deleted"])
+            else:
+                continue
+            walked[comment_id] = (parent, depth, path, item)
+            if not deleted:
+                live += 1
+            next_level += [(kid, comment_id, depth + 1, comment_path(path, n)) for n, kid in enumerate(kids)]
+        level = next_level
+    return walked, live, failed
+
+
+def find_missing_replies(cached, walked, fetch_item, executor, fresh, missing):
+    """
+    Fetch settled comments again until the parents of missing replies turn up.
+
+    A reply posted after its parent settled is only listed in the parent's
+    fresh 'kids'. The settled comments the walk did not fetch are fetched
+    again newest first, as late replies mostly go to recent comments, up to
+    COMMENT_REPAIR_FETCHES of them and only until the new replies found
+    cover the missing count. Those whose 'kids' changed are left in 'fresh',
+    so walking the thread again fetches just their new replies.
+
+    Parameters:
+        cached (dict): Stored comments of the story by ID.
+        walked (dict): The comments found by the walk, as walk_thread returns them.
+        fetch_item (callable): Fetches an item by ID, returns a dict or None.
+        executor (concurrent.futures.Executor): Bounds the concurrent requests.
+        fresh (dict): Items fetched so far in this refresh by ID, filled in.
+        missing (int): Comments the walk did not find.
+
+    Returns:
+        tuple: (changed parents, failed requests).
+    """
+    candidates = sorted(
+        (
+            comment_id for comment_id, (*_, item) in walked.items()
+            if item is None and not cached[comment_id]["deleted"]
+        ),
+        key=lambda comment_id: cached[comment_id]["time"] or 0,
+        reverse=True,
+    )[:COMMENT_REPAIR_FETCHES]
+    changed, failed, found = 0, 0, 0
+    for start in range(0, len(candidates), COMMENT_WORKERS):
+        if found >= missing:
+            break
+        batch = candidates[start:start + COMMENT_WORKERS]
+        for comment_id, item in zip(batch, executor.map(fetch_item, batch)):
+            if not item:
+                failed += 1
+                continue
+            new_kids = set(item.get("kids") or []) - set(json.loads(cached[comment_id]["kids"] or "[]"))
+            if new_kids:
+                fresh[comment_id] = item
+                changed += 1
+                found += len(new_kids)
+    return changed, failed
+
+
+def refresh_thread(conn, story, fetch_item, executor):
+    """
+    Bring the stored comments of a story up to date.
+
+    Nothing is fetched while the story's 'descendants' count is the one
+    stored at the last refresh. Otherwise the tree is walked fetching only
+    new and unsettled comments; if that finds fewer comments than the count,
+    replies were added under settled comments, see find_missing_replies, and
+    the tree is walked again below the parents whose replies changed.
+
+    Parameters:
+        conn (sqlite3.Connection): The database connection.
+        story (dict): The story item, freshly fetched.
+        fetch_item (callable): Fetches an item by ID, returns a dict or None.
+        executor (concurrent.futures.Executor): Bounds the concurrent requests.
+
+    Returns:
+        dict or None: Counts of 'fetched', 'cached' and 'failed' comments, None
+        if the thread had not changed.
+    """
+    story_id = story["id"]
+    descendants = story.get("descendants") or 0
+    stored = conn.execute("SELECT descendants FROM comment_threads WHERE story_id = ?", (story_id,)).fetchone()
+    if stored and stored[0] == descendants:
+        return None
+
+    cursor = conn.execute(
+        "SELECT id, path, depth, time, kids, deleted, fetched_at FROM comments WHERE story_id = ?", (story_id,)
+    )
+    columns = [description[0] for description in cursor.description]
+    cached = {row[0]: dict(zip(columns, row)) for row in cursor}
+
+    fresh = {}
+    walked, live, failed = walk_thread(story, cached, fetch_item, executor, fresh)
+    if live < descendants:
+        changed, repair_failed = find_missing_replies(
+            cached, walked, fetch_item, executor, fresh, descendants - live
+        )
+        if changed:
+            walked, live, failed = walk_thread(story, cached, fetch_item, executor, fresh)
+        failed += repair_failed
+
+    now = int(time.time())
+    inserts, moves = [], []
+    for comment_id, (parent, depth, path, item) in walked.items():
+        if item:
+            inserts.append((
+                comment_id, story_id, parent, depth, path, item.get("by"), item.get("time"),
+                compress_text(comment_text(item.get("text"))), json.dumps(item.get("kids") or []),
+                int(bool(item.get("deleted") or item.get("dead"))), now,
+            ))
+        elif (cached[comment_id]["path"], cached[comment_id]["depth"]) != (path, depth):
+            moves.append((path, depth, comment_id))
+    removed = [(comment_id,) for comment_id in cached if comment_id not in walked]
+
+    with conn:
+        conn.executemany(
+            """
+            INSERT OR REPLACE INTO comments
+                (id, story_id, parent, depth, path, by, time, text, kids, deleted, fetched_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            inserts,
+        )
+        conn.executemany("UPDATE comments SET path = ?, depth = ? WHERE id = ?", moves)
+        conn.executemany("DELETE FROM comments WHERE id = ?", removed)
+        # A thread with failed requests is refreshed again by the next run
+        conn.execute(
+            "INSERT OR REPLACE INTO comment_threads (story_id, descendants, refreshed_at) VALUES (?, ?, ?)",
+            (story_id, None if failed else descendants, now),
+        )
+    if failed:
+        logging.error(f"{failed} comments of story ID {story_id} could not be fetched")
+    return {"fetched": len(inserts), "cached": len(walked) - len(inserts), "failed": failed}
+
+
+def fetch_comment_page(conn, story_id, after=None, limit=COMMENT_PAGE_SIZE):
+    """
+    Fetch a page of a story's comments in thread order.
+
+    Parameters:
+        conn (sqlite3.Connection): The database connection.
+        story_id (int): The story.
+        after (str): Path of the last comment of the previous page.
+        limit (int): Comments per page.
+
+    Returns:
+        list of sqlite3.Row: id, parent, depth, path, by, time, text and deleted.
+    """
+    cursor = conn.execute(
+        """
+        SELECT id, parent, depth, path, by, time, text, deleted
+        FROM comments
+        WHERE story_id = ? AND path > ?
+        ORDER BY path
+        LIMIT ?
+    """,
+        (story_id, after or "", limit),
+    )
+    return cursor.fetchall()
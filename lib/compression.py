@@ -0,0 +1,138 @@
+# lib/compression.py
+
+import gzip
+import zlib
+
+# brotli is optional, without it responses are only gzip compressed
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Response types worth compressing
+COMPRESSIBLE_MIMETYPES = {
+    "text/html",
+    "text/css",
+    "text/plain",
+    "text/javascript",
+    "application/javascript",
+    "application/json",
+    "application/xml",
+}
+
+# Bodies smaller than this are sent as is
+MIN_COMPRESS_SIZE = 500
+
+# Bytes of input buffered by the compressor of a streamed response before
+# the compressed data is flushed to the client
+STREAM_FLUSH_SIZE = 8192
+
+
+def available_encodings():
+    """Return the content encodings this server can produce, preferred first."""
+    return ["br", "gzip"] if brotli else ["gzip"]
+
+
+def choose_encoding(accept_encodings):
+    """
+    Pick the best content encoding the client accepts.
+
+    Parameters:
+        accept_encodings (werkzeug.datastructures.Accept): The parsed Accept-Encoding header.
+
+    Returns:
+        str or None: 'br', 'gzip' or None if the client accepts neither.
+    """
+    return accept_encodings.best_match(available_encodings())
+
+
+def compress_stream(chunks, encoding, flush_size=STREAM_FLUSH_SIZE):
+    """
+    Compress a streamed body chunk by chunk.
+
+    The first chunk (usually the page head) is flushed at once, later chunks
+    every flush_size bytes of input, so compression does not delay the first
+    byte the way buffering the whole body would.
+
+    Parameters:
+        chunks (iterable): The body chunks, str or bytes.
+        encoding (str): 'br' or 'gzip'.
+        flush_size (int): Bytes of input between flushes.
+
+    Yields:
+        bytes: Compressed data.
+    """
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=5)
+        compress, flush, finish = compressor.process, compressor.flush, compressor.finish
+    else:
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # 31: gzip container
+        compress, finish = compressor.compress, compressor.flush
+
+        def flush():
+            return compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    pending = 0
+    first = True
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode()
+        data = compress(chunk)
+        pending += len(chunk)
+        if first or pending >= flush_size:
+            data += flush()
+            pending = 0
+            first = False
+        if data:
+            yield data
+    yield finish()
+
+
+def compress_response(response, accept_encodings):
+    """
+    Compress a response body in place according to the client's Accept-Encoding.
+
+    Streamed bodies are compressed incrementally, file and non-200 responses
+    are left untouched. The ETag of a compressed response gets the encoding
+    appended, so each representation keeps its own strong validator.
+
+    Parameters:
+        response (flask.Response): The response to compress.
+        accept_encodings (werkzeug.datastructures.Accept): The parsed Accept-Encoding header.
+
+    Returns:
+        flask.Response: The same response object.
+    """
+    if (
+        response.status_code != 200
+        or response.direct_passthrough
+        or "Content-Encoding" in response.headers
+        or response.mimetype not in COMPRESSIBLE_MIMETYPES
+    ):
+        return response
+
+    response.vary.add("Accept-Encoding")
+
+    encoding = choose_encoding(accept_encodings)
+    if encoding is None:
+        return response
+
+    if response.is_streamed:
+        response.response = compress_stream(response.response, encoding)
+    else:
+        data = response.get_data()
+        if len(data) < MIN_COMPRESS_SIZE:
+            return response
+
+        if encoding == "br":
+            data = brotli.compress(data, quality=5)
+        else:
+            data = gzip.compress(data, compresslevel=6)
+        response.set_data(data)
+
+    response.headers["Content-Encoding"] = encoding
+
+    etag, weak = response.get_etag()
+    if etag:
+        response.set_etag(f"{etag}-{encoding}", weak=weak)
+    return response
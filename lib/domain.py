@@ -0,0 +1,35 @@
+# lib/domain.py
+
+from functools import lru_cache
+
+import tldextract
+
+# Use the public suffix list snapshot bundled with tldextract. With no suffix
+# list URLs and no cache directory it never goes to the network or to disk,
+# so domain extraction works the same on offline hosts.
+extractor = tldextract.TLDExtract(suffix_list_urls=(), cache_dir=None)
+
+
+@lru_cache(maxsize=8192)
+def extract_main_domain(url):
+    """
+    Extracts the main domain from a given URL, handling complex TLDs.
+
+    Results are memoized, the same URLs are rendered over and over.
+
+    Parameters:
+        url (str): The URL string.
+
+    Returns:
+        str: The main domain (e.g., example.co.uk) or None if the URL is invalid.
+    """
+    if not url:
+        return None
+    try:
+        ext = extractor(url)
+        if ext.domain and ext.suffix:
+            return f"{ext.domain}.{ext.suffix}"
+        else:
+            return None
+    except Exception:
+        return None
@@ -0,0 +1,182 @@
+# lib/extraction.py
+
+import os
+import json
+import time
+import logging
+import threading
+
+import trafilatura
+
+# Extraction tiers, cheapest first. 'fast' skips trafilatura's fallback
+# extractors and favors precision, 'default' is trafilatura's default and
+# 'recall' also keeps text the default would drop.
+TIERS = ("fast", "default", "recall")
+
+TIER_OPTIONS = {
+    "fast": {"fast": True, "favor_precision": True},
+    "default": {},
+    "recall": {"favor_recall": True},
+}
+
+# Extracted text shorter than this counts as a miss and the next tier is tried
+MIN_CONTENT_CHARS = 300
+
+# Attempts of a tier on a domain before its success rate is trusted
+MIN_ATTEMPTS = 3
+
+# A domain starts at the first tier succeeding at least this often
+START_SUCCESS_RATE = 0.5
+
+# Every this many pages a domain starts at the first tier again, sites change
+REPROBE_INTERVAL = 25
+
+# Per domain stats survive runs, like the runs ledger
+STATS_FILE = os.environ.get(
+    "BN_EXTRACTION_STATS",
+    os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'db', 'extraction_stats.json')),
+)
+
+
+def extract_tier(html, url, tier):
+    """
+    Extract the main text of a page with the options of one tier.
+
+    Parameters:
+        html (str): The downloaded page.
+        url (str): Its URL.
+        tier (str): One of TIERS.
+
+    Returns:
+        str or None: The extracted text.
+    """
+    return trafilatura.extract(html, url=url, **TIER_OPTIONS[tier])
+
+
+class TieredExtractor:
+    def __init__(self, stats_file=STATS_FILE):
+        """
+        Extracts pages with the cheapest tier that gives enough text.
+
+        A page is tried tier by tier until one returns MIN_CONTENT_CHARS. For
+        every domain it records which tiers succeeded and how long they took,
+        and a domain whose pages the cheap tiers keep missing starts at the
+        first tier that usually works. Safe to share between threads.
+
+        Parameters:
+            stats_file (str): JSON file the per domain stats are loaded from and saved to.
+        """
+        self.stats_file = stats_file
+        self.lock = threading.Lock()
+        self.stats = {}
+        self.load()
+
+    def load(self):
+        """Load the per domain stats, starting empty if the file is missing or unreadable."""
+        try:
+            with open(self.stats_file) as f:
+                self.stats = json.load(f)
+        except FileNotFoundError:
+            self.stats = {}
+        except (OSError, ValueError) as e:
+            print(f"Error loading extraction stats from {self.stats_file}: {e}")
+            logging.error(f"Error loading extraction stats from {self.stats_file}: {e}")
+            self.stats = {}
+
+    def save(self):
+        """Write the per domain stats, errors are logged and never fail the agent."""
+        with self.lock:
+            data = json.dumps(self.stats, sort_keys=True)
+        tmp_file = f"{self.stats_file}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self.stats_file), exist_ok=True)
+            with open(tmp_file, "w") as f:
+                f.write(data)
+            os.replace(tmp_file, self.stats_file)
+        except OSError as e:
+            print(f"Error saving extraction stats to {self.stats_file}: {e}")
+            logging.error(f"Error saving extraction stats to {self.stats_file}: {e}")
+
+    def tiers_to_try(self, domain):
+        """
+        Return the tiers to try on a page of a domain, in order.
+
+        A domain starts at the first tier not yet tried MIN_ATTEMPTS times or
+        succeeding at least START_SUCCESS_RATE of the time. If every tier has
+        been tried that often and none does, it starts at the tier with the
+        best success rate, e.g. a site whose pages are all short. Escalation
+        stops before a tier that was tried MIN_ATTEMPTS times and never
+        succeeded: it only runs on pages the tiers below missed, so it never
+        did better than them. Every REPROBE_INTERVAL pages the domain goes
+        through all tiers regardless, sites change.
+        """
+        with self.lock:
+            domain_stats = self.stats.get(domain)
+            if not domain_stats or domain_stats.get("pages", 0) % REPROBE_INTERVAL == 0:
+                return list(TIERS)
+            tier_stats = [domain_stats.get("tiers", {}).get(tier) for tier in TIERS]
+
+        def trusted(stats):
+            return stats is not None and stats["attempts"] >= MIN_ATTEMPTS
+
+        start = None
+        for index, stats in enumerate(tier_stats):
+            if not trusted(stats) or stats["successes"] >= START_SUCCESS_RATE * stats["attempts"]:
+                start = index
+                break
+        if start is None:
+            # max() keeps the cheapest of equally good tiers
+            start = max(
+                range(len(TIERS)),
+                key=lambda index: tier_stats[index]["successes"] / tier_stats[index]["attempts"],
+            )
+
+        tiers = [TIERS[start]]
+        for index in range(start + 1, len(TIERS)):
+            stats = tier_stats[index]
+            if trusted(stats) and stats["successes"] == 0:
+                break
+            tiers.append(TIERS[index])
+        return tiers
+
+    def record(self, domain, tier, success, seconds):
+        """Record one attempt of a tier on a page of a domain."""
+        with self.lock:
+            domain_stats = self.stats.setdefault(domain, {"pages": 0, "tiers": {}})
+            tier_stats = domain_stats["tiers"].setdefault(tier, {"attempts": 0, "successes": 0, "seconds": 0.0})
+            tier_stats["attempts"] += 1
+            tier_stats["successes"] += int(success)
+            tier_stats["seconds"] = round(tier_stats["seconds"] + seconds, 6)
+
+    def extract(self, html, url, domain):
+        """
+        Extract the main text of a page, escalating through the tiers as needed.
+
+        Parameters:
+            html (str): The downloaded page.
+            url (str): Its URL.
+            domain (str): Its domain, the key of the stats.
+
+        Returns:
+            tuple: (text or None, name of the tier that produced it or None). If no
+            tier gives MIN_CONTENT_CHARS the longest text any tier gave is returned.
+        """
+        domain = domain or ""
+        best, best_tier = None, None
+        for tier in self.tiers_to_try(domain):
+            started = time.perf_counter()
+            try:
+                text = extract_tier(html, url, tier)
+            except Exception as e:
+                logging.error(f"Error extracting {url} with the {tier} tier: {e}")
+                text = None
+            success = bool(text) and len(text) >= MIN_CONTENT_CHARS
+            self.record(domain, tier, success, time.perf_counter() - started)
+            if text and (best is None or len(text) > len(best)):
+                best, best_tier = text, tier
+            if success:
+                best, best_tier = text, tier
+                break
+        with self.lock:
+            self.stats[domain]["pages"] += 1
+        return best, best_tier
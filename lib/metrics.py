@@ -0,0 +1,379 @@
+# lib/metrics.py
+
+import os
+import sys
+import json
+import time
+import sqlite3
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+from flask import g, has_request_context
+
+# Request stages timed for Server-Timing and the stage histogram. Stages can
+# overlap: a streamed listing reads rows and filters them while its template
+# renders, so 'render' includes that 'db' and 'blacklist' time.
+STAGES = ("db", "blacklist", "domain", "relevance", "trending", "render")
+
+# Histogram bucket upper bounds in seconds
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Worker processes write their metrics here so /metrics can add up all of
+# them, without it every process only reports its own requests
+METRICS_DIR = os.environ.get("BN_METRICS_DIR")
+
+# Seconds between writes of a worker's metrics to METRICS_DIR
+METRICS_WRITE_INTERVAL = 5
+
+# Per-request profiling is only honoured when this is set, and the
+# collapsed stacks are written to PROFILE_DIR
+PROFILING = os.environ.get("BN_PROFILING", "") == "1"
+PROFILE_DIR = os.environ.get(
+    "BN_PROFILE_DIR",
+    os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'db', 'profiles')),
+)
+
+# Seconds between stack samples of a profiled request
+PROFILE_INTERVAL = 0.005
+
+
+class Histogram:
+    def __init__(self, name, help_text, label_names):
+        """
+        A Prometheus histogram with a fixed set of labels.
+
+        Parameters:
+            name (str): Metric name.
+            help_text (str): The HELP line.
+            label_names (tuple): Names of the labels every observation has.
+        """
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        """Record one value for the label values given in label_names order."""
+        with self.lock:
+            series = self.series.get(labels)
+            if series is None:
+                series = self.series[labels] = {"buckets": [0] * len(BUCKETS), "sum": 0.0, "count": 0}
+            for n, bound in enumerate(BUCKETS):
+                if value <= bound:
+                    series["buckets"][n] += 1
+                    break
+            series["sum"] += value
+            series["count"] += 1
+
+    def state(self):
+        """Return a JSON-serializable copy of every series."""
+        with self.lock:
+            return [
+                {"labels": list(labels), "buckets": list(series["buckets"]),
+                 "sum": series["sum"], "count": series["count"]}
+                for labels, series in self.series.items()
+            ]
+
+    def render(self, states):
+        """
+        Return the histogram in the Prometheus text format.
+
+        Parameters:
+            states (list): state() results to add up, one per process.
+        """
+        merged = {}
+        for state in states:
+            for series in state:
+                labels = tuple(series["labels"])
+                total = merged.setdefault(labels, {"buckets": [0] * len(BUCKETS), "sum": 0.0, "count": 0})
+                total["buckets"] = [a + b for a, b in zip(total["buckets"], series["buckets"])]
+                total["sum"] += series["sum"]
+                total["count"] += series["count"]
+
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for labels, series in sorted(merged.items()):
+            label_text = ",".join(f'{name}="{value}"' for name, value in zip(self.label_names, labels))
+            cumulative = 0
+            for bound, count in zip(BUCKETS, series["buckets"]):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{label_text},le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{label_text},le="+Inf"}} {series["count"]}')
+            lines.append(f"{self.name}_sum{{{label_text}}} {series['sum']:.6f}")
+            lines.append(f"{self.name}_count{{{label_text}}} {series['count']}")
+        return "\n".join(lines)
+
+
+request_duration = Histogram(
+    "bn_request_duration_seconds", "Time spent serving a request.", ("endpoint", "status")
+)
+stage_duration = Histogram(
+    "bn_stage_duration_seconds", "Time spent in a stage of a request.", ("endpoint", "stage")
+)
+HISTOGRAMS = (request_duration, stage_duration)
+
+# Process whose writer thread is running, threads do not survive a fork
+metrics_writer = {"pid": None, "dirty": threading.Event()}
+
+
+def current_timings():
+    """Return the stage timings of the current request, or None outside of one."""
+    if not has_request_context():
+        return None
+    return g.get("timings")
+
+
+def add_time(stage, seconds):
+    """Add seconds to a stage of the current request, if any."""
+    timings = current_timings()
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + seconds
+
+
+@contextmanager
+def timed(stage):
+    """Time a block as part of a stage of the current request."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_time(stage, time.perf_counter() - started)
+
+
+class TimedCursor(sqlite3.Cursor):
+    """Cursor adding the time spent in SQLite to the request's 'db' stage."""
+
+    timings = None
+
+    def execute(self, *args):
+        started = time.perf_counter()
+        try:
+            return super().execute(*args)
+        finally:
+            self.add(started)
+
+    def fetchone(self):
+        started = time.perf_counter()
+        try:
+            return super().fetchone()
+        finally:
+            self.add(started)
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        try:
+            return super().fetchmany(self.arraysize if size is None else size)
+        finally:
+            self.add(started)
+
+    def fetchall(self):
+        started = time.perf_counter()
+        try:
+            return super().fetchall()
+        finally:
+            self.add(started)
+
+    def __next__(self):
+        started = time.perf_counter()
+        try:
+            return super().__next__()
+        finally:
+            self.add(started)
+
+    def add(self, started):
+        if self.timings is not None:
+            self.timings["db"] = self.timings.get("db", 0.0) + time.perf_counter() - started
+
+
+class TimedConnection(sqlite3.Connection):
+    """
+    Connection whose cursors time their queries, pass it to sqlite3.connect() as factory.
+
+    conn.execute() goes through cursor() as well, so it is timed too.
+    """
+
+    def cursor(self, factory=TimedCursor):
+        cursor = super().cursor(factory)
+        if isinstance(cursor, TimedCursor):
+            cursor.timings = current_timings()
+        return cursor
+
+
+class SamplingProfiler:
+    def __init__(self, thread_id, interval=PROFILE_INTERVAL):
+        """
+        Sample the stack of one thread at a fixed interval from a background thread.
+
+        Parameters:
+            thread_id (int): The thread to sample, e.g. threading.get_ident().
+            interval (float): Seconds between samples.
+        """
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = Counter()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            if stack:
+                self.samples[";".join(reversed(stack))] += 1
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def write(self, path):
+        """Write the samples as collapsed stacks, the input format of flame graph tools."""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+def start_request(profile=False):
+    """
+    Start timing the current request. Call from a before_request handler.
+
+    Parameters:
+        profile (bool): Also sample the request's stacks, if PROFILING is on.
+    """
+    g.timings = {}
+    g.request_started = time.perf_counter()
+    g.profiler = None
+    if profile and PROFILING:
+        g.profiler = SamplingProfiler(threading.get_ident())
+        g.profiler.start()
+
+
+def server_timing_header(timings, total):
+    """Return a Server-Timing header value for stage timings in seconds."""
+    entries = [f"{stage};dur={timings[stage] * 1000:.2f}" for stage in STAGES if stage in timings]
+    entries.append(f"app;dur={total * 1000:.2f}")
+    return ", ".join(entries)
+
+
+def finish_request(response, endpoint):
+    """
+    Add the Server-Timing header and record the request once it is sent.
+
+    A streamed response still renders after its headers are sent, so its
+    header only covers the time until then, while the histograms get the
+    whole request when the response is closed.
+
+    Parameters:
+        response (flask.Response): The response.
+        endpoint (str): Label for the histograms, e.g. 'rss.index'.
+
+    Returns:
+        flask.Response: The response.
+    """
+    timings = g.get("timings")
+    if timings is None:
+        return response
+    started = g.request_started
+    # Stopped by record() once the response is closed, end_request() leaves it alone
+    profiler = g.pop("profiler", None)
+    status = str(response.status_code)
+    response.headers["Server-Timing"] = server_timing_header(timings, time.perf_counter() - started)
+
+    profile_file = None
+    if profiler is not None:
+        profile_file = os.path.join(PROFILE_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{endpoint}-{os.getpid()}.txt")
+        response.headers["X-Profile"] = os.path.basename(profile_file)
+
+    def record():
+        request_duration.observe(time.perf_counter() - started, endpoint, status)
+        for stage, seconds in timings.items():
+            stage_duration.observe(seconds, endpoint, stage)
+        if profiler is not None:
+            profiler.stop()
+            profiler.write(profile_file)
+        schedule_metrics_write()
+
+    response.call_on_close(record)
+    return response
+
+
+def end_request(exc=None):
+    """
+    Stop the profiler of a request that ended without finish_request().
+
+    Call from a teardown_request handler.
+
+    A view or after_request handler that raises skips finish_request(), the
+    sampling thread would otherwise run until the process exits.
+
+    Parameters:
+        exc (Exception): The exception that ended the request, if any.
+    """
+    profiler = g.pop("profiler", None)
+    if profiler is not None:
+        profiler.stop()
+
+
+def write_metrics():
+    """Write this process's histograms to METRICS_DIR/<pid>.json."""
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    path = os.path.join(METRICS_DIR, f"{os.getpid()}.json")
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({histogram.name: histogram.state() for histogram in HISTOGRAMS}, f)
+    os.replace(tmp_path, path)
+
+
+def metrics_writer_loop(dirty):
+    """Write the metrics at most every METRICS_WRITE_INTERVAL while requests come in."""
+    while True:
+        dirty.wait()
+        dirty.clear()
+        try:
+            write_metrics()
+        except OSError:
+            pass
+        time.sleep(METRICS_WRITE_INTERVAL)
+
+
+def schedule_metrics_write():
+    """Have this process's metrics written to METRICS_DIR soon, if it is set."""
+    if not METRICS_DIR:
+        return
+    if metrics_writer["pid"] != os.getpid():
+        metrics_writer["pid"] = os.getpid()
+        metrics_writer["dirty"] = threading.Event()
+        threading.Thread(target=metrics_writer_loop, args=(metrics_writer["dirty"],), daemon=True).start()
+    metrics_writer["dirty"].set()
+
+
+def render_metrics():
+    """
+    Return all histograms in the Prometheus text format.
+
+    With METRICS_DIR set the states written by every worker are added up,
+    this process's own state is always current.
+    """
+    states = {histogram.name: [histogram.state()] for histogram in HISTOGRAMS}
+    if METRICS_DIR and os.path.isdir(METRICS_DIR):
+        own_file = f"{os.getpid()}.json"
+        for name in os.listdir(METRICS_DIR):
+            if not name.endswith(".json") or name == own_file:
+                continue
+            try:
+                with open(os.path.join(METRICS_DIR, name), "r") as f:
+                    written = json.load(f)
+            except (OSError, ValueError):
+                continue
+            for histogram_name, state in written.items():
+                if histogram_name in states:
+                    states[histogram_name].append(state)
+    return "\n".join(histogram.render(states[histogram.name]) for histogram in HISTOGRAMS) + "\n"
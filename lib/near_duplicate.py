@@ -0,0 +1,173 @@
+# lib/near_duplicate.py
+
+import os
+import re
+import zlib
+
+import numpy as np
+
+# MinHash values per signature, stored as NUM_PERM uint32 (512 bytes)
+NUM_PERM = 128
+
+# LSH bands of ROWS_PER_BAND values, stories sharing any band are compared.
+# 16 bands of 8 make pairs above ~0.7 similarity candidates almost always
+LSH_BANDS = 16
+ROWS_PER_BAND = NUM_PERM // LSH_BANDS
+
+# Estimated Jaccard similarity of the word shingles from which two articles count as one
+DUPLICATE_THRESHOLD = float(os.environ.get("BN_DUPLICATE_THRESHOLD", 0.8))
+
+# Words per shingle
+SHINGLE_WORDS = 5
+
+# Articles shorter than this get no signature, cookie walls and
+# "please enable JavaScript" pages would all look alike
+MIN_WORDS = 100
+
+# Shingles hashed per chunk, bounds the (shingles x NUM_PERM) work array
+CHUNK_SHINGLES = 4096
+
+WORD = re.compile(r"\w+")
+
+# Fixed seed, stored signatures must stay comparable across runs
+_rng = np.random.default_rng(20241101)
+# Odd multipliers and offsets of the multiply-shift hash functions, one per value
+_MULTIPLIERS = _rng.integers(1, 2**63, size=NUM_PERM, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+_OFFSETS = _rng.integers(0, 2**63, size=NUM_PERM, dtype=np.uint64)
+# Mixes the values of a band into one key
+_BAND_MULTIPLIERS = _rng.integers(1, 2**63, size=ROWS_PER_BAND, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+# Combines the hashes of the words of a shingle
+_SHINGLE_BASE = np.uint64(1099511628211)
+
+
+def shingle_hashes(text):
+    """
+    Hash the overlapping SHINGLE_WORDS word shingles of a text.
+
+    Parameters:
+        text (str): The article text.
+
+    Returns:
+        numpy.ndarray or None: uint64 shingle hashes, None if the text has fewer than MIN_WORDS words.
+    """
+    words = WORD.findall(text.lower()) if text else []
+    if len(words) < max(MIN_WORDS, SHINGLE_WORDS):
+        return None
+    word_hashes = np.fromiter((zlib.crc32(word.encode()) for word in words), dtype=np.uint64, count=len(words))
+    count = len(words) - SHINGLE_WORDS + 1
+    hashes = np.zeros(count, dtype=np.uint64)
+    for offset in range(SHINGLE_WORDS):
+        hashes = hashes * _SHINGLE_BASE + word_hashes[offset:offset + count]
+    return np.unique(hashes)
+
+
+def minhash_signature(text):
+    """
+    Compute the MinHash signature of a text.
+
+    The fraction of equal values in two signatures estimates the Jaccard
+    similarity of the texts' word shingles.
+
+    Parameters:
+        text (str): The article text.
+
+    Returns:
+        numpy.ndarray or None: NUM_PERM uint32 values, None for short or empty texts.
+    """
+    hashes = shingle_hashes(text)
+    if hashes is None:
+        return None
+    signature = np.full(NUM_PERM, np.iinfo(np.uint32).max, dtype=np.uint32)
+    for start in range(0, len(hashes), CHUNK_SHINGLES):
+        chunk = hashes[start:start + CHUNK_SHINGLES, None]
+        values = ((chunk * _MULTIPLIERS + _OFFSETS) >> np.uint64(32)).astype(np.uint32)
+        np.minimum(signature, values.min(axis=0), out=signature)
+    return signature
+
+
+def content_signature(text):
+    """
+    Return the signature of an article as stored in the 'content_signature' column.
+
+    Parameters:
+        text (str): The article text.
+
+    Returns:
+        bytes or None: The signature, None for short or empty texts.
+    """
+    signature = minhash_signature(text)
+    return signature.tobytes() if signature is not None else None
+
+
+def signature_from_blob(blob):
+    """Return the signature stored in a 'content_signature' value, or None."""
+    if not blob or len(blob) != NUM_PERM * 4:
+        return None
+    return np.frombuffer(blob, dtype=np.uint32)
+
+
+def band_keys(signatures):
+    """
+    Return the LSH band keys of signatures.
+
+    Parameters:
+        signatures (numpy.ndarray): (n, NUM_PERM) uint32 signatures.
+
+    Returns:
+        numpy.ndarray: (n, LSH_BANDS) uint64 keys.
+    """
+    bands = signatures.reshape(len(signatures), LSH_BANDS, ROWS_PER_BAND).astype(np.uint64)
+    return (bands * _BAND_MULTIPLIERS).sum(axis=2, dtype=np.uint64)
+
+
+class SignatureIndex:
+    def __init__(self, story_ids, blobs):
+        """
+        LSH index over the content signatures of stored stories.
+
+        Parameters:
+            story_ids (list): Story IDs.
+            blobs (list): Their 'content_signature' values, stories without one are left out.
+        """
+        rows = [(story_id, signature_from_blob(blob)) for story_id, blob in zip(story_ids, blobs)]
+        rows = [(story_id, signature) for story_id, signature in rows if signature is not None]
+        self.ids = np.array([story_id for story_id, _ in rows], dtype=np.int64)
+        self.signatures = (
+            np.vstack([signature for _, signature in rows]) if rows else np.empty((0, NUM_PERM), dtype=np.uint32)
+        )
+        self.bands = band_keys(self.signatures)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def find(self, blob, before_id=None, threshold=DUPLICATE_THRESHOLD):
+        """
+        Find the stored stories whose article is a near-duplicate of a signature.
+
+        Candidates share at least one LSH band with it, their similarity is
+        then estimated from the full signatures.
+
+        Parameters:
+            blob (bytes): The 'content_signature' to look up.
+            before_id (int): Only stories with a lower ID, i.e. submitted earlier.
+            threshold (float): Minimum estimated similarity.
+
+        Returns:
+            list of tuples: (story_id, similarity), earliest story first.
+        """
+        signature = signature_from_blob(blob)
+        if signature is None or not len(self.ids):
+            return []
+        candidates = (self.bands == band_keys(signature[None, :])).any(axis=1)
+        if before_id is not None:
+            candidates &= self.ids < before_id
+        indexes = np.flatnonzero(candidates)
+        if not len(indexes):
+            return []
+        similarity = (self.signatures[indexes] == signature).mean(axis=1)
+        matches = indexes[similarity >= threshold]
+        order = np.argsort(self.ids[matches])
+        return [
+            (int(self.ids[index]), float(value))
+            for index, value in zip(matches[order], similarity[similarity >= threshold][order])
+        ]
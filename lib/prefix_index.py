@@ -0,0 +1,101 @@
+# lib/prefix_index.py
+
+import re
+import threading
+import unicodedata
+from bisect import bisect_left
+
+
+def normalize_tokens(text):
+    """
+    Split text into lowercase, accent-free word tokens.
+
+    Parameters:
+        text (str): The text to tokenize.
+
+    Returns:
+        list of str: The normalized tokens.
+    """
+    if not text:
+        return []
+    text = unicodedata.normalize("NFKD", str(text).lower())
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    return re.findall(r"\w+", text)
+
+
+class PrefixIndex:
+    def __init__(self):
+        """
+        Initialize an empty in-memory prefix index over story titles.
+
+        Tokens are kept in a sorted list of (token, story_id) pairs, so all
+        stories with a token starting with a given prefix form one contiguous
+        slice found with two binary searches.
+        """
+        self.entries = []
+        self.stories = {}
+        self.lock = threading.Lock()
+
+    def add_stories(self, rows):
+        """
+        Add story titles to the index. Stories already indexed only get their score updated.
+
+        New lists are built and swapped in, so concurrent searches always see
+        a consistent index without taking the lock.
+
+        Parameters:
+            rows (iterable): (story_id, title, score) tuples.
+        """
+        with self.lock:
+            stories = dict(self.stories)
+            new_entries = []
+            for story_id, title, score in rows:
+                if story_id not in stories:
+                    new_entries.extend(
+                        (token, story_id) for token in set(normalize_tokens(title))
+                    )
+                stories[story_id] = (title, score or 0)
+            entries = self.entries
+            if new_entries:
+                entries = sorted(entries + new_entries)
+            self.entries, self.stories = entries, stories
+
+    def clear(self):
+        """Remove every story from the index."""
+        with self.lock:
+            self.entries, self.stories = [], {}
+
+    def _ids_with_prefix(self, entries, prefix):
+        start = bisect_left(entries, (prefix,))
+        end = bisect_left(entries, (prefix + "\uffff",))
+        return {story_id for _, story_id in entries[start:end]}
+
+    def search(self, query, limit=10):
+        """
+        Find stories whose title contains a token starting with every word of the query.
+
+        Parameters:
+            query (str): The text typed so far.
+            limit (int): Maximum number of completions to return.
+
+        Returns:
+            list of dict: Completions with 'id' and 'title', highest score first.
+        """
+        words = normalize_tokens(query)
+        if not words:
+            return []
+
+        # Read the current lists once, add_stories() swaps in new ones
+        entries, stories = self.entries, self.stories
+        ids = None
+        for word in sorted(words, key=len, reverse=True):
+            matches = self._ids_with_prefix(entries, word)
+            ids = matches if ids is None else ids & matches
+            if not ids:
+                return []
+
+        ranked = sorted(ids, key=lambda story_id: stories[story_id][1], reverse=True)
+        return [
+            {"id": story_id, "title": stories[story_id][0]}
+            for story_id in ranked[:limit]
+        ]
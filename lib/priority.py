@@ -0,0 +1,227 @@
+# lib/priority.py
+
+import os
+import re
+import hashlib
+
+# Rule file used by the fetch agent and the re-scoring command
+DEFAULT_PRIORITY_FILE = "config/priority.txt"
+
+# Weight of a rule without weight=, the priorities given before weights existed
+DEFAULT_WEIGHTS = {"regex": 2, "string": 1}
+
+# Key of the rule file hash in a story database's settings table
+RULES_HASH_KEY = "priority_rules_hash"
+
+RULE_LINE = re.compile(r"^(regex|string)(?:\[([^\]]*)\])?:(.*)$")
+
+
+# Regex metacharacters, a pattern without any is matched as a plain substring
+REGEX_METACHARACTERS = set(".^$*+?{}[]\\|()")
+
+
+def simplify_pattern(pattern):
+    """
+    Drop a leading '^.*' or '.*' and a trailing '.*$' or '.*' from a regex.
+
+    They do not change whether re.search() finds a match in a single-line
+    text, but they make every search scan the text once per start position.
+
+    Parameters:
+        pattern (str): The regular expression.
+
+    Returns:
+        str: The equivalent pattern for single-line text.
+    """
+    for prefix in ("^.*", ".*"):
+        if pattern.startswith(prefix) and pattern[len(prefix):len(prefix) + 1] not in ("?", "+", "*", "{"):
+            pattern = pattern[len(prefix):]
+            break
+    for suffix in (".*$", ".*"):
+        rest = pattern[: -len(suffix)]
+        # A '\.*' suffix is a run of literal dots, keep it
+        if pattern.endswith(suffix) and (len(rest) - len(rest.rstrip("\\"))) % 2 == 0:
+            pattern = rest
+            break
+    return pattern
+
+
+class PriorityRule:
+    def __init__(self, kind, pattern, weight, scopes):
+        """
+        One compiled priority rule.
+
+        Parameters:
+            kind (str): 'regex' (case-sensitive search) or 'string' (case-insensitive substring).
+            pattern (str): The regular expression or string.
+            weight (int): Added to the priority of stories it matches, may be negative.
+            scopes (tuple): Fields it applies to, 'title' and/or 'url'.
+        """
+        self.kind = kind
+        self.pattern = pattern
+        self.weight = weight
+        self.scopes = scopes
+        self.lowered = kind == "string"
+        if kind == "string":
+            self.needle = pattern.lower()
+            self.search = None
+        else:
+            # Compiling the original pattern validates it, and it serves multi-line text
+            self.full_search = re.compile(pattern).search
+            simple = simplify_pattern(pattern)
+            if simple and not REGEX_METACHARACTERS.intersection(simple):
+                self.needle = simple
+                self.search = None
+            else:
+                self.needle = None
+                self.search = re.compile(simple).search
+
+    def matches(self, text, lowered):
+        """
+        Return True if the rule matches a field.
+
+        Parameters:
+            text (str): The field as stored.
+            lowered (str): The field in lower case, for string rules.
+        """
+        if self.lowered:
+            return self.needle in lowered
+        if "\n" in text:
+            return self.full_search(text) is not None
+        if self.needle is not None:
+            return self.needle in text
+        return self.search(text) is not None
+
+
+class PriorityRules:
+    def __init__(self, priority_file=DEFAULT_PRIORITY_FILE):
+        """
+        Weighted priority rules loaded from a file, compiled once.
+
+        The file has one rule per line:
+        - 'regex:<pattern>' matches a regular expression, case-sensitive.
+        - 'string:<text>' matches a substring, case-insensitive.
+        - Options go in brackets after the kind: 'title' or 'url' limit the
+          rule to one field, 'weight=<n>' sets its weight, e.g.
+          'string[title,weight=3]:Rust' or 'regex[url,weight=-2]:medium\\.com'.
+        - Lines starting with '#' and empty lines are ignored.
+
+        Without a weight regex rules weigh 2 and string rules 1, so a file
+        without options gives the priorities it always did, except that a
+        story matching both kinds now gets the sum, 3.
+
+        Parameters:
+            priority_file (str): Path to the rule file.
+        """
+        self.priority_file = priority_file
+        self.rules = []
+        self.hash = hashlib.sha1(b"").hexdigest()
+        self.load_rules(priority_file)
+        self.compile()
+
+    def load_rules(self, priority_file):
+        """Parse the rule file, skipping invalid lines with a message."""
+        if not os.path.exists(priority_file):
+            print(f"Prioritise file '{priority_file}' not found.")
+            return
+
+        with open(priority_file, "rb") as f:
+            data = f.read()
+        self.hash = hashlib.sha1(data).hexdigest()
+
+        for line_number, line in enumerate(data.decode("utf-8").splitlines(), start=1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            match = RULE_LINE.match(line)
+            if not match:
+                print(f"Ignoring invalid line {line_number} in '{priority_file}': {line}")
+                continue
+            kind, options, pattern = match.group(1), match.group(2) or "", match.group(3).strip()
+            weight = DEFAULT_WEIGHTS[kind]
+            scopes = []
+            try:
+                for option in filter(None, (part.strip() for part in options.split(","))):
+                    if option in ("title", "url"):
+                        scopes.append(option)
+                    elif option.startswith("weight="):
+                        weight = int(option.split("=", 1)[1])
+                    else:
+                        raise ValueError(f"unknown option '{option}'")
+                rule = PriorityRule(kind, pattern, weight, tuple(scopes) or ("title", "url"))
+            except (ValueError, re.error) as e:
+                print(f"Invalid rule at line {line_number} in '{priority_file}': {e}")
+                continue
+            if pattern:
+                self.rules.append(rule)
+
+    def compile(self):
+        """Split the rules by the field they apply to, so score() only tries the relevant ones."""
+        self.field_rules = {
+            field: [rule for rule in self.rules if field in rule.scopes] for field in ("title", "url")
+        }
+
+    def score(self, url, title):
+        """
+        Return the priority of a story, the sum of the weights of the rules it matches.
+
+        A rule scoped to both fields counts once, however many fields it matches.
+
+        Parameters:
+            url (str): The URL of the story.
+            title (str): The title of the story.
+
+        Returns:
+            int: The priority, 0 when no rule matches.
+        """
+        matched = set()
+        for field, text in (("title", title), ("url", url)):
+            if not text:
+                continue
+            text = str(text)
+            lowered = text.lower()
+            for rule in self.field_rules[field]:
+                if rule not in matched and rule.matches(text, lowered):
+                    matched.add(rule)
+        return sum(rule.weight for rule in matched)
+
+
+def get_rules_hash(conn):
+    """Return the hash of the rules the stored priorities were computed with, or None."""
+    conn.execute("CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT)")
+    row = conn.execute("SELECT value FROM settings WHERE key = ?", (RULES_HASH_KEY,)).fetchone()
+    return row[0] if row else None
+
+
+def rescore_stories(conn, rules, force=False):
+    """
+    Re-evaluate the priority of every stored story in one pass.
+
+    Nothing is done when the rule file is unchanged since the last
+    re-scoring, unless force is set. Changed priorities are written with one
+    executemany in a single transaction, and the rule hash is stored with them.
+
+    Parameters:
+        conn (sqlite3.Connection): The story database.
+        rules (PriorityRules): The rules to apply.
+        force (bool): Re-score even if the rule file did not change.
+
+    Returns:
+        int or None: Number of stories whose priority changed, None if skipped.
+    """
+    if not force and get_rules_hash(conn) == rules.hash:
+        return None
+
+    rows = conn.execute("SELECT id, url, title, priority FROM stories").fetchall()
+    updates = []
+    for story_id, url, title, priority in rows:
+        new_priority = rules.score(url, title)
+        if new_priority != priority:
+            updates.append((new_priority, story_id))
+
+    with conn:
+        conn.executemany("UPDATE stories SET priority = ? WHERE id = ?", updates)
+        conn.execute(
+            "INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)", (RULES_HASH_KEY, rules.hash)
+        )
+    return len(updates)
@@ -0,0 +1,271 @@
+# lib/rank_history.py
+
+import os
+import zlib
+import struct
+import logging
+import threading
+
+import numpy as np
+
+# Marks a rank history file, the number is the format version
+MAGIC = b"BNRANKS1"
+
+# Per frame header: capture time (epoch seconds), stories, compressed payload bytes
+FRAME_HEADER = struct.Struct("<dII")
+
+# Front page stories whose scores are sampled on every tick. Scores of the
+# other stories are carried over from the last frame they were sampled in.
+SCORE_SAMPLE_RANKS = int(os.environ.get("BN_SCORE_SAMPLE_RANKS", 30))
+
+# Seconds back a story's rank is compared against to find rising stories
+RISING_WINDOW = int(os.environ.get("BN_RISING_WINDOW", 3600))
+
+# Only stories currently ranked this high or better count as rising
+RISING_MAX_RANK = 100
+
+
+def history_path(db_name):
+    """
+    Return the path of the rank history kept next to a daily database.
+
+    Parameters:
+        db_name (str): Path of the live database, e.g. db/hackernews_01_01_2025.db.
+
+    Returns:
+        str: The history path, e.g. db/hackernews_01_01_2025.ranks.
+    """
+    return os.path.splitext(db_name)[0] + ".ranks"
+
+
+def _align(ids, previous_ids, previous_values):
+    """Return the previous values of ids, 0 for IDs not in previous_ids (sorted)."""
+    if not len(previous_ids):
+        return np.zeros(len(ids), dtype=np.int64)
+    positions = np.minimum(np.searchsorted(previous_ids, ids), len(previous_ids) - 1)
+    found = previous_ids[positions] == ids
+    return np.where(found, previous_values[positions], 0)
+
+
+def encode_frame(ids, ranks, scores, previous):
+    """
+    Delta-encode one frame against the previous one.
+
+    IDs are sorted and stored as the first ID and the gaps between them,
+    ranks and scores as the change since the previous frame of the same
+    story (from 0 for stories new to the list). Between two ticks most of
+    those changes are 0 or 1, which zlib compresses to almost nothing.
+
+    Parameters:
+        ids, ranks, scores (numpy.ndarray): The frame, sorted by ID.
+        previous (tuple): (ids, ranks, scores) of the previous frame.
+
+    Returns:
+        bytes: The compressed payload.
+    """
+    previous_ids, previous_ranks, previous_scores = previous
+    rank_deltas = ranks - _align(ids, previous_ids, previous_ranks)
+    score_deltas = scores - _align(ids, previous_ids, previous_scores)
+    payload = b"".join((
+        ids[:1].astype("<i8").tobytes(),
+        np.diff(ids).astype("<u4").tobytes(),
+        rank_deltas.astype("<i2").tobytes(),
+        score_deltas.astype("<i4").tobytes(),
+    ))
+    return zlib.compress(payload, 6)
+
+
+def decode_frame(payload, count, previous):
+    """
+    Decode a frame written by 'encode_frame'.
+
+    Returns:
+        tuple: (ids, ranks, scores) int64 arrays sorted by ID.
+    """
+    data = zlib.decompress(payload)
+    previous_ids, previous_ranks, previous_scores = previous
+    if not count:
+        return (np.zeros(0, dtype=np.int64),) * 3
+    offset = 8 + 4 * (count - 1)
+    ids = np.empty(count, dtype=np.int64)
+    ids[0] = np.frombuffer(data, dtype="<i8", count=1)[0]
+    ids[1:] = np.frombuffer(data, dtype="<u4", count=count - 1, offset=8)
+    ids = np.cumsum(ids)
+    rank_deltas = np.frombuffer(data, dtype="<i2", count=count, offset=offset)
+    score_deltas = np.frombuffer(data, dtype="<i4", count=count, offset=offset + 2 * count)
+    ranks = _align(ids, previous_ids, previous_ranks) + rank_deltas
+    scores = _align(ids, previous_ids, previous_scores) + score_deltas
+    return ids, ranks, scores
+
+
+EMPTY_FRAME = (np.zeros(0, dtype=np.int64),) * 3
+
+
+class RankHistory:
+    def __init__(self, path):
+        """
+        Front page rank and score history of one day, in an append-only file.
+
+        Every tick appends one frame with the (id, rank, score) of each story
+        on the top stories list, delta-encoded against the previous frame.
+        Frames are decoded into memory once and then incrementally as the
+        file grows, so queries are NumPy operations over the decoded frames.
+        A partly written last frame is left for the next load, and cut off
+        by the next append. Frames from a corrupt one on are not read. Safe
+        to share between threads.
+
+        Parameters:
+            path (str): The history file, see 'history_path'.
+        """
+        self.path = path
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.offset = 0
+        self.file_key = None
+        # File size when a corrupt frame was found, it is not read again until the file changes
+        self.corrupt_size = None
+        self.times = []
+        # (ids, ranks, scores) per frame, ids sorted
+        self.frames = []
+
+    def load(self):
+        """Decode the frames appended since the last load."""
+        with self.lock:
+            try:
+                stat = os.stat(self.path)
+            except OSError:
+                self.reset()
+                return
+            if self.file_key != (stat.st_ino, stat.st_dev) or stat.st_size < self.offset:
+                self.reset()
+                self.file_key = (stat.st_ino, stat.st_dev)
+            if stat.st_size in (self.offset, self.corrupt_size):
+                return
+            with open(self.path, "rb") as f:
+                if not self.offset:
+                    if f.read(len(MAGIC)) != MAGIC:
+                        print(f"Unrecognized rank history file {self.path}")
+                        logging.error(f"Unrecognized rank history file {self.path}")
+                        return
+                    self.offset = len(MAGIC)
+                f.seek(self.offset)
+                data = f.read()
+            position = 0
+            previous = self.frames[-1] if self.frames else EMPTY_FRAME
+            while position + FRAME_HEADER.size <= len(data):
+                timestamp, count, length = FRAME_HEADER.unpack_from(data, position)
+                end = position + FRAME_HEADER.size + length
+                if end > len(data):
+                    break
+                try:
+                    previous = decode_frame(data[position + FRAME_HEADER.size:end], count, previous)
+                except (zlib.error, ValueError) as e:
+                    self.corrupt_size = stat.st_size
+                    print(f"Corrupt frame at byte {self.offset + position} of {self.path}: {e}")
+                    logging.error(f"Corrupt frame at byte {self.offset + position} of {self.path}: {e}")
+                    break
+                self.times.append(timestamp)
+                self.frames.append(previous)
+                position = end
+            self.offset += position
+
+    def append(self, timestamp, story_ids, scores=None, default_scores=None):
+        """
+        Append the top stories list of one tick.
+
+        Parameters:
+            timestamp (float): Capture time, epoch seconds.
+            story_ids (list): The top story IDs, in rank order.
+            scores (dict): Scores sampled on this tick, by story ID.
+            default_scores (dict): Scores for stories that were neither sampled
+                now nor in the previous frame, e.g. the ones stored at ingest.
+        """
+        self.load()
+        previous = self.frames[-1] if self.frames else EMPTY_FRAME
+        ids = np.array(story_ids, dtype=np.int64)
+        ranks = np.arange(1, len(ids) + 1, dtype=np.int64)
+        # A story listed twice keeps its best rank
+        ids, first = np.unique(ids, return_index=True)
+        ranks = ranks[first]
+
+        listed = np.isin(ids, previous[0])
+        carried = _align(ids, previous[0], previous[2])
+        scores, default_scores = scores or {}, default_scores or {}
+        frame_scores = np.array([
+            scores.get(story_id, carried[n] if listed[n] else default_scores.get(story_id, 0) or 0)
+            for n, story_id in enumerate(ids.tolist())
+        ], dtype=np.int64)
+
+        payload = encode_frame(ids, ranks, frame_scores, previous)
+        record = FRAME_HEADER.pack(timestamp, len(ids), len(payload)) + payload
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with open(self.path, "ab") as f:
+            if f.tell() == 0:
+                f.write(MAGIC)
+            elif self.offset and f.tell() > self.offset:
+                # Cut off a frame an interrupted append left partly written,
+                # the new frame would otherwise be read as the rest of it
+                f.truncate(self.offset)
+            f.write(record)
+
+    def trajectory(self, story_id):
+        """
+        Return a story's ranks and scores over the day.
+
+        Parameters:
+            story_id (int): The story.
+
+        Returns:
+            list of tuples: (timestamp, rank, score) of every frame listing the story, oldest first.
+        """
+        self.load()
+        points = []
+        for timestamp, (ids, ranks, scores) in zip(self.times, self.frames):
+            position = np.searchsorted(ids, story_id)
+            if position < len(ids) and ids[position] == story_id:
+                points.append((timestamp, int(ranks[position]), int(scores[position])))
+        return points
+
+    def rising(self, window=RISING_WINDOW, limit=30):
+        """
+        Return the stories that climbed the most over the last window seconds.
+
+        The latest frame is compared with the last frame at least window
+        seconds older, or the first frame of the day. Stories that were not
+        listed then count as one past the bottom of that list.
+
+        Parameters:
+            window (int): Seconds to look back.
+            limit (int): Maximum number of stories.
+
+        Returns:
+            list of dicts: id, rank, previous_rank, gain and score_gain, biggest gain first.
+        """
+        self.load()
+        if len(self.frames) < 2:
+            return []
+        latest = len(self.times) - 1
+        then = int(np.searchsorted(self.times, self.times[latest] - window, side="right")) - 1
+        then = min(max(then, 0), latest - 1)
+
+        ids, ranks, scores = self.frames[latest]
+        previous_ids, previous_ranks, previous_scores = self.frames[then]
+        before = _align(ids, previous_ids, previous_ranks)
+        before = np.where(before > 0, before, len(previous_ids) + 1)
+        gains = before - ranks
+        score_gains = scores - _align(ids, previous_ids, previous_scores)
+
+        candidates = np.flatnonzero((gains > 0) & (ranks <= RISING_MAX_RANK))
+        order = candidates[np.lexsort((ranks[candidates], -gains[candidates]))][:limit]
+        return [
+            {
+                "id": int(ids[n]),
+                "rank": int(ranks[n]),
+                "previous_rank": int(before[n]),
+                "gain": int(gains[n]),
+                "score_gain": int(score_gains[n]),
+            }
+            for n in order
+        ]
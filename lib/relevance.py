@@ -0,0 +1,317 @@
+# lib/relevance.py
+
+import os
+import re
+import math
+import sqlite3
+import zlib
+from datetime import datetime
+
+import numpy as np
+
+# Hashed term buckets per vector. A stored vector takes 4 bytes per bucket,
+# and ranking costs one multiply-add per bucket and story.
+DIMENSIONS = 256
+
+# Title terms count this many times as much as summary terms
+TITLE_WEIGHT = 2
+
+# Interactions are kept across the daily databases, like the runs ledger
+PROFILE_DB = os.environ.get(
+    "BN_PROFILE_DB",
+    os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'db', 'profile.db')),
+)
+
+# Weight of each kind of interaction in the profile
+INTERACTION_WEIGHTS = {"click": 1.0, "star": 3.0}
+
+# Most recent interactions making up the profile
+PROFILE_SIZE = 500
+
+WORD = re.compile(r"\w{2,}")
+
+
+def _bucket(term):
+    """Return the bucket and sign of a term, the sign keeps collisions from only adding up."""
+    value = zlib.crc32(term.encode())
+    return value % DIMENSIONS, 1.0 if value & 0x80000000 else -1.0
+
+
+def term_vector(title, summary=None):
+    """
+    Return the hashed, sublinear term frequency vector of a story.
+
+    IDF weighting is applied when the relevance matrix is built, the stored
+    vectors stay valid as the document frequencies change.
+
+    Parameters:
+        title (str): The title of the story.
+        summary (str): Its summary, if it has one.
+
+    Returns:
+        numpy.ndarray: DIMENSIONS float32 values.
+    """
+    counts = {}
+    for text, weight in ((title, TITLE_WEIGHT), (summary, 1)):
+        for term in WORD.findall(text.lower()) if text else ():
+            counts[term] = counts.get(term, 0) + weight
+    vector = np.zeros(DIMENSIONS, dtype=np.float32)
+    for term, count in counts.items():
+        bucket, sign = _bucket(term)
+        vector[bucket] += sign * (1.0 + math.log(count))
+    return vector
+
+
+def relevance_vector(title, summary=None):
+    """
+    Return a story's term vector as stored in the 'relevance_vector' column.
+
+    Parameters:
+        title (str): The title of the story.
+        summary (str): Its summary, if it has one.
+
+    Returns:
+        bytes: The vector, DIMENSIONS * 4 bytes.
+    """
+    return term_vector(title, summary).tobytes()
+
+
+def vector_from_blob(blob):
+    """Return the vector stored in a 'relevance_vector' value, or None."""
+    if not blob or len(blob) != DIMENSIONS * 4:
+        return None
+    return np.frombuffer(blob, dtype=np.float32)
+
+
+def matrix_paths(snapshot):
+    """
+    Return the paths of the relevance matrix published next to a snapshot.
+
+    Parameters:
+        snapshot (str): Path of the snapshot database.
+
+    Returns:
+        tuple: (matrix .npy, memory-mapped by the web app; .npz with the story IDs and IDF weights).
+    """
+    base = os.path.splitext(snapshot)[0]
+    return f"{base}.relevance.npy", f"{base}.relevance.npz"
+
+
+def build_matrix(conn):
+    """
+    Build the TF-IDF matrix of the stories in a database.
+
+    Parameters:
+        conn (sqlite3.Connection): The stories database.
+
+    Returns:
+        tuple: (story IDs int64, (stories x DIMENSIONS) float32 matrix of L2-normalized
+        TF-IDF rows, DIMENSIONS float32 IDF weights).
+    """
+    rows = conn.execute(
+        "SELECT id, relevance_vector FROM stories WHERE length(relevance_vector) = ? ORDER BY id",
+        (DIMENSIONS * 4,),
+    ).fetchall()
+    ids = np.array([row[0] for row in rows], dtype=np.int64)
+    matrix = np.frombuffer(b"".join(row[1] for row in rows), dtype=np.float32).reshape(len(rows), DIMENSIONS)
+
+    document_frequency = np.count_nonzero(matrix, axis=0)
+    idf = (np.log((1 + len(rows)) / (1 + document_frequency)) + 1).astype(np.float32)
+    matrix = matrix * idf
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    matrix /= np.where(norms > 0, norms, 1)
+    return ids, matrix, idf
+
+
+def publish_matrix(conn, snapshot):
+    """
+    Write the relevance matrix of a database next to its snapshot.
+
+    Files are written under temporary names and renamed into place, a web
+    worker reading the previous matrix keeps its mapping of the old file.
+
+    Parameters:
+        conn (sqlite3.Connection): The database the snapshot is made of.
+        snapshot (str): Path of the snapshot.
+    """
+    columns = [column[1] for column in conn.execute("PRAGMA table_info(stories)")]
+    if "relevance_vector" not in columns:
+        return
+    ids, matrix, idf = build_matrix(conn)
+    matrix_path, index_path = matrix_paths(snapshot)
+    tmp_suffix = f".{os.getpid()}.tmp"
+    # Written through file objects, np.save would append .npy to the temporary names
+    with open(matrix_path + tmp_suffix, "wb") as f:
+        np.save(f, matrix)
+    with open(index_path + tmp_suffix, "wb") as f:
+        np.savez(f, ids=ids, idf=idf)
+    os.replace(index_path + tmp_suffix, index_path)
+    os.replace(matrix_path + tmp_suffix, matrix_path)
+
+
+def connect_profile_db(db_path=PROFILE_DB):
+    """
+    Connect to the interaction store, creating the 'interactions' table if needed.
+
+    Each interaction keeps the story's term vector, so the profile outlives
+    the daily database the story was read from.
+
+    Returns:
+        sqlite3.Connection: The connection.
+    """
+    os.makedirs(os.path.dirname(db_path), exist_ok=True)
+    conn = sqlite3.connect(db_path, timeout=5)
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS interactions (
+            id INTEGER PRIMARY KEY,
+            story_id INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            created_at TIMESTAMP NOT NULL,
+            vector BLOB
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_interactions_story ON interactions (story_id, kind)")
+    return conn
+
+
+def record_interaction(story_id, kind, vector, db_path=PROFILE_DB):
+    """
+    Record that a story was clicked or starred.
+
+    Parameters:
+        story_id (int): The story.
+        kind (str): 'click' or 'star'.
+        vector (bytes): The story's 'relevance_vector'.
+        db_path (str): The interaction store.
+    """
+    conn = connect_profile_db(db_path)
+    with conn:
+        conn.execute(
+            "INSERT INTO interactions (story_id, kind, created_at, vector) VALUES (?, ?, ?, ?)",
+            (story_id, kind, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), vector),
+        )
+    conn.close()
+
+
+def remove_interaction(story_id, kind, db_path=PROFILE_DB):
+    """Forget the interactions of one kind with a story, e.g. to unstar it."""
+    conn = connect_profile_db(db_path)
+    with conn:
+        conn.execute("DELETE FROM interactions WHERE story_id = ? AND kind = ?", (story_id, kind))
+    conn.close()
+
+
+def starred_story_ids(db_path=PROFILE_DB):
+    """Return the IDs of the starred stories."""
+    if not os.path.exists(db_path):
+        return set()
+    conn = connect_profile_db(db_path)
+    ids = {row[0] for row in conn.execute("SELECT story_id FROM interactions WHERE kind = 'star'")}
+    conn.close()
+    return ids
+
+
+def profile_term_vector(db_path=PROFILE_DB):
+    """
+    Return the weighted sum of the L2-normalized term vectors of the latest interactions.
+
+    Returns:
+        numpy.ndarray or None: DIMENSIONS float32 values, None without interactions.
+    """
+    if not os.path.exists(db_path):
+        return None
+    conn = connect_profile_db(db_path)
+    rows = conn.execute(
+        "SELECT kind, vector FROM interactions ORDER BY id DESC LIMIT ?", (PROFILE_SIZE,)
+    ).fetchall()
+    conn.close()
+    profile = np.zeros(DIMENSIONS, dtype=np.float32)
+    for kind, blob in rows:
+        vector = vector_from_blob(blob)
+        if vector is None:
+            continue
+        norm = np.linalg.norm(vector)
+        if norm > 0:
+            profile += INTERACTION_WEIGHTS.get(kind, 1.0) * vector / norm
+    return profile if profile.any() else None
+
+
+class RelevanceRanker:
+    def __init__(self, profile_db=PROFILE_DB):
+        """
+        Ranks the stories of a published relevance matrix against the reader's profile.
+
+        The matrix is memory-mapped once per published file and the profile is
+        rebuilt only when the interaction store changed, so ranking is one
+        matrix-vector product.
+
+        Parameters:
+            profile_db (str): The interaction store.
+        """
+        self.profile_db = profile_db
+        self.matrix_key = None
+        self.profile_key = None
+        # (ids, matrix, idf), replaced as a whole so concurrent requests never mix two publishes
+        self.published = None
+        self.profile = None
+
+    def load_matrix(self, snapshot):
+        """Map the matrix published next to snapshot, if it is not mapped yet. Returns False if there is none."""
+        matrix_path, index_path = matrix_paths(snapshot)
+        try:
+            stat = os.stat(matrix_path)
+        except OSError:
+            return False
+        key = (matrix_path, stat.st_ino, stat.st_mtime_ns)
+        if key != self.matrix_key:
+            with np.load(index_path) as index:
+                ids, idf = index["ids"], index["idf"]
+            matrix = np.load(matrix_path, mmap_mode="r")
+            # A matrix and index from two different publishes are never paired
+            if matrix.shape[0] != len(ids):
+                return False
+            self.published = (ids, matrix, idf)
+            self.matrix_key = key
+        return True
+
+    def load_profile(self):
+        """Rebuild the profile term vector if the interaction store changed."""
+        key = []
+        for path in (self.profile_db, self.profile_db + "-wal"):
+            try:
+                stat = os.stat(path)
+                key.append((stat.st_size, stat.st_mtime_ns))
+            except OSError:
+                key.append(None)
+        if key != self.profile_key:
+            self.profile = profile_term_vector(self.profile_db)
+            self.profile_key = key
+        return self.profile
+
+    def rank(self, snapshot, limit):
+        """
+        Return the stories most relevant to the profile.
+
+        Parameters:
+            snapshot (str): Path of the snapshot the matrix was published with.
+            limit (int): Maximum number of stories.
+
+        Returns:
+            list of tuples or None: (story_id, score), most relevant first. None
+            without a matrix or a profile.
+        """
+        profile = self.load_profile()
+        if profile is None or not self.load_matrix(snapshot):
+            return None
+        ids, matrix, idf = self.published
+        query = profile * idf
+        norm = np.linalg.norm(query)
+        if norm == 0 or not len(ids):
+            return []
+        scores = matrix @ (query / norm)
+        limit = min(limit, len(scores))
+        top = np.argpartition(-scores, limit - 1)[:limit]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(int(ids[index]), float(scores[index])) for index in top]
@@ -0,0 +1,148 @@
+# lib/run_ledger.py
+
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from datetime import datetime
+from contextlib import contextmanager
+
+# The ledger outlives the daily story databases, so trends span days
+RUNS_DB = os.environ.get(
+    "BN_RUNS_DB",
+    os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'db', 'runs.db')),
+)
+
+# Counts with a column of their own, any other count goes to 'counts'
+COUNT_COLUMNS = ("fetched", "skipped", "blacklisted", "failed")
+
+
+def connect_runs_db(db_path=RUNS_DB):
+    """
+    Connect to the run ledger, creating the 'runs' table if needed.
+
+    'stages' holds a JSON object mapping each stage to its calls, total
+    seconds and p95 seconds. Totals add up the time of all worker threads,
+    so they can exceed the run's duration.
+
+    Returns:
+        sqlite3.Connection: The connection.
+    """
+    os.makedirs(os.path.dirname(db_path), exist_ok=True)
+    conn = sqlite3.connect(db_path, timeout=30)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS runs (
+            id INTEGER PRIMARY KEY,
+            agent TEXT NOT NULL,
+            started_at TIMESTAMP NOT NULL,
+            finished_at TIMESTAMP,
+            duration REAL,
+            status TEXT,
+            fetched INTEGER DEFAULT 0,
+            skipped INTEGER DEFAULT 0,
+            blacklisted INTEGER DEFAULT 0,
+            failed INTEGER DEFAULT 0,
+            counts TEXT,
+            stages TEXT,
+            database TEXT
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_runs_agent ON runs (agent, started_at)")
+    return conn
+
+
+class RunLedger:
+    def __init__(self, agent):
+        """
+        Collects the counts and stage timings of one agent run.
+
+        Worker threads add to it concurrently, finish() stores it as a row of
+        the 'runs' table. start() resets it for the next run.
+
+        Parameters:
+            agent (str): Agent name stored with the run, e.g. 'fetch'.
+        """
+        self.agent = agent
+        self.lock = threading.Lock()
+        self.start()
+
+    def start(self):
+        """Begin a new run."""
+        with self.lock:
+            self.started_at = datetime.now()
+            self.started = time.perf_counter()
+            self.counts = {}
+            self.samples = {}
+            self.database = None
+
+    def count(self, name, amount=1):
+        """Add to a count, e.g. 'fetched' or 'blacklisted'."""
+        with self.lock:
+            self.counts[name] = self.counts.get(name, 0) + amount
+
+    def add_time(self, stage, seconds):
+        """Record one call of a stage."""
+        with self.lock:
+            self.samples.setdefault(stage, []).append(seconds)
+
+    @contextmanager
+    def stage(self, name):
+        """Time a block as one call of a stage."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - started)
+
+    def stage_summary(self):
+        """Return {stage: {'calls', 'total', 'p95'}} with times in seconds."""
+        with self.lock:
+            samples = {stage: sorted(values) for stage, values in self.samples.items()}
+        return {
+            stage: {
+                "calls": len(values),
+                "total": round(sum(values), 6),
+                "p95": round(values[min(len(values) - 1, int(len(values) * 0.95))], 6),
+            }
+            for stage, values in samples.items()
+        }
+
+    def finish(self, status="ok", db_path=RUNS_DB):
+        """
+        Store the run in the ledger. Errors are logged, they never fail the agent.
+
+        Parameters:
+            status (str): 'ok', or what stopped the run, e.g. 'no_stories' or 'error'.
+            db_path (str): The ledger database.
+        """
+        duration = time.perf_counter() - self.started
+        with self.lock:
+            counts = dict(self.counts)
+        columns = [counts.pop(name, 0) for name in COUNT_COLUMNS]
+        try:
+            conn = connect_runs_db(db_path)
+            with conn:
+                conn.execute(
+                    """
+                    INSERT INTO runs (agent, started_at, finished_at, duration, status,
+                        fetched, skipped, blacklisted, failed, counts, stages, database)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                    (
+                        self.agent,
+                        self.started_at.strftime("%Y-%m-%d %H:%M:%S"),
+                        datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                        round(duration, 3),
+                        status,
+                        *columns,
+                        json.dumps(counts),
+                        json.dumps(self.stage_summary()),
+                        self.database,
+                    ),
+                )
+            conn.close()
+        except sqlite3.Error as e:
+            print(f"Error recording run in {db_path}: {e}")
+            logging.error(f"Error recording run in {db_path}: {e}")
@@ -0,0 +1,82 @@
+# lib/snapshot.py
+
+import os
+import sqlite3
+
+from lib.relevance import publish_matrix
+
+# Covering indexes for the web app's listing queries. They only exist in
+# snapshots, the live database is tuned for the agents' writes.
+SNAPSHOT_INDEXES = [
+    """
+    CREATE INDEX IF NOT EXISTS idx_snapshot_top
+    ON stories (priority DESC, score DESC, id DESC, title, by, url, domain, last_updated, has_content)
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS idx_snapshot_latest
+    ON stories (last_updated DESC, id DESC, title, by, url, domain, priority, score, has_content)
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS idx_snapshot_domain
+    ON stories (domain, priority DESC, score DESC, id, title, by, url, last_updated, has_content)
+    """,
+]
+
+
+def snapshot_path(db_name):
+    """
+    Return the path of the read snapshot of a database.
+
+    Parameters:
+        db_name (str): Path of the live database, e.g. db/hackernews_01_01_2025.db.
+
+    Returns:
+        str: The snapshot path, e.g. db/snapshots/hackernews_01_01_2025.db.
+    """
+    return os.path.join(os.path.dirname(db_name), "snapshots", os.path.basename(db_name))
+
+
+def publish_snapshot(db_name):
+    """
+    Publish a read-optimized copy of the live database for the web app.
+
+    The database is copied with the online backup API, so the agents are
+    not blocked. The copy gets the covering listing indexes, is VACUUMed and
+    ANALYZEd, and then atomically replaces the previous snapshot. Readers
+    that have the old snapshot open keep reading it until they close it.
+    The relevance matrix (see lib.relevance) is published next to it first.
+
+    Parameters:
+        db_name (str): Path of the live database.
+
+    Returns:
+        str: Path of the published snapshot.
+    """
+    snapshot = snapshot_path(db_name)
+    os.makedirs(os.path.dirname(snapshot), exist_ok=True)
+    tmp_snapshot = f"{snapshot}.{os.getpid()}.tmp"
+
+    source = sqlite3.connect(db_name)
+    target = sqlite3.connect(tmp_snapshot)
+    try:
+        try:
+            source.backup(target)
+        finally:
+            source.close()
+
+        for statement in SNAPSHOT_INDEXES:
+            target.execute(statement)
+        target.commit()
+        # Snapshots are opened immutable, they must not depend on a WAL file
+        target.execute("PRAGMA journal_mode = DELETE")
+        target.execute("VACUUM")
+        target.execute("ANALYZE")
+        publish_matrix(target, snapshot)
+        target.close()
+        os.replace(tmp_snapshot, snapshot)
+    except Exception:
+        target.close()
+        if os.path.exists(tmp_snapshot):
+            os.remove(tmp_snapshot)
+        raise
+    return snapshot
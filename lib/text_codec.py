@@ -0,0 +1,157 @@
+# lib/text_codec.py
+
+import os
+import zlib
+import sqlite3
+from functools import lru_cache
+
+# zstandard is optional, without it text is compressed with zlib
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Codec for newly stored article text: 'zstd', 'zlib' or 'none'
+CONTENT_CODEC = os.environ.get("BN_CONTENT_CODEC", "zstd" if zstandard else "zlib")
+
+# Summaries are short and read on every story page, they stay uncompressed
+# unless this is set
+COMPRESS_SUMMARY = os.environ.get("BN_COMPRESS_SUMMARY", "") == "1"
+
+# Texts shorter than this many bytes are stored as plain text
+MIN_COMPRESS_SIZE = 256
+
+# Trained zstd dictionaries. current.zdict is used for new rows, every
+# dictionary is also kept as <dict_id>.zdict to decompress older rows.
+DICTIONARY_DIR = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '..', 'config', 'zdict')
+)
+CURRENT_DICTIONARY = os.path.join(DICTIONARY_DIR, "current.zdict")
+
+# Compressed values are BLOBs starting with one of these markers, plain
+# values stay TEXT, so old rows and short texts need no conversion
+ZLIB_MARKER = b"\x00z"
+ZSTD_MARKER = b"\x00s"
+
+
+@lru_cache(maxsize=None)
+def load_dictionary(dict_id):
+    """Load the zstd dictionary with the given ID from DICTIONARY_DIR."""
+    with open(os.path.join(DICTIONARY_DIR, f"{dict_id}.zdict"), "rb") as f:
+        return zstandard.ZstdCompressionDict(f.read())
+
+
+@lru_cache(maxsize=1)
+def current_dictionary():
+    """Return the zstd dictionary used for new rows, or None if none was trained."""
+    if not zstandard or not os.path.exists(CURRENT_DICTIONARY):
+        return None
+    with open(CURRENT_DICTIONARY, "rb") as f:
+        return zstandard.ZstdCompressionDict(f.read())
+
+
+def compress_text(text, codec=None):
+    """
+    Compress text for storage.
+
+    Parameters:
+        text (str): The text to compress.
+        codec (str): 'zstd', 'zlib' or 'none', defaults to CONTENT_CODEC.
+
+    Returns:
+        bytes or str: A marked compressed BLOB, or the text itself when it is
+        empty, short or compression is off.
+    """
+    codec = codec or CONTENT_CODEC
+    if not isinstance(text, str) or codec == "none":
+        return text
+    data = text.encode("utf-8")
+    if len(data) < MIN_COMPRESS_SIZE:
+        return text
+
+    if codec == "zstd" and zstandard:
+        dictionary = current_dictionary()
+        if dictionary is not None:
+            compressor = zstandard.ZstdCompressor(level=6, dict_data=dictionary)
+        else:
+            compressor = zstandard.ZstdCompressor(level=6)
+        return ZSTD_MARKER + compressor.compress(data)
+    return ZLIB_MARKER + zlib.compress(data, 6)
+
+
+def decompress_text(value):
+    """
+    Return the text of a stored value, decompressing it if needed.
+
+    Parameters:
+        value (str, bytes or None): The stored value.
+
+    Returns:
+        str or None: The text.
+    """
+    if not isinstance(value, bytes):
+        return value
+    marker, data = value[:2], value[2:]
+    if marker == ZLIB_MARKER:
+        return zlib.decompress(data).decode("utf-8")
+    if marker == ZSTD_MARKER:
+        if zstandard is None:
+            raise RuntimeError("zstandard is required to read zstd compressed text")
+        dict_id = zstandard.get_frame_parameters(data).dict_id
+        if dict_id:
+            decompressor = zstandard.ZstdDecompressor(dict_data=load_dictionary(dict_id))
+        else:
+            decompressor = zstandard.ZstdDecompressor()
+        return decompressor.decompress(data).decode("utf-8")
+    return value.decode("utf-8")
+
+
+def register_functions(conn):
+    """
+    Make decompress_text() available to SQL on a connection.
+
+    The full-text index reads article text through the stories_text view,
+    which calls it, so every connection that searches or writes stories
+    needs it.
+
+    Parameters:
+        conn (sqlite3.Connection): The connection.
+    """
+    conn.create_function("decompress_text", 1, decompress_text, deterministic=True)
+
+
+def check_functions(conn):
+    """
+    Raise a RuntimeError if decompress_text() is not available to SQL on a connection.
+
+    The full-text index triggers call it, so without it any write to a
+    story's title, content or summary fails with 'no such function'.
+    Writers check up front instead of failing halfway through a run.
+
+    Parameters:
+        conn (sqlite3.Connection): The connection.
+    """
+    try:
+        conn.execute("SELECT decompress_text(NULL)")
+    except sqlite3.OperationalError as e:
+        raise RuntimeError(
+            "The stories search index decompresses text in SQL, open the database with "
+            "lib.text_codec.connect() or call register_functions() on the connection"
+        ) from e
+
+
+def connect(db_name, **kwargs):
+    """
+    Open a stories database with the text_codec SQL functions registered.
+
+    Parameters:
+        db_name (str): Path of the database.
+        **kwargs: Passed on to sqlite3.connect().
+
+    Returns:
+        sqlite3.Connection: The connection.
+    """
+    conn = sqlite3.connect(db_name, **kwargs)
+    register_functions(conn)
+    check_functions(conn)
+    return conn